@@ -1,99 +1,203 @@
 # analysis_utils.py
 
+import sys
 import logging
 import threading
-from typing import Optional, Dict, List
-from collections import Counter
+import tracemalloc
+from array import array
+from typing import Optional, Dict, List, Iterator, Sequence
+
+from config import HISTORY_CHUNK_ROWS
+from market_utils import market_key
 
 logger = logging.getLogger(__name__)
 
+# Colunas usadas pelo histórico, na ordem em que chegam em cada chunk
+HISTORY_COLUMNS = ["raw_time_casa", "raw_time_fora", "time_casa", "time_fora", "mercado_raw", "market_summary"]
+
+def iter_history_chunks(source, columns: Sequence[str] = HISTORY_COLUMNS,
+                        chunk_size: int = HISTORY_CHUNK_ROWS) -> Iterator[List[Sequence[str]]]:
+    """
+    Lê apenas as colunas pedidas da fonte, em blocos de chunk_size linhas (cabeçalho excluído).
+    - BetStore / ArchiveReader: iter_column_chunks
+    - gspread Worksheet: leituras de range (ex.: G2:L5001, G5002:L10001, ...)
+    - outras fontes: get_all_values() (carga única)
+    """
+    if hasattr(source, "iter_column_chunks"):
+        yield from source.iter_column_chunks(columns, chunk_size)
+        return
+    if hasattr(source, "get") and hasattr(source, "row_values"):
+        from sheets_utils import index_to_col
+        header = source.row_values(1)
+        if not header or any(c not in header for c in columns):
+            logger.warning("HistoricalAnalyzer: cabeçalho inesperado ou colunas ausentes.")
+            return
+        pos = [header.index(c) for c in columns]
+        c1, c2 = min(pos), max(pos)
+        rel = [p - c1 for p in pos]
+        width = c2 - c1 + 1
+        start = 2
+        row_count = getattr(source, "row_count", None)
+        while row_count is None or start <= row_count:
+            end = start + chunk_size - 1
+            values = source.get(f"{index_to_col(c1 + 1)}{start}:{index_to_col(c2 + 1)}{end}")
+            if not values:
+                return
+            chunk = []
+            for r in values:
+                r = list(r) + [""] * (width - len(r))
+                chunk.append([r[i] for i in rel])
+            yield chunk
+            start = end + 1
+        return
+    all_values = source.get_all_values()
+    if not all_values:
+        return
+    header = all_values[0]
+    if any(c not in header for c in columns):
+        logger.warning("HistoricalAnalyzer: cabeçalho inesperado ou colunas ausentes. Não carregará histórico.")
+        return
+    pos = [header.index(c) for c in columns]
+    for i in range(1, len(all_values), chunk_size):
+        yield [[(r[p] if p < len(r) else "") for p in pos] for r in all_values[i:i + chunk_size]]
+
 class HistoricalAnalyzer:
     """
     Mantém mapeamentos de nomes canônicos e resumos de mercado a partir das entradas já existentes na planilha,
     e também mapeamento de adversários para sugerir oponente em casos como “Time ou Empate”.
+
+    Armazenamento compacto: cada string distinta é internada uma única vez e referenciada
+    por id inteiro; adversários ficam em arrays (ids, contagens) por time em vez de Counter.
     """
 
-    def __init__(self, sheet):
+    def __init__(self, sheet, archive=None, chunk_size: int = HISTORY_CHUNK_ROWS, track_memory: bool = False):
         """
-        sheet: objeto gspread Worksheet já inicializado, com cabeçalho conforme HEADER em sheets_utils.
+        sheet: fonte do histórico com cabeçalho conforme HEADER em sheets_utils
+               (gspread Worksheet, BetStore ou qualquer objeto com get_all_values()).
+        archive: fonte opcional com o histórico arquivado (ex.: sheet_rotation.ArchiveReader),
+                 carregada antes de sheet.
+        track_memory: mede pico/estado estável de memória da carga (tracemalloc) em memory_stats.
         """
         self.sheet = sheet
-        self._canonical_map: Dict[str, str] = {}     # raw_name -> canonical
-        self._summary_map: Dict[str, str] = {}       # raw_market -> summary
-        self._opponents_map: Dict[str, Counter] = {} # canonical_team -> Counter(opponent_name)
+        self.archive = archive
+        self.chunk_size = chunk_size
+        self.track_memory = track_memory
+        self.memory_stats: Dict[str, int] = {}
         self._lock = threading.Lock()
+        self._reset()
         self._load_existing()
 
+    def _reset(self) -> None:
+        self._strings: List[str] = []                # id -> string
+        self._ids: Dict[str, int] = {}               # string -> id
+        self._canonical_map: Dict[int, int] = {}     # raw_name id -> canonical id
+        self._summary_map: Dict[int, int] = {}       # raw_market id -> summary id
+        self._summary_norm: Dict[int, int] = {}      # market_key id -> summary id (variantes de OCR)
+        self._opp_ids: Dict[int, array] = {}         # canonical id -> array de ids de adversários
+        self._opp_counts: Dict[int, array] = {}      # canonical id -> array de contagens
+
+    # ─── Internação de strings ──────────────────────────────
+    def _intern(self, s: str) -> int:
+        i = self._ids.get(s)
+        if i is None:
+            i = len(self._strings)
+            s = sys.intern(s)
+            self._strings.append(s)
+            self._ids[s] = i
+        return i
+
+    def _add_opponent(self, team: int, opp: int) -> None:
+        ids = self._opp_ids.get(team)
+        if ids is None:
+            self._opp_ids[team] = array('I', [opp])
+            self._opp_counts[team] = array('I', [1])
+            return
+        try:
+            k = ids.index(opp)
+            self._opp_counts[team][k] += 1
+        except ValueError:
+            ids.append(opp)
+            self._opp_counts[team].append(1)
+
+    def _add_summary(self, raw_market: str, summary: str) -> None:
+        k = self._intern(raw_market)
+        if k in self._summary_map:
+            return
+        s = self._intern(summary)
+        self._summary_map[k] = s
+        self._summary_norm.setdefault(self._intern(market_key(raw_market)), s)
+
+    # ─── Carga ──────────────────────────────────────────────
     def _load_existing(self) -> None:
         """
-        Carrega todas as linhas existentes da aba na memória para extrair mapeamentos:
+        Carrega o histórico arquivado (se houver) e as linhas da aba, em chunks.
+        """
+        started = False
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started = True
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+        for source in (self.archive, self.sheet):
+            if source is not None:
+                self._load_values(source)
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.memory_stats = {"peak_bytes": peak - base, "steady_bytes": current - base}
+            if started:
+                tracemalloc.stop()
+            logger.info(
+                f"HistoricalAnalyzer: memória pico {self.memory_stats['peak_bytes'] / 1e6:.1f} MB, "
+                f"estável {self.memory_stats['steady_bytes'] / 1e6:.1f} MB"
+            )
+        logger.info(
+            f"HistoricalAnalyzer: carregado {len(self._canonical_map)} mapeamentos canônicos, "
+            f"{len(self._summary_map)} resumos e {len(self._opp_ids)} times em histórico."
+        )
+
+    def _load_values(self, source) -> None:
+        """
+        Processa a fonte em streaming (um chunk por vez, descartado em seguida) para extrair:
         - raw_time_casa -> time_casa (canônico)
         - raw_time_fora -> time_fora (canônico)
         - mercado_raw -> market_summary
-        - time_casa <-> time_fora em _opponents_map
+        - time_casa <-> time_fora nos arrays de adversários
         """
         try:
-            all_values: List[List[str]] = self.sheet.get_all_values()
-            if not all_values:
-                return
-            header = all_values[0]
-            # Encontrar índices pelas strings exatas:
-            try:
-                idx_raw_home = header.index("raw_time_casa")
-                idx_raw_away = header.index("raw_time_fora")
-                idx_canon_home = header.index("time_casa")
-                idx_canon_away = header.index("time_fora")
-                idx_raw_market = header.index("mercado_raw")
-                idx_summary = header.index("market_summary")
-            except ValueError:
-                logger.warning(
-                    "HistoricalAnalyzer: cabeçalho inesperado ou colunas ausentes. Não carregará histórico."
-                )
-                return
-
-            for row in all_values[1:]:
-                if len(row) <= max(idx_raw_home, idx_raw_away, idx_canon_home, idx_canon_away, idx_raw_market, idx_summary):
-                    continue
-                raw_home = row[idx_raw_home].strip()
-                raw_away = row[idx_raw_away].strip()
-                canon_home = row[idx_canon_home].strip()
-                canon_away = row[idx_canon_away].strip()
-                raw_market = row[idx_raw_market].strip()
-                summary = row[idx_summary].strip()
-
-                # canonical mapping
-                if raw_home and canon_home:
-                    with self._lock:
-                        if raw_home not in self._canonical_map:
-                            self._canonical_map[raw_home] = canon_home
-                if raw_away and canon_away:
-                    with self._lock:
-                        if raw_away not in self._canonical_map:
-                            self._canonical_map[raw_away] = canon_away
-
-                # summary mapping
-                if raw_market and summary:
-                    with self._lock:
-                        if raw_market not in self._summary_map:
-                            self._summary_map[raw_market] = summary
-
-                # opponents mapping (baseado em canonical)
-                if canon_home and canon_away:
-                    with self._lock:
-                        if canon_home not in self._opponents_map:
-                            self._opponents_map[canon_home] = Counter()
-                        if canon_away not in self._opponents_map:
-                            self._opponents_map[canon_away] = Counter()
-                        self._opponents_map[canon_home][canon_away] += 1
-                        self._opponents_map[canon_away][canon_home] += 1
-
-            logger.info(
-                f"HistoricalAnalyzer: carregado {len(self._canonical_map)} mapeamentos canônicos, "
-                f"{len(self._summary_map)} resumos e {len(self._opponents_map)} times em histórico."
-            )
+            for chunk in iter_history_chunks(source, HISTORY_COLUMNS, self.chunk_size):
+                with self._lock:
+                    for row in chunk:
+                        self._load_row(row)
         except Exception as e:
             logger.error("HistoricalAnalyzer: falha ao carregar histórico existente", exc_info=e)
 
+    def _load_row(self, row: Sequence[str]) -> None:
+        raw_home, raw_away, canon_home, canon_away, raw_market, summary = (
+            (v or "").strip() for v in row
+        )
+        # canonical mapping
+        if raw_home and canon_home:
+            k = self._intern(raw_home)
+            if k not in self._canonical_map:
+                self._canonical_map[k] = self._intern(canon_home)
+        if raw_away and canon_away:
+            k = self._intern(raw_away)
+            if k not in self._canonical_map:
+                self._canonical_map[k] = self._intern(canon_away)
+
+        # summary mapping
+        if raw_market and summary:
+            self._add_summary(raw_market, summary)
+
+        # opponents mapping (baseado em canonical)
+        if canon_home and canon_away:
+            h = self._intern(canon_home)
+            a = self._intern(canon_away)
+            self._add_opponent(h, a)
+            self._add_opponent(a, h)
+
+    # ─── Consultas ──────────────────────────────────────────
     def suggest_canonical(self, raw_name: str) -> Optional[str]:
         """
         Sugere nome canônico para raw_name se já conhecido no histórico; caso contrário, None.
@@ -101,16 +205,27 @@ class HistoricalAnalyzer:
         if not raw_name:
             return None
         with self._lock:
-            return self._canonical_map.get(raw_name)
+            k = self._ids.get(raw_name)
+            if k is None:
+                return None
+            c = self._canonical_map.get(k)
+            return self._strings[c] if c is not None else None
 
     def suggest_summary(self, mercado_raw: str) -> Optional[str]:
         """
         Sugere resumo de mercado para mercado_raw se já conhecido no histórico; caso contrário, None.
+        Busca pelo texto exato e, se não achar, pela chave normalizada (market_utils.market_key),
+        que junta variantes de OCR/digitação do mesmo mercado.
         """
         if not mercado_raw:
             return None
         with self._lock:
-            return self._summary_map.get(mercado_raw)
+            k = self._ids.get(mercado_raw)
+            s = self._summary_map.get(k) if k is not None else None
+            if s is None:
+                nk = self._ids.get(market_key(mercado_raw))
+                s = self._summary_norm.get(nk) if nk is not None else None
+            return self._strings[s] if s is not None else None
 
     def suggest_opponent(self, raw_name: str) -> Optional[str]:
         """
@@ -119,13 +234,15 @@ class HistoricalAnalyzer:
         if not raw_name:
             return None
         with self._lock:
-            canonical = self._canonical_map.get(raw_name, raw_name)
-            counter = self._opponents_map.get(canonical)
-            if counter:
-                most_common = counter.most_common(1)
-                if most_common:
-                    opponent, count = most_common[0]
-                    return opponent
+            k = self._ids.get(raw_name)
+            if k is None:
+                return None
+            team = self._canonical_map.get(k, k)
+            ids = self._opp_ids.get(team)
+            if ids:
+                counts = self._opp_counts[team]
+                best = max(range(len(counts)), key=counts.__getitem__)
+                return self._strings[ids[best]]
         return None
 
     def update(self, raw_home: str, raw_away: str, mercado_raw: str, summary: str) -> None:
@@ -136,16 +253,22 @@ class HistoricalAnalyzer:
         if mercado_raw and summary:
             with self._lock:
                 if raw_home or raw_away:
-                    # summary map
-                    if mercado_raw not in self._summary_map:
-                        self._summary_map[mercado_raw] = summary
+                    self._add_summary(mercado_raw, summary)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "strings": len(self._strings),
+                "canonical": len(self._canonical_map),
+                "summaries": len(self._summary_map),
+                "summary_keys": len(self._summary_norm),
+                "teams": len(self._opp_ids),
+            }
 
     def reload(self) -> None:
         """
-        Recarrega todo o histórico a partir da planilha.
+        Recarrega todo o histórico a partir da fonte.
         """
         with self._lock:
-            self._canonical_map.clear()
-            self._summary_map.clear()
-            self._opponents_map.clear()
+            self._reset()
         self._load_existing()
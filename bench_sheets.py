@@ -0,0 +1,112 @@
+# bench_sheets.py
+"""
+Benchmarks do caminho de escrita/leitura do Sheets contra FakeWorksheet (sem rede).
+
+Uso:
+    python bench_sheets.py                       # todos os cenários com valores padrão
+    python bench_sheets.py --rows 2000 --latency 0.05 --history 100000
+"""
+
+import sys
+import time
+import random
+import logging
+import argparse
+from typing import List
+
+import sheets_utils
+from sheets_utils import HEADER, init_sheet, append_row, append_rows
+from fake_sheet import FakeSpreadsheet, FakeWorksheet
+from analysis_utils import HistoricalAnalyzer
+
+logger = logging.getLogger(__name__)
+
+TEAMS = ["Flamengo", "Palmeiras", "Corinthians", "São Paulo", "Grêmio", "Internacional",
+         "Atlético-MG", "Cruzeiro", "Botafogo", "Vasco", "Fluminense", "Santos",
+         "Real Madrid", "Barcelona", "Man City", "Arsenal", "Liverpool", "Chelsea"]
+MARKETS = ["Mais de 2.5", "Menos de 1.5", "Ambas marcam - Sim", "Handicap -1.5",
+           "Time ou Empate", "Over 8.5 escanteios", "Under 210.5 pontos"]
+
+def make_rows(n: int, seed: int = 42) -> List[list]:
+    """
+    Gera n linhas sintéticas no formato HEADER.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        home, away = rng.sample(TEAMS, 2)
+        mkt = rng.choice(MARKETS)
+        odd = round(rng.uniform(1.3, 3.5), 2)
+        stake = rng.choice([0.5, 1.0, 1.5, 2.0])
+        rows.append([
+            f"{i:064x}", False, f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}T18:00:00+00:00",
+            2625305937, "Arrudex", f"{home} x {away} {mkt} {stake}%",
+            home, away, home, away, mkt, mkt, odd, stake, stake, 100, 40.0,
+            round(40.0 * stake, 2), "", "", "", "", "Bet365", "Futebol",
+        ])
+    return rows
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - t0
+
+def bench_init(latency: float) -> None:
+    ss = FakeSpreadsheet(latency=latency)
+    t = _timed(init_sheet, ss)
+    ws = ss.worksheet(sheets_utils.NEW_TAB)
+    print(f"[init] init_sheet em aba nova: {t:.3f}s ({ws.calls} chamadas)")
+
+def bench_write(n: int, latency: float) -> None:
+    rows = make_rows(n)
+    ws = FakeWorksheet(latency=latency)
+    t_row = _timed(lambda: [append_row(ws, r) for r in rows])
+    calls_row = ws.calls
+    ws = FakeWorksheet(latency=latency)
+    t_rows = _timed(append_rows, ws, rows)
+    print(f"[write] {n} linhas, latência {latency * 1000:.0f}ms/chamada")
+    print(f"  append_row  x{n}: {t_row:.3f}s ({calls_row} chamadas, {n / t_row:.0f} linhas/s)")
+    print(f"  append_rows     : {t_rows:.3f}s ({ws.calls} chamadas, {n / t_rows:.0f} linhas/s)")
+
+def bench_retry(n: int, latency: float, fail_rate: float) -> None:
+    rows = make_rows(n)
+    ws = FakeWorksheet(latency=latency, fail_rate=fail_rate, seed=1)
+    old_backoff = sheets_utils.RETRY_BACKOFF
+    sheets_utils.RETRY_BACKOFF = 0.01
+    try:
+        t = _timed(append_rows, ws, rows, chunk_size=50)
+    finally:
+        sheets_utils.RETRY_BACKOFF = old_backoff
+    # conferência sem falhas injetadas: mesmas linhas, na ordem, sem duplicatas
+    ws.fail_rate = 0
+    ok = [r[0] for r in ws.get_all_values()] == [str(r[0]) for r in rows]
+    print(f"[retry] {n} linhas, fail_rate={fail_rate:.0%}: {t:.3f}s, {ws.calls} chamadas, "
+          f"{ws.errors} erros injetados, íntegro={ok}")
+
+def bench_history(n: int) -> None:
+    ws = FakeWorksheet(rows=[HEADER] + make_rows(n))
+    t0 = time.perf_counter()
+    ha = HistoricalAnalyzer(ws, track_memory=True)
+    t = time.perf_counter() - t0
+    mem = ha.memory_stats
+    print(f"[history] HistoricalAnalyzer com {n} linhas: {t:.3f}s, pico {mem['peak_bytes'] / 1e6:.1f} MB, "
+          f"estável {mem['steady_bytes'] / 1e6:.1f} MB, {ha.stats()['canonical']} nomes, "
+          f"{ws.calls} chamadas de leitura")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarks do Sheets contra FakeWorksheet")
+    ap.add_argument("--rows", type=int, default=1000, help="linhas para os cenários de escrita")
+    ap.add_argument("--latency", type=float, default=0.002, help="latência simulada por chamada (s)")
+    ap.add_argument("--fail-rate", type=float, default=0.2, help="probabilidade de erro 503 por chamada")
+    ap.add_argument("--history", type=int, default=100000, help="linhas no cenário de carga do histórico")
+    args = ap.parse_args(argv)
+
+    logging.getLogger("sheets_utils").setLevel(logging.ERROR)
+    bench_init(args.latency)
+    bench_write(args.rows, args.latency)
+    bench_retry(args.rows, args.latency, args.fail_rate)
+    bench_history(args.history)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
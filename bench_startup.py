@@ -0,0 +1,86 @@
+# bench_startup.py
+"""
+Benchmark do startup do bot sem rede: import frio do telegram_bot (subprocesso), carga dos
+backends (planilha fake + BetStore temporário) e parse da primeira mensagem.
+No bot, o connect do Telegram roda em paralelo à carga dos backends; os logs "Startup: ..."
+mostram os tempos reais desde o launch.
+
+Uso:
+    python bench_startup.py                   # 20000 linhas de histórico
+    python bench_startup.py --history 100000
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+FIRST_MESSAGE = "Flamengo x Palmeiras @1.85 1.5%"
+
+def bench_import() -> float:
+    code = "import time; t0 = time.perf_counter(); import telegram_bot; print(time.perf_counter() - t0)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         env={**os.environ, "HEADLESS": "1"})
+    t = float(out.stdout.strip().splitlines()[-1])
+    print(f"[import] import telegram_bot (frio): {t:.3f}s")
+    return t
+
+def bench_backends(n: int, store_path: str):
+    from sheet_rotation import TabRotator
+    from fake_sheet import FakeSpreadsheet
+    from bench_sheets import make_rows
+    from telegram_bot import load_backends
+
+    import dedup_utils
+
+    ss = FakeSpreadsheet()
+    TabRotator(ss).current().append_rows(make_rows(n))
+    # sync_seen regrava o seen: no diretório do store temporário, nunca no seen.json real
+    seen_file = dedup_utils.SEEN_FILE
+    dedup_utils.SEEN_FILE = os.path.join(os.path.dirname(store_path), "seen.json")
+    try:
+        t0 = time.perf_counter()
+        backends = load_backends(ss, store_path=store_path)
+        t = time.perf_counter() - t0
+    finally:
+        dedup_utils.SEEN_FILE = seen_file
+    print(f"[backends] load_backends com {n} linhas: {t:.3f}s ({backends.store.count()} linhas no store)")
+    return t, backends
+
+def bench_first_message(backends) -> float:
+    from chat_registry import ChatRegistry
+    from pipeline import BetPipeline
+
+    registry = ChatRegistry()
+    pipeline = BetPipeline(backends.historical, set(backends.seen), registry, persist_seen=False,
+                           templates=backends.templates)
+    t0 = time.perf_counter()
+    rows = pipeline.parse_message(FIRST_MESSAGE, 2625305937, datetime.now(timezone.utc),
+                                  chat_info=registry.set_title(2625305937, "Arrudex"))
+    t = time.perf_counter() - t0
+    print(f"[first] parse da primeira mensagem: {t * 1000:.1f}ms ({len(rows)} linhas)")
+    return t
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark do startup do bot (sem Telegram/Sheets reais)")
+    ap.add_argument("--history", type=int, default=20000, help="linhas de histórico na planilha fake")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, force=True)
+    t_import = bench_import()
+    with tempfile.TemporaryDirectory() as tmp:
+        t_backends, backends = bench_backends(args.history, os.path.join(tmp, "bets.db"))
+        t_first = bench_first_message(backends)
+        backends.store.close()
+    print(f"[total] launch → primeira mensagem (sem o connect do Telegram, que corre em paralelo): "
+          f"{t_import + t_backends + t_first:.3f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
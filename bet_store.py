@@ -0,0 +1,538 @@
+# bet_store.py
+
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Iterable, Iterator, Tuple, Set
+
+from config import BET_STORE_FILE, MIRROR_INTERVAL
+from sheets_utils import HEADER, SETTLEMENT_COLUMNS, append_rows, index_to_col, with_retry
+
+logger = logging.getLogger(__name__)
+
+TABLE = "bets"
+REAL_COLUMNS = {"odd", "stake_pct", "actual_units", "scale", "unit_value", "amount_real"}
+INTEGER_COLUMNS = {"duplicate", "group_id"}
+INDEXES = {
+    "idx_bets_bet_key": "bet_key",
+    "idx_bets_group": "group_id",
+    "idx_bets_data_hora": "data_hora",
+    "idx_bets_time_casa": "time_casa",
+    "idx_bets_time_fora": "time_fora",
+}
+
+def _q(col: str) -> str:
+    return f'"{col}"'
+
+def _column_type(col: str) -> str:
+    if col in REAL_COLUMNS:
+        return "REAL"
+    if col in INTEGER_COLUMNS:
+        return "INTEGER"
+    return "TEXT"
+
+def _to_db(row: list) -> list:
+    """
+    Normaliza uma linha (valores Python ou strings vindas do Sheets) para gravação no SQLite.
+    """
+    out = []
+    for col, v in zip(HEADER, row):
+        if v == '' or v is None:
+            out.append(None)
+        elif col == "duplicate":
+            out.append(1 if v is True or str(v).upper() == "TRUE" else 0)
+        else:
+            out.append(v)
+    return out
+
+def _to_sheet(row) -> list:
+    """
+    Converte uma linha do SQLite de volta ao formato enviado ao Sheets.
+    """
+    out = []
+    for col, v in zip(HEADER, row):
+        if v is None:
+            out.append('')
+        elif col == "duplicate":
+            out.append(bool(v))
+        else:
+            out.append(v)
+    return out
+
+def _to_str(row) -> List[str]:
+    """
+    Formato de get_all_values: tudo string, vazio para NULL, TRUE/FALSE para duplicate.
+    """
+    out = []
+    for col, v in zip(HEADER, row):
+        if v is None:
+            out.append("")
+        elif col == "duplicate":
+            out.append("TRUE" if v else "FALSE")
+        else:
+            out.append(str(v))
+    return out
+
+class BetStore:
+    """
+    Store local das apostas (SQLite, schema = HEADER de sheets_utils), fonte de verdade do bot.
+    Leituras de histórico, dedup e análises rodam aqui; o Sheets é espelhado pelo SheetMirror.
+    """
+
+    def __init__(self, path: str = BET_STORE_FILE):
+        self.path = path
+        # timeout: espera o lock de escrita quando vários processos (workers) gravam
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.RLock()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        cols = ", ".join(f"{_q(c)} {_column_type(c)}" for c in HEADER)
+        with self._lock:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE} (id INTEGER PRIMARY KEY AUTOINCREMENT, {cols}, "
+                f"mirrored INTEGER NOT NULL DEFAULT 0)"
+            )
+            for name, col in INDEXES.items():
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE} ({_q(col)})")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_bets_pending ON {TABLE} (id) WHERE mirrored = 0")
+            # posição da linha espelhada no Sheets (aba, linha), para correções sem append
+            existing = {r[1] for r in self._conn.execute(f"PRAGMA table_info({TABLE})")}
+            for col, typ in (("sheet_tab", "TEXT"), ("sheet_row", "INTEGER")):
+                if col not in existing:
+                    self._conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {col} {typ}")
+            # liquidação (settlement.py); result NULL = ainda não liquidada
+            for col, typ in zip(SETTLEMENT_COLUMNS, ("TEXT", "REAL")):
+                if col not in existing:
+                    self._conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_q(col)} {typ}")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_bets_unsettled ON {TABLE} (id) WHERE result IS NULL")
+
+    # ─── Escrita ────────────────────────────────────────────
+    def _insert(self, rows: Iterable[list], mirrored: bool, dedup: bool) -> List[int]:
+        """
+        INSERT dentro de uma transação já aberta. dedup=True recalcula a coluna duplicate
+        contra o que já está gravado (e o próprio lote) — autoritativo com vários processos.
+        Retorna os ids inseridos (consecutivos: a transação segura o lock de escrita).
+        """
+        data = []
+        batch_keys = set()
+        for r in rows:
+            row = _to_db(r)
+            if dedup and row[0]:
+                exists = row[0] in batch_keys or self._conn.execute(
+                    f"SELECT 1 FROM {TABLE} WHERE bet_key = ? LIMIT 1", (row[0],)
+                ).fetchone() is not None
+                row[1] = 1 if exists else 0
+                batch_keys.add(row[0])
+            data.append(row + [1 if mirrored else 0])
+        if not data:
+            return []
+        cols = ", ".join(_q(c) for c in HEADER) + ", mirrored"
+        marks = ", ".join("?" for _ in range(len(HEADER) + 1))
+        self._conn.executemany(f"INSERT INTO {TABLE} ({cols}) VALUES ({marks})", data)
+        last = self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last - len(data) + 1, last + 1))
+
+    def insert_rows(self, rows: Iterable[list], mirrored: bool = False, dedup: bool = False,
+                    return_ids: bool = False):
+        """
+        Insere linhas no formato HEADER numa única transação. Retorna quantas foram inseridas
+        (ou os ids delas, com return_ids=True).
+        """
+        rows = list(rows)
+        if not rows:
+            return [] if return_ids else 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = self._insert(rows, mirrored, dedup)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids if return_ids else len(ids)
+
+    def update_rows(self, ids: List[int], rows: List[list]) -> int:
+        """
+        Reescreve linhas inteiras (formato HEADER) pelos ids, sem mexer no estado do espelho.
+        A liquidação é descartada (odd/mercado podem ter mudado) e refeita no próximo settlement.
+        """
+        blank = (None,) * len(SETTLEMENT_COLUMNS)
+        return self.update_columns(HEADER + SETTLEMENT_COLUMNS,
+                                   [tuple(_to_db(r)) + blank + (i,) for i, r in zip(ids, rows)])
+
+    def update_columns(self, columns: List[str], params: List[tuple]) -> int:
+        """
+        UPDATE em lote: cada tupla de params traz os valores de columns seguidos do id da linha.
+        """
+        if not params:
+            return 0
+        sets = ", ".join(f"{_q(c)} = ?" for c in columns)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(f"UPDATE {TABLE} SET {sets} WHERE id = ?", params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(params)
+
+    def import_sheet_values(self, values: List[List[str]]) -> int:
+        """
+        Carga inicial a partir de get_all_values() da aba (linhas já espelhadas).
+        """
+        if not values:
+            return 0
+        header = values[0]
+        idx = [header.index(c) if c in header else None for c in HEADER]
+        rows = [[(r[i] if i is not None and i < len(r) else '') for i in idx] for r in values[1:]]
+        n = self.insert_rows(rows, mirrored=True)
+        logger.info(f"BetStore: {n} linhas importadas da planilha")
+        return n
+
+    # ─── Leitura ────────────────────────────────────────────
+    def count(self, mirrored: Optional[bool] = None, non_empty: Optional[List[str]] = None) -> int:
+        """
+        Total de linhas; mirrored=True conta só as já espelhadas no Sheets e non_empty só as
+        que têm todas essas colunas preenchidas.
+        """
+        conds = [] if mirrored is None else [f"mirrored = {1 if mirrored else 0}"]
+        conds += [f"COALESCE({_q(c)}, '') != ''" for c in non_empty or []]
+        where = f" WHERE {' AND '.join(conds)}" if conds else ""
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {TABLE}{where}").fetchone()[0]
+
+    def columns(self) -> List[str]:
+        with self._lock:
+            return [r[1] for r in self._conn.execute(f"PRAGMA table_info({TABLE})")]
+
+    def has_key(self, bet_key: str) -> bool:
+        with self._lock:
+            cur = self._conn.execute(f"SELECT 1 FROM {TABLE} WHERE bet_key = ? LIMIT 1", (bet_key,))
+            return cur.fetchone() is not None
+
+    def bet_keys(self) -> Set[str]:
+        with self._lock:
+            return {r[0] for r in self._conn.execute(f"SELECT DISTINCT bet_key FROM {TABLE}") if r[0]}
+
+    def get_all_values(self) -> List[List[str]]:
+        """
+        Mesmo formato de gspread Worksheet.get_all_values(): cabeçalho + linhas como strings.
+        Permite usar o store direto no HistoricalAnalyzer.
+        """
+        cols = ", ".join(_q(c) for c in HEADER)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {cols} FROM {TABLE} ORDER BY id").fetchall()
+        return [list(HEADER)] + [_to_str(r) for r in rows]
+
+    def iter_column_chunks(self, columns: List[str], chunk_size: int = 5000) -> Iterator[List[tuple]]:
+        """
+        Itera só as colunas pedidas em blocos de chunk_size linhas (paginação por id),
+        sem materializar a tabela inteira. Valores NULL viram "".
+        """
+        cols = ", ".join(f"COALESCE({_q(c)}, '')" for c in columns)
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, {cols} FROM {TABLE} WHERE id > ? ORDER BY id LIMIT ?", (last, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [r[1:] for r in rows]
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """
+        Consulta SQL livre (relatórios/análises) sobre a tabela `bets`.
+        """
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def pending_mirror(self, limit: int = 500) -> List[Tuple[int, list]]:
+        cols = ", ".join(_q(c) for c in HEADER)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, {cols} FROM {TABLE} WHERE mirrored = 0 ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(r[0], _to_sheet(r[1:])) for r in rows]
+
+    def mark_mirrored(self, ids: List[int], positions: Optional[List[Optional[Tuple[str, int]]]] = None) -> None:
+        """
+        Marca as linhas como espelhadas, guardando (aba, linha) de cada uma quando conhecida.
+        """
+        if not ids:
+            return
+        positions = positions or [None] * len(ids)
+        params = [(p[0] if p else None, p[1] if p else None, i) for i, p in zip(ids, positions)]
+        with self._lock:
+            self._conn.executemany(
+                f"UPDATE {TABLE} SET mirrored = 1, sheet_tab = ?, sheet_row = ? WHERE id = ?", params
+            )
+
+    def mirrored_rows(self, ids: List[int]) -> List[Tuple[int, str, int, list]]:
+        """
+        (id, aba, linha, valores p/ Sheets) das linhas já espelhadas com posição conhecida.
+        """
+        if not ids:
+            return []
+        cols = ", ".join(_q(c) for c in HEADER)
+        marks = ", ".join("?" for _ in ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, sheet_tab, sheet_row, {cols} FROM {TABLE} "
+                f"WHERE id IN ({marks}) AND mirrored = 1 AND sheet_row IS NOT NULL", tuple(ids)
+            ).fetchall()
+        return [(r[0], r[1], r[2], _to_sheet(r[3:])) for r in rows]
+
+    def settlements(self, ids: List[int]) -> Dict[int, Tuple[str, Optional[float]]]:
+        """
+        id → (result, profit) das linhas já liquidadas entre ids.
+        """
+        if not ids:
+            return {}
+        marks = ", ".join("?" for _ in ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, result, profit FROM {TABLE} WHERE id IN ({marks}) AND result IS NOT NULL", tuple(ids)
+            ).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class JobQueue:
+    """
+    Fila de mensagens a processar (tabela `jobs` no mesmo SQLite do BetStore), usada quando
+    o OCR/parse roda em vários processos (workers.py). Cada (chat_id, msg_id) entra uma vez;
+    claim é atômico e complete grava as linhas e fecha o job na mesma transação, então uma
+    mensagem nunca é gravada duas vezes, mesmo com job reenfileirado por timeout.
+    """
+
+    def __init__(self, store: BetStore, max_attempts: int = 3):
+        self.store = store
+        self.max_attempts = max_attempts
+        with store._lock:
+            store._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER, "
+                "msg_id INTEGER, title TEXT, raw TEXT, date TEXT, media_path TEXT, "
+                "status TEXT NOT NULL DEFAULT 'pending', worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT, updated_at REAL, UNIQUE (chat_id, msg_id))"
+            )
+            store._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        with self.store._lock:
+            return self.store._conn.execute(sql, params).rowcount
+
+    def enqueue(self, chat_id, msg_id: int, raw: str, date: str, title: Optional[str] = None,
+                media_path: Optional[str] = None) -> bool:
+        """
+        Enfileira uma mensagem. False se ela já estava na fila (processada ou não).
+        """
+        return self._write(
+            "INSERT OR IGNORE INTO jobs (chat_id, msg_id, title, raw, date, media_path, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (chat_id, msg_id, title, raw, date, media_path, time.time()),
+        ) == 1
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """
+        Pega o job pendente mais antigo para este worker (ou None se a fila estiver vazia).
+        """
+        conn = self.store._conn
+        with self.store._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, chat_id, msg_id, title, raw, date, media_path FROM jobs "
+                    "WHERE status = 'pending' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ? "
+                        "WHERE id = ?", (worker, time.time(), row[0])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        keys = ("id", "chat_id", "msg_id", "title", "raw", "date", "media_path")
+        return dict(zip(keys, row))
+
+    def complete(self, job_id: int, worker: str, rows: List[list]) -> bool:
+        """
+        Grava as linhas do job (com dedup no store) e marca o job como feito, atomicamente.
+        False se o job não pertence mais a este worker (reenfileirado); nada é gravado.
+        """
+        conn = self.store._conn
+        with self.store._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = conn.execute(
+                    "UPDATE jobs SET status = 'done', updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                    (time.time(), job_id, worker),
+                )
+                if cur.rowcount != 1:
+                    conn.execute("ROLLBACK")
+                    return False
+                self.store._insert(rows, mirrored=False, dedup=True)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        """
+        Devolve o job à fila, ou marca como 'failed' após max_attempts tentativas.
+        """
+        self._write(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, error = ?, updated_at = ? WHERE id = ? AND worker = ?",
+            (self.max_attempts, error[:500], time.time(), job_id, worker),
+        )
+
+    def requeue_stale(self, timeout: float) -> int:
+        """
+        Reenfileira jobs 'running' parados há mais de timeout segundos (worker morto/travado).
+        """
+        n = self._write(
+            "UPDATE jobs SET status = 'pending', worker = NULL, updated_at = ? "
+            "WHERE status = 'running' AND updated_at < ?",
+            (time.time(), time.time() - timeout),
+        )
+        if n:
+            logger.warning(f"JobQueue: {n} job(s) parados reenfileirados")
+        return n
+
+    def counts(self) -> Dict[str, int]:
+        with self.store._lock:
+            return dict(self.store._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+class SheetMirror:
+    """
+    Espelha no Google Sheets, em background, as linhas do BetStore ainda não enviadas.
+    Cada rodada envia as pendentes com append_rows; falhas ficam pendentes para a próxima.
+    """
+
+    def __init__(self, store: BetStore, sheet, interval: float = MIRROR_INTERVAL, batch_size: int = 500):
+        self.store = store
+        self.sheet = sheet
+        self.interval = interval
+        self.batch_size = batch_size
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    async def flush(self) -> int:
+        """
+        Envia todas as linhas pendentes. Retorna quantas foram espelhadas.
+        """
+        total = 0
+        async with self._flush_lock:
+            while True:
+                pending = await asyncio.to_thread(self.store.pending_mirror, self.batch_size)
+                if not pending:
+                    return total
+                ids = [i for i, _ in pending]
+                positions = await asyncio.to_thread(append_rows, self.sheet, [r for _, r in pending],
+                                                    self.batch_size)
+                await asyncio.to_thread(self.store.mark_mirrored, ids, positions)
+                total += len(ids)
+
+    async def update(self, ids: List[int]) -> int:
+        """
+        Regrava no Sheets, no lugar, linhas já espelhadas que mudaram no store (ex.: mensagem
+        editada): um batch_update por aba, nunca append. As células de liquidação (result/profit)
+        são limpas no mesmo batch, como no store. Linhas ainda pendentes saem com o conteúdo
+        novo no próximo flush. Retorna quantas linhas foram regravadas.
+        """
+        async with self._flush_lock:
+            rows = await asyncio.to_thread(self.store.mirrored_rows, ids)
+            if not rows:
+                return 0
+            last_col = index_to_col(len(HEADER) + len(SETTLEMENT_COLUMNS))
+            blank = [""] * len(SETTLEMENT_COLUMNS)
+            by_tab: Dict[str, List[dict]] = {}
+            for _, tab, row, values in rows:
+                by_tab.setdefault(tab, []).append({"range": f"A{row}:{last_col}{row}", "values": [values + blank]})
+            for tab, data in by_tab.items():
+                ws = self.sheet.worksheet(tab) if hasattr(self.sheet, "worksheet") else self.sheet
+                await asyncio.to_thread(with_retry, ws.batch_update, data, value_input_option='USER_ENTERED')
+        logger.info(f"SheetMirror: {len(rows)} linha(s) corrigidas no Sheets")
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                n = await self.flush()
+                if n:
+                    logger.debug(f"SheetMirror: {n} linhas espelhadas no Sheets")
+            except Exception as e:
+                logger.error("SheetMirror: falha ao espelhar no Sheets; tentará novamente", exc_info=e)
+
+class StoreSink:
+    """
+    Sink do pipeline: grava no BetStore (fonte de verdade), atualiza os agregados de
+    desempenho e acorda o SheetMirror.
+    """
+
+    def __init__(self, store: BetStore, mirror: Optional[SheetMirror] = None, aggregates=None):
+        self.store = store
+        self.mirror = mirror
+        self.aggregates = aggregates
+
+    async def write(self, rows: List[list]) -> List[int]:
+        """
+        Grava as linhas e retorna os ids no store (vazio em caso de falha).
+        """
+        try:
+            ids = await asyncio.to_thread(self.store.insert_rows, rows, return_ids=True)
+        except Exception as e:
+            logger.error("Erro ao gravar no BetStore", exc_info=e)
+            return []
+        if self.aggregates is not None:
+            self.aggregates.add_rows(rows)
+        if self.mirror is not None:
+            self.mirror.notify()
+        return ids
+
+    async def update(self, ids: List[int], old_rows: List[list], new_rows: List[list]) -> None:
+        """
+        Substitui linhas já gravadas (mesmos ids): store, agregados e, se já espelhadas, Sheets.
+        A liquidação antiga é descartada (update_rows) e descontada dos agregados.
+        """
+        settled = await asyncio.to_thread(self.store.settlements, ids) if self.aggregates is not None else {}
+        await asyncio.to_thread(self.store.update_rows, ids, new_rows)
+        if self.aggregates is not None:
+            for i, old in zip(ids, old_rows):
+                if i in settled:
+                    self.aggregates.add_settlement_row(old, *settled[i], sign=-1)
+            self.aggregates.add_rows(old_rows, sign=-1)
+            self.aggregates.add_rows(new_rows)
+        if self.mirror is not None:
+            try:
+                await self.mirror.update(ids)
+            except Exception as e:
+                logger.error("SheetMirror: falha ao corrigir linhas no Sheets", exc_info=e)
@@ -10,28 +10,36 @@ API_ID   = 23767719
 API_HASH = '238e12910fd0755bd76d58b09705fe9c'
 # ─────────────────────────────────────────────────
 
-async def main():
-    client = TelegramClient('session', API_ID, API_HASH)
-    await client.start()
-    print("✅ Conectado! Buscando todos os dialogs...")
-
-    # Pega até 200 chats (ajuste limit se precisar mais)
+async def fetch_dialogs(client, limit=200):
+    """
+    Retorna a lista de chats (objetos Telethon) dos dialogs da conta.
+    Reaproveitado pelo ChatRegistry para popular metadados no startup.
+    """
     result = await client(GetDialogsRequest(
         offset_date=None,
         offset_id=0,
         offset_peer=InputPeerEmpty(),
-        limit=200,
+        limit=limit,
         hash=0
     ))
+    return result.chats
+
+async def main():
+    client = TelegramClient('session', API_ID, API_HASH)
+    await client.start()
+    print("✅ Conectado! Buscando todos os dialogs...")
+
+    # Pega até 200 chats (ajuste limit se precisar mais)
+    chats = await fetch_dialogs(client, limit=200)
 
     print("\n📋 Lista de chats:")
-    for chat in result.chats:
+    for chat in chats:
         # Alguns chats não têm title (privados), então checamos
         nome = getattr(chat, 'title', None) or getattr(chat, 'username', None) or '—sem título—'
         print(f"   ID: {chat.id}   |   {nome}")
 
     await client.disconnect()
-    print("\n✅ Pronto! Anote os IDs dos grupos que quer monitorar e coloque em MONITORADOS.")
+    print("\n✅ Pronto! Anote os IDs dos grupos que quer monitorar e coloque em unit_scales do rules.json (vale sem reiniciar o bot).")
 
 if __name__ == '__main__':
     asyncio.run(main())
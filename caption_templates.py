@@ -0,0 +1,310 @@
+# caption_templates.py
+"""
+Templates de legenda por grupo: cada grupo posta quase sempre no mesmo formato, então uma
+regex pré-compilada por formato extrai times, mercado, odd, stake e limite num único match.
+Mensagens que não casam seguem pelo caminho genérico (parse_utils/ocr_utils).
+
+Templates vêm de duas fontes:
+- declarados em GROUP_SETTINGS[group_id]["templates"] (regex aplicada com search sobre a
+  legenda limpa, com grupos nomeados home, away, market, odd, stake, limit — todos
+  opcionais exceto stake);
+- aprendidos do histórico do BetStore: legendas cujos valores gravados (stake/odd/limite e,
+  sem OCR, times/mercado) aparecem sem ambiguidade na legenda; formatos com suporte mínimo
+  viram templates após conferir que reproduzem exatamente as linhas gravadas.
+
+Uso (ver templates aprendidos e cobertura):
+    python caption_templates.py
+"""
+
+import re
+import sys
+import logging
+import argparse
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from config import TEMPLATE_MIN_SUPPORT, TEMPLATE_LEARN_ROWS
+import rules
+from chat_registry import bare_chat_id
+
+logger = logging.getLogger(__name__)
+
+MAX_TEMPLATES_PER_GROUP = 8
+OCR_SEPARATOR = " || OCR: "
+
+_FIELD_RE = {
+    "home": r'(?P<home>.+?)',
+    "away": r'(?P<away>.+?)',
+    "market": r'(?P<market>.+?)',
+    "stake": r'(?P<stake>\d+(?:[.,]\d+)?)',
+    "odd": r'(?P<odd>\d+(?:[.,]\d+)?)',
+    "limit": r'(?P<limit>[\d\.,]+)',
+}
+
+@dataclass
+class TemplateMatch:
+    template: str
+    stake: float
+    odd: Optional[float] = None
+    limit: Optional[float] = None
+    home: Optional[str] = None
+    away: Optional[str] = None
+    market: Optional[str] = None
+
+@dataclass
+class Template:
+    pattern: str
+    regex: re.Pattern
+    source: str          # "config" ou "learned"
+    support: int = 0
+    hits: int = 0
+
+def _num(s: Optional[str]) -> Optional[float]:
+    if not s:
+        return None
+    try:
+        return float(s.replace(',', '.'))
+    except ValueError:
+        return None
+
+def _limit_num(s: Optional[str]) -> Optional[float]:
+    # mesma conversão de parse_utils.extract_limit
+    if not s:
+        return None
+    try:
+        return float(s.replace('.', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+def _to_match(tpl: Template, m: re.Match) -> Optional[TemplateMatch]:
+    g = m.groupdict()
+    stake = _num(g.get("stake"))
+    if stake is None:
+        return None
+    return TemplateMatch(
+        template=tpl.pattern,
+        stake=stake,
+        odd=_num(g.get("odd")),
+        limit=_limit_num(g.get("limit")),
+        home=(g.get("home") or "").strip() or None,
+        away=(g.get("away") or "").strip() or None,
+        market=(g.get("market") or "").strip() or None,
+    )
+
+def _literal(s: str) -> str:
+    """
+    Trecho fixo da legenda → regex; números variam entre mensagens (horário, data, ...).
+    """
+    return re.sub(r'\d+', r'\\d+', re.escape(s))
+
+def skeleton(clean: str, home: str, away: str, market: str, odd, stake) -> Optional[str]:
+    """
+    Formato (regex) de uma legenda limpa cujos valores gravados são conhecidos, ou None se
+    os valores não puderem ser localizados sem ambiguidade.
+    """
+    r = rules.current()
+    spans: List[Tuple[int, int, str]] = []
+    stakes = list(r.pattern_stake.finditer(clean))
+    if len(stakes) != 1 or _num(stakes[0].group(1)) != _num(str(stake)):
+        return None
+    spans.append((stakes[0].start(1), stakes[0].end(1), "stake"))
+    odds = list(r.pattern_odd.finditer(clean))
+    if len(odds) > 1:
+        return None
+    if odds:
+        if odd not in ("", None) and _num(odds[0].group(1)) != _num(str(odd)):
+            return None
+        spans.append((odds[0].start(1), odds[0].end(1), "odd"))
+    limit = r.pattern_limit.search(clean)
+    if limit:
+        spans.append((limit.start(1), limit.end(1), "limit"))
+    # no caminho genérico, mercado lido da legenda é a legenda limpa inteira
+    whole_market = bool(market) and market == clean
+    for name, value in (("home", home), ("away", away), ("market", None if whole_market else market)):
+        if not value:
+            continue
+        pos = clean.find(value)
+        if pos < 0 or clean.find(value, pos + 1) >= 0:
+            return None
+        spans.append((pos, pos + len(value), name))
+    spans.sort()
+    for (s1, e1, _), (s2, _, _) in zip(spans, spans[1:]):
+        if s2 < e1:
+            return None
+    out, last = [], 0
+    for start, end, name in spans:
+        out.append(_literal(clean[last:start]))
+        out.append(_FIELD_RE[name])
+        last = end
+    out.append(_literal(clean[last:]))
+    body = "".join(out)
+    return f"^(?P<market>{body})$" if whole_market else f"^{body}$"
+
+class CaptionTemplates:
+    """
+    Templates compilados por grupo (id puro) com contadores de uso do fast path.
+    """
+
+    def __init__(self):
+        self._templates: Dict[int, List[Template]] = {}
+        self._hits: Counter = Counter()
+        self._misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+    # ─── Carga ──────────────────────────────────────────────
+    def load_declared(self, settings: Optional[Dict[int, dict]] = None) -> int:
+        if settings is None:
+            settings = rules.current().group_settings
+        n = 0
+        for gid, cfg in settings.items():
+            for pattern in cfg.get("templates", []):
+                try:
+                    regex = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+                except re.error as e:
+                    logger.warning(f"Template inválido para o grupo {gid}: {pattern} ({e})")
+                    continue
+                if "stake" not in regex.groupindex:
+                    logger.warning(f"Template do grupo {gid} sem grupo 'stake'; ignorado: {pattern}")
+                    continue
+                self._add(bare_chat_id(gid), Template(pattern, regex, "config"))
+                n += 1
+        return n
+
+    def reload_declared(self, old=None, new=None) -> int:
+        """
+        Listener de rules: troca os templates declarados pelos de GROUP_SETTINGS atuais,
+        mantendo os aprendidos.
+        """
+        with self._lock:
+            for gid in list(self._templates):
+                self._templates[gid] = [t for t in self._templates[gid] if t.source != "config"]
+        n = self.load_declared(new.group_settings if new is not None else None)
+        logger.info(f"CaptionTemplates: {n} templates declarados recarregados")
+        return n
+
+    def _add(self, gid: int, tpl: Template) -> None:
+        with self._lock:
+            lst = self._templates.setdefault(gid, [])
+            if all(t.pattern != tpl.pattern for t in lst):
+                lst.append(tpl)
+
+    def learn(self, rows) -> int:
+        """
+        rows: (group_id, raw_mensagem_identificada, raw_time_casa, raw_time_fora, mercado_raw, odd, stake_pct).
+        Mensagens só com legenda ensinam times/mercado/odd/stake; com OCR, só stake/odd/limite
+        da legenda (times e mercado vêm da imagem). Retorna quantos templates foram aprendidos.
+        """
+        rows = [r for r in rows if r[1]]
+        per_message = Counter((r[0], r[1]) for r in rows)
+        done = set()
+        by_group: Dict[int, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+        for r in rows:
+            msg_key = (r[0], r[1])
+            if msg_key in done:
+                continue
+            done.add(msg_key)
+            try:
+                gid = bare_chat_id(r[0])
+            except (TypeError, ValueError):
+                continue
+            caption, sep, _ = r[1].partition(OCR_SEPARATOR)
+            if sep:
+                sample = (caption, None, None, None, None, r[6])
+            elif per_message[msg_key] == 1:
+                sample = (caption, r[2] or None, r[3] or None, r[4] or None, r[5], r[6])
+            else:
+                continue
+            sk = skeleton(*sample)
+            if sk:
+                by_group[gid][sk].append(sample)
+        learned = 0
+        for gid, skeletons in by_group.items():
+            ranked = sorted(skeletons.items(), key=lambda kv: len(kv[1]), reverse=True)
+            for sk, samples in ranked[:MAX_TEMPLATES_PER_GROUP]:
+                if len(samples) < TEMPLATE_MIN_SUPPORT:
+                    break
+                tpl = Template(sk, re.compile(sk, re.DOTALL), "learned", support=len(samples))
+                if all(self._reproduces(tpl, s) for s in samples):
+                    self._add(gid, tpl)
+                    learned += 1
+        logger.info(f"CaptionTemplates: {learned} templates aprendidos em {len(by_group)} grupos")
+        return learned
+
+    @staticmethod
+    def _reproduces(tpl: Template, sample) -> bool:
+        caption, home, away, market, odd, stake = sample
+        m = tpl.regex.search(caption)
+        if not m:
+            return False
+        tm = _to_match(tpl, m)
+        return (tm is not None
+                and tm.stake == _num(str(stake))
+                and (tm.odd is None or odd in ("", None) or tm.odd == _num(str(odd)))
+                and tm.home == home
+                and tm.away == away
+                and tm.market == market)
+
+    def learn_from_store(self, store, limit: int = TEMPLATE_LEARN_ROWS) -> int:
+        rows = store.query(
+            'SELECT group_id, raw_mensagem_identificada, raw_time_casa, raw_time_fora, mercado_raw, odd, stake_pct '
+            'FROM bets WHERE duplicate = 0 ORDER BY id DESC LIMIT ?', (limit,)
+        )
+        return self.learn(rows)
+
+    # ─── Fast path ──────────────────────────────────────────
+    def match(self, chat_id, clean: str) -> Optional[TemplateMatch]:
+        """
+        Tenta os templates do grupo sobre a legenda limpa. None → caminho genérico.
+        """
+        try:
+            gid = bare_chat_id(chat_id)
+        except (TypeError, ValueError):
+            return None
+        templates = self._templates.get(gid)
+        if not templates or not clean:
+            return None
+        for tpl in templates:
+            m = tpl.regex.search(clean)
+            if m:
+                tm = _to_match(tpl, m)
+                if tm is not None:
+                    with self._lock:
+                        tpl.hits += 1
+                        self._hits[gid] += 1
+                    return tm
+        with self._lock:
+            self._misses[gid] += 1
+        return None
+
+    def templates(self, chat_id) -> List[Template]:
+        return list(self._templates.get(bare_chat_id(chat_id), []))
+
+    def stats(self) -> Dict[int, dict]:
+        """
+        Por grupo: templates carregados, mensagens no fast path e no caminho genérico.
+        """
+        with self._lock:
+            return {
+                gid: {"templates": len(lst), "hits": self._hits[gid], "fallback": self._misses[gid]}
+                for gid, lst in self._templates.items()
+            }
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Templates de legenda aprendidos do BetStore")
+    ap.add_argument("--limit", type=int, default=TEMPLATE_LEARN_ROWS, help="linhas recentes analisadas")
+    args = ap.parse_args(argv)
+
+    from bet_store import BetStore
+    templates = CaptionTemplates()
+    templates.load_declared()
+    templates.learn_from_store(BetStore(), args.limit)
+    for gid in templates.stats():
+        print(f"Grupo {gid}:")
+        for tpl in templates.templates(gid):
+            print(f"  [{tpl.source}, suporte {tpl.support}] {tpl.pattern}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# chat_registry.py
+
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Awaitable, Callable
+
+from config import CHAT_REGISTRY_TTL
+import rules
+
+logger = logging.getLogger(__name__)
+
+def bare_chat_id(chat_id) -> int:
+    """
+    Converte o chat_id "marcado" do Telethon (-100XXXXXXXXXX para canais/supergrupos,
+    -XXXX para grupos) no id puro usado em UNIT_SCALES e nos dialogs.
+    """
+    s = str(chat_id)
+    if s.startswith("-100"):
+        return int(s[4:])
+    return abs(int(chat_id))
+
+@dataclass
+class ChatInfo:
+    chat_id: int
+    title: str
+    scale: int
+    settings: dict = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.monotonic)
+
+class ChatRegistry:
+    """
+    Cache em memória dos metadados de cada grupo (título, escala de UNIT_SCALES e GROUP_SETTINGS).
+    Populado no startup a partir da lista de dialogs e atualizado em eventos de troca de título;
+    entradas mais velhas que o TTL são buscadas novamente sob demanda.
+    """
+
+    def __init__(self, ttl: float = CHAT_REGISTRY_TTL):
+        self.ttl = ttl
+        self._chats: Dict[int, ChatInfo] = {}
+        self._lock = threading.Lock()
+
+    def _make(self, key: int, title: Optional[str]) -> ChatInfo:
+        r = rules.current()
+        return ChatInfo(
+            chat_id=key,
+            title=title or str(key),
+            scale=r.unit_scales.get(key, r.default_scale),
+            settings=dict(r.group_settings.get(key, {})),
+        )
+
+    def apply_rules(self, old=None, new=None) -> None:
+        """
+        Listener de rules: reaplica escala e settings aos chats em cache, mantendo os títulos.
+        """
+        with self._lock:
+            for key, info in list(self._chats.items()):
+                self._chats[key] = self._make(key, info.title)
+        logger.info(f"ChatRegistry: escalas/settings reaplicados a {len(self._chats)} chats")
+
+    async def load_from_client(self, client, limit: int = 200) -> None:
+        """
+        Preenche o registro com os chats dos dialogs (mesma chamada de bot_discovery).
+        """
+        from bot_discovery import fetch_dialogs
+        try:
+            chats = await fetch_dialogs(client, limit=limit)
+        except Exception as e:
+            logger.error("ChatRegistry: falha ao buscar dialogs", exc_info=e)
+            return
+        with self._lock:
+            for chat in chats:
+                title = getattr(chat, 'title', None) or getattr(chat, 'username', None)
+                self._chats[chat.id] = self._make(chat.id, title)
+        logger.info(f"ChatRegistry: {len(self._chats)} chats carregados dos dialogs")
+
+    def get(self, chat_id) -> Optional[ChatInfo]:
+        """
+        Lookup O(1). Retorna None se o chat não é conhecido ou se a entrada expirou.
+        """
+        key = bare_chat_id(chat_id)
+        with self._lock:
+            info = self._chats.get(key)
+        if info is None:
+            return None
+        if self.ttl and time.monotonic() - info.loaded_at > self.ttl:
+            return None
+        return info
+
+    def set_title(self, chat_id, title: Optional[str]) -> ChatInfo:
+        """
+        Registra/atualiza o título de um chat (ex.: evento de troca de título).
+        """
+        key = bare_chat_id(chat_id)
+        info = self._make(key, title)
+        with self._lock:
+            self._chats[key] = info
+        logger.debug(f"ChatRegistry: chat {key} -> '{info.title}' (scale={info.scale})")
+        return info
+
+    def invalidate(self, chat_id=None) -> None:
+        """
+        Remove um chat (ou todos, se chat_id=None) do cache.
+        """
+        with self._lock:
+            if chat_id is None:
+                self._chats.clear()
+            else:
+                self._chats.pop(bare_chat_id(chat_id), None)
+
+    async def resolve(self, chat_id, fetch_chat: Optional[Callable[[], Awaitable]] = None) -> ChatInfo:
+        """
+        Retorna ChatInfo do cache; em caso de ausência/expiração chama fetch_chat()
+        (ex.: ev.get_chat) uma única vez e guarda o resultado. Se a busca falhar, uma entrada
+        expirada mantém o título conhecido e só renova o timestamp.
+        """
+        info = self.get(chat_id)
+        if info is not None:
+            return info
+        title = None
+        if fetch_chat is not None:
+            try:
+                chat = await fetch_chat()
+                title = getattr(chat, 'title', None)
+            except Exception as e:
+                logger.debug(f"ChatRegistry: falha ao buscar chat {chat_id}", exc_info=e)
+        if not title:
+            with self._lock:
+                stale = self._chats.get(bare_chat_id(chat_id))
+            if stale is not None:
+                title = stale.title
+        return self.set_title(chat_id, title)
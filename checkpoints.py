@@ -0,0 +1,270 @@
+# checkpoints.py
+
+import json
+import os
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import CATCHUP_MAX_MESSAGES
+from chat_registry import bare_chat_id
+from pipeline import album_caption
+from log_setup import correlation
+
+logger = logging.getLogger(__name__)
+CHECKPOINT_FILE = "checkpoints.json"
+
+class Checkpoints:
+    """
+    Último message_id processado por grupo, persistido em checkpoints.json.
+    Permite recuperar, no startup, as mensagens postadas enquanto o bot estava fora.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_FILE):
+        self.path = path
+        self._last: Dict[int, int] = {}
+        # ids reivindicados nesta sessão acima do checkpoint (podados quando ele avança)
+        self._claimed: Dict[int, Set[int]] = {}
+        # mensagens cuja gravação falhou: o checkpoint do grupo não passa delas
+        self._failed: Dict[int, Set[int]] = {}
+        # maior id gravado enquanto o checkpoint estava segurado por uma falha
+        self._held: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._last = {int(k): int(v) for k, v in data.items()}
+            logger.debug(f"{self.path} carregado com {len(self._last)} grupos.")
+        except Exception as e:
+            logger.error(f"Erro ao carregar {self.path}", exc_info=e)
+
+    def save(self) -> None:
+        with self._lock:
+            data = {str(k): v for k, v in self._last.items()}
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        except Exception as e:
+            logger.error(f"Erro ao salvar {self.path}", exc_info=e)
+
+    def get(self, chat_id) -> Optional[int]:
+        with self._lock:
+            return self._last.get(bare_chat_id(chat_id))
+
+    def is_processed(self, chat_id, msg_id: int) -> bool:
+        last = self.get(chat_id)
+        return last is not None and msg_id <= last
+
+    def claim(self, chat_id, msg_id: int) -> bool:
+        """
+        Reivindica a mensagem para processamento nesta sessão. Retorna False se ela já foi
+        reivindicada antes (ex.: catch-up e evento ao vivo vendo a mesma mensagem).
+        """
+        key = bare_chat_id(chat_id)
+        with self._lock:
+            claimed = self._claimed.setdefault(key, set())
+            if msg_id in claimed:
+                return False
+            claimed.add(msg_id)
+        return True
+
+    def release(self, chat_id, msg_id: int) -> None:
+        """
+        Desfaz o claim (ex.: mensagem adiada), para que um novo catch-up possa reprocessar.
+        """
+        with self._lock:
+            self._claimed.get(bare_chat_id(chat_id), set()).discard(msg_id)
+
+    def fail(self, chat_id, msg_id: int) -> None:
+        """
+        A gravação da mensagem falhou: desfaz o claim e segura o checkpoint do grupo antes
+        dela, mesmo que mensagens posteriores sejam gravadas, até ela ser processada.
+        """
+        key = bare_chat_id(chat_id)
+        with self._lock:
+            self._claimed.get(key, set()).discard(msg_id)
+            self._failed.setdefault(key, set()).add(msg_id)
+
+    def update(self, chat_id, msg_id: int, save: bool = True) -> None:
+        """
+        Avança o checkpoint do grupo (nunca retrocede, nem passa de uma mensagem que falhou).
+        """
+        key = bare_chat_id(chat_id)
+        with self._lock:
+            failed = self._failed.get(key)
+            if failed:
+                failed.discard(msg_id)
+                if failed:
+                    self._held[key] = max(self._held.get(key, 0), msg_id)
+                    msg_id = min(msg_id, min(failed) - 1)
+                else:
+                    msg_id = max(msg_id, self._held.pop(key, 0))
+            if msg_id <= self._last.get(key, 0):
+                return
+            self._last[key] = msg_id
+            claimed = self._claimed.get(key)
+            if claimed:
+                self._claimed[key] = {i for i in claimed if i > msg_id}
+        if save:
+            self.save()
+
+async def _fetch_gap(client, chat, checkpoints: Checkpoints, max_messages: int) -> List:
+    """
+    Busca as mensagens do grupo posteriores ao checkpoint (mais antigas primeiro).
+    Sem checkpoint, apenas marca a última mensagem atual como ponto de partida.
+    """
+    last = checkpoints.get(chat)
+    try:
+        if last is None:
+            latest = await client.get_messages(chat, limit=1)
+            if latest:
+                checkpoints.update(chat, latest[0].id, save=False)
+            logger.info(f"Catch-up: grupo {chat} sem checkpoint; iniciando a partir da mensagem atual")
+            return []
+        msgs = []
+        async for msg in client.iter_messages(chat, min_id=last, reverse=True, limit=max_messages):
+            msgs.append(msg)
+        if len(msgs) >= max_messages:
+            logger.warning(f"Catch-up: grupo {chat} atingiu o limite de {max_messages} mensagens")
+        return msgs
+    except Exception as e:
+        logger.error(f"Catch-up: falha ao buscar mensagens do grupo {chat}", exc_info=e)
+        return []
+
+def group_albums(messages: List) -> List[List]:
+    """
+    Agrupa as mensagens de um mesmo álbum (grouped_id), na ordem da primeira de cada grupo;
+    mensagens avulsas viram grupos de um.
+    """
+    groups: List[List] = []
+    index: Dict[Tuple[int, int], int] = {}
+    for m in messages:
+        gid = getattr(m, 'grouped_id', None)
+        if gid is None:
+            groups.append([m])
+            continue
+        key = (bare_chat_id(m.chat_id), gid)
+        if key in index:
+            groups[index[key]].append(m)
+        else:
+            index[key] = len(groups)
+            groups.append([m])
+    return groups
+
+async def _handle_group(pipeline, group: List, ocr_by_msg: Dict, handled: List) -> List[list]:
+    """
+    Parse (sem gravar) de uma mensagem avulsa ou de um álbum com o OCR já feito; registra em
+    handled o que for preciso para guardar o estado da mensagem depois da gravação em lote.
+    """
+    msg = group[0]
+    if len(group) == 1:
+        ocr_text = ocr_by_msg[(msg.chat_id, msg.id)]
+        rows = await pipeline.handle(msg.raw_text or "", msg.chat_id, msg.date, message=msg,
+                                     ocr_text=ocr_text, fetch_chat=msg.get_chat, write=False)
+        handled.append((msg, msg.raw_text or "", ocr_text, None, 0, rows))
+        return rows
+    group, msg, raw = album_caption(group)
+    ocr_texts = [ocr_by_msg[(m.chat_id, m.id)] for m in group]
+    rows = await pipeline.handle_album(group, fetch_chat=msg.get_chat, ocr_texts=ocr_texts, write=False)
+    handled.append((msg, raw, "", ocr_texts, group.index(msg), rows))
+    return rows
+
+async def catch_up(client, pipeline, checkpoints: Checkpoints, chats, max_messages: int = CATCHUP_MAX_MESSAGES,
+                   ocr_concurrency: int = 4, dispatch=None) -> int:
+    """
+    Recupera as mensagens perdidas de todos os grupos em paralelo, faz OCR concorrente,
+    processa em ordem cronológica pelo pipeline e grava tudo num único lote.
+    Álbuns (grouped_id) são processados juntos, como no handler ao vivo.
+    dispatch: corrotina opcional (lista de mensagens: avulsa ou álbum) → None que substitui
+    OCR/parse (ex.: enfileirar para os workers); nesse caso retorna o número de mensagens despachadas.
+    Retorna o número de linhas gravadas.
+    O checkpoint só avança depois da gravação (ou do despacho) bem-sucedida: na primeira falha
+    de um grupo ele para ali, e as mensagens restantes desse grupo ficam para o próximo catch-up.
+    """
+    gaps = await asyncio.gather(*[_fetch_gap(client, chat, checkpoints, max_messages) for chat in chats])
+    messages = sorted((m for gap in gaps for m in gap if checkpoints.claim(m.chat_id, m.id)),
+                      key=lambda m: (m.date, m.id))
+    if not messages:
+        checkpoints.save()
+        logger.info("Catch-up: nenhuma mensagem pendente")
+        return 0
+    logger.info(f"Catch-up: {len(messages)} mensagens pendentes em {len(chats)} grupos")
+
+    groups = group_albums(messages)
+    if dispatch is not None:
+        failed: Set[int] = set()
+        sent = 0
+        for group in groups:
+            chat = bare_chat_id(group[0].chat_id)
+            if chat not in failed:
+                try:
+                    await dispatch(group)
+                except Exception:
+                    logger.error(f"Catch-up: erro ao despachar mensagem {group[0].id} do grupo {group[0].chat_id}; "
+                                 f"checkpoint do grupo parado antes dela", exc_info=True)
+                    failed.add(chat)
+                    for msg in group:
+                        checkpoints.fail(msg.chat_id, msg.id)
+                    continue
+                else:
+                    for msg in group:
+                        checkpoints.update(msg.chat_id, msg.id, save=False)
+                    sent += len(group)
+                    continue
+            for msg in group:
+                checkpoints.release(msg.chat_id, msg.id)
+        checkpoints.save()
+        logger.info(f"Catch-up concluído: {sent} mensagens despachadas"
+                    + (f", {len(messages) - sent} adiadas ({len(failed)} grupo(s) com falha)" if failed else ""))
+        return sent
+
+    sem = asyncio.Semaphore(ocr_concurrency)
+
+    async def _ocr(msg):
+        async with sem:
+            return await pipeline.ocr(msg)
+
+    ocr_by_msg = dict(zip(((m.chat_id, m.id) for m in messages), await asyncio.gather(*[_ocr(m) for m in messages])))
+
+    all_rows = []
+    handled = []
+    for group in groups:
+        msg = group[0]
+        try:
+            with correlation(msg.chat_id, msg.id):
+                rows = await _handle_group(pipeline, group, ocr_by_msg, handled)
+            all_rows.extend(rows)
+        except Exception:
+            # erro de parse se repetiria a cada tentativa: a mensagem conta como processada
+            logger.error(f"Catch-up: erro ao processar mensagem {msg.id} do grupo {msg.chat_id}", exc_info=True)
+
+    if all_rows and pipeline.sink is not None:
+        with pipeline.timer.stage("write"):
+            ids = await pipeline.sink.write(all_rows)
+        # sinks devolvem os ids gravados (vazio em falha) ou None quando não têm ids
+        if ids is not None and len(ids) != len(all_rows):
+            pipeline.forget(all_rows, save=True)
+            for msg in messages:
+                checkpoints.fail(msg.chat_id, msg.id)
+            checkpoints.save()
+            logger.error(f"Catch-up: falha ao gravar {len(all_rows)} linhas; checkpoints mantidos para "
+                         f"{len(messages)} mensagens serem recuperadas no próximo catch-up")
+            return 0
+        # ids do lote na mesma ordem das linhas: cada mensagem fica com a sua fatia (edições)
+        if ids:
+            pos = 0
+            for msg, raw, ocr_text, ocr_texts, caption_pos, rows in handled:
+                pipeline.remember(msg, raw, ocr_text, rows, ids[pos:pos + len(rows)], ocr_texts=ocr_texts,
+                                  caption_pos=caption_pos)
+                pos += len(rows)
+    for msg in messages:
+        checkpoints.update(msg.chat_id, msg.id, save=False)
+    checkpoints.save()
+    logger.info(f"Catch-up concluído: {len(all_rows)} linhas gravadas")
+    return len(all_rows)
@@ -4,15 +4,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import sys
 import logging
 import re
 
-# Logging global
+# Logging global (log_setup.py): escrita numa thread de fundo, texto ou JSON
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()          # "text" ou "json"
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1").lower() in ("1", "true", "yes")
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")                       # ex.: "pipeline=0.1,ocr_utils=0.25"
+from log_setup import setup_logging
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_ASYNC, LOG_SAMPLE)
 logger = logging.getLogger(__name__)
 
 # ─── Telegram API ───────────────────────────────────────────
@@ -23,6 +25,13 @@ except:
 API_HASH = os.getenv("TG_API_HASH", "")
 if not API_ID or not API_HASH:
     logger.warning("TG_API_ID ou TG_API_HASH não definidos ou inválidos")
+# Sessão reaproveitada entre reinícios (session.session)
+SESSION_NAME = os.getenv("TG_SESSION", "session")
+# Login sem input(): usados só quando ainda não há sessão válida
+TG_PHONE = os.getenv("TG_PHONE", "")
+TG_PASSWORD = os.getenv("TG_2FA_PASSWORD", "")
+# HEADLESS=1: nunca pede nada no terminal (padrão: quando stdin não é um terminal)
+HEADLESS = os.getenv("HEADLESS", "" if sys.stdin and sys.stdin.isatty() else "1").lower() in ("1", "true", "yes")
 
 # ─── Banca e escalas ────────────────────────────────────────
 try:
@@ -30,7 +39,16 @@ try:
 except:
     BANK_TOTAL = 4000.0
 
-# UNIT_SCALES: mapeia group_id (int) → escala (int)
+# Regras recarregáveis a quente (rules.py): UNIT_SCALES, GROUP_SETTINGS, DEFAULT_SCALE e as
+# heurísticas abaixo são só os padrões; o arquivo RULES_FILE (JSON) sobrescreve o que definir.
+RULES_FILE = os.getenv("RULES_FILE", "rules.json")
+# Intervalo (s) mínimo entre checagens do mtime do arquivo de regras
+try:
+    RULES_RECHECK = float(os.getenv("RULES_RECHECK", "2"))
+except:
+    RULES_RECHECK = 2.0
+
+# UNIT_SCALES: mapeia group_id (int) → escala (int); as chaves são os grupos monitorados
 UNIT_SCALES = {
     # Ajuste conforme seus grupos
     2625305937: 150,   # Arrudex
@@ -43,25 +61,103 @@ UNIT_SCALES = {
     2455542600: 100,   # Peixe Esperto
 }
 DEFAULT_SCALE = int(os.getenv("DEFAULT_SCALE", "100"))
+# Grupos monitorados padrão; em execução vale rules.current().monitored
 MONITORADOS = list(UNIT_SCALES.keys())
-logger.info(f"Grupos monitorados: {MONITORADOS}")
+
+# GROUP_SETTINGS: configurações extras por group_id (int) → dict
+GROUP_SETTINGS = {
+    # 2625305937: {"bookmaker_padrao": "Bet365"},
+    # Templates de legenda (ver caption_templates.py), ex.:
+    # 2625305937: {"templates": [r"(?P<home>.+?) x (?P<away>.+?) - (?P<market>.+?) Odd (?P<odd>[\d.,]+) Stake (?P<stake>[\d.,]+)%"]},
+}
+
+# Templates de legenda aprendidos do histórico: mínimo de mensagens no mesmo formato
+# e quantas linhas recentes do BetStore analisar no startup
+try:
+    TEMPLATE_MIN_SUPPORT = int(os.getenv("TEMPLATE_MIN_SUPPORT", "5"))
+except:
+    TEMPLATE_MIN_SUPPORT = 5
+try:
+    TEMPLATE_LEARN_ROWS = int(os.getenv("TEMPLATE_LEARN_ROWS", "20000"))
+except:
+    TEMPLATE_LEARN_ROWS = 20000
+
+# Tempo (s) até os metadados de um chat em cache serem considerados velhos
+try:
+    CHAT_REGISTRY_TTL = float(os.getenv("CHAT_REGISTRY_TTL", "21600"))
+except:
+    CHAT_REGISTRY_TTL = 21600.0
+
+# Mensagens recentes com estado guardado para tratar edições (edit_cache.py)
+try:
+    EDIT_CACHE_SIZE = int(os.getenv("EDIT_CACHE_SIZE", "5000"))
+except:
+    EDIT_CACHE_SIZE = 5000
+
+# Máximo de mensagens recuperadas por grupo no catch-up após queda/reinício
+try:
+    CATCHUP_MAX_MESSAGES = int(os.getenv("CATCHUP_MAX_MESSAGES", "1000"))
+except:
+    CATCHUP_MAX_MESSAGES = 1000
 
 # ─── Google Sheets ─────────────────────────────────────────
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID", "")
 SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE", "service_account.json")
 NEW_TAB = os.getenv("NEW_TAB_NAME", "APOSTAS_BOT")
 
+# Rotação de abas: "month" (APOSTAS_BOT_2026_10), "rows" (APOSTAS_BOT_001, ...) ou "none"
+TAB_ROTATION = os.getenv("TAB_ROTATION", "month").lower()
+try:
+    TAB_MAX_ROWS = int(os.getenv("TAB_MAX_ROWS", "20000"))
+except:
+    TAB_MAX_ROWS = 20000
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# ─── Store local (SQLite) ──────────────────────────────────
+BET_STORE_FILE = os.getenv("BET_STORE_FILE", "bets.sqlite3")
+try:
+    MIRROR_INTERVAL = float(os.getenv("MIRROR_INTERVAL", "5"))
+except:
+    MIRROR_INTERVAL = 5.0
+
+# Processos de OCR/parse (workers.py); 0 = tudo no processo do bot
+try:
+    WORKERS = int(os.getenv("WORKERS", "0"))
+except:
+    WORKERS = 0
+# Segundos até um job "running" sem conclusão voltar para a fila
+try:
+    JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+except:
+    JOB_TIMEOUT = 300.0
+
+# Linhas por bloco na carga do histórico (HistoricalAnalyzer)
+try:
+    HISTORY_CHUNK_ROWS = int(os.getenv("HISTORY_CHUNK_ROWS", "5000"))
+except:
+    HISTORY_CHUNK_ROWS = 5000
+
+# Mercados distintos mantidos no cache LRU do canonicalizador (market_utils)
+try:
+    MARKET_CACHE_SIZE = int(os.getenv("MARKET_CACHE_SIZE", "4096"))
+except:
+    MARKET_CACHE_SIZE = 4096
+
+# ─── Jogos do dia (teams_cache.json) ───────────────────────
+# Score mínimo (0-100, rapidfuzz) para casar um time lido com um jogo do dia
+try:
+    FIXTURE_MATCH_SCORE = float(os.getenv("FIXTURE_MATCH_SCORE", "85"))
+except:
+    FIXTURE_MATCH_SCORE = 85.0
+
+# ─── Liquidação (settlement.py) ────────────────────────────
+# Arquivo local de resultados dos jogos (placar final; escanteios/cartões opcionais)
+RESULTS_FILE = os.getenv("RESULTS_FILE", "results.json")
+
 # ─── OCR / Tesseract ────────────────────────────────────────
 TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
 TESSDATA_PREFIX = os.getenv("TESSDATA_PREFIX", "")
-try:
-    import pytesseract
-    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
-    if TESSDATA_PREFIX:
-        os.environ.setdefault('TESSDATA_PREFIX', TESSDATA_PREFIX)
-    logger.debug(f"Tesseract configurado: cmd={TESSERACT_CMD}, tessdata_prefix={TESSDATA_PREFIX}")
-except ImportError:
-    logger.warning("pytesseract não instalado; OCR falhará")
+# pytesseract é importado e configurado sob demanda em ocr_utils (primeiro OCR)
 
 # ─── Heurísticas ───────────────────────────────────────────
 COMPETITIONS = [
@@ -1,29 +1,48 @@
 # dedup_utils.py
+"""
+Conjunto de bet_keys já vistas (seen.json) e reconstrução rápida a partir da planilha:
+só as colunas bet_key/data_hora são lidas (um batch_get por aba + arquivo local), nunca
+get_all_values. No startup, sync_seen compara o store com o número de linhas da planilha
+e reconstrói o seen se seen.json estiver ausente/corrompido ou se as contagens divergirem.
+
+Uso (reconstrução manual):
+    python dedup_utils.py --rebuild
+"""
 
-import json
 import os
+import sys
+import json
+import time
 import hashlib
 import logging
+import argparse
+from typing import List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 SEEN_FILE = "seen.json"
+DEDUP_COLUMNS = ["bet_key", "data_hora"]
+
+def read_seen() -> Optional[set]:
+    """
+    Conteúdo de seen.json, ou None se o arquivo não existir ou estiver corrompido.
+    """
+    if not os.path.exists(SEEN_FILE):
+        return None
+    try:
+        with open(SEEN_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, (list, dict)):
+            raise ValueError(f"esperada uma lista, veio {type(data).__name__}")
+        seen = set(data)
+        logger.debug("seen.json carregado com %d chaves.", len(seen))
+        return seen
+    except Exception as e:
+        logger.error("Erro ao carregar seen.json (arquivo corrompido?)", exc_info=e)
+        return None
 
 def load_seen():
-    if os.path.exists(SEEN_FILE):
-        try:
-            with open(SEEN_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    seen = set(data)
-                else:
-                    seen = set(data)
-            logger.debug(f"seen.json carregado com {len(seen)} chaves.")
-            return seen
-        except Exception as e:
-            logger.error("Erro ao carregar seen.json", exc_info=e)
-            return set()
-    else:
-        return set()
+    seen = read_seen()
+    return seen if seen is not None else set()
 
 def save_seen(seen_set):
     try:
@@ -33,6 +52,55 @@ def save_seen(seen_set):
     except Exception as e:
         logger.error("Erro ao salvar seen.json", exc_info=e)
 
+def sheet_dedup_columns(sheet) -> List[Tuple[str, str]]:
+    """
+    (bet_key, data_hora) de cada linha do histórico da planilha (TabRotator.column_values).
+    """
+    return [r for r in sheet.column_values(DEDUP_COLUMNS) if any(r)]
+
+def rebuild_seen(pairs: List[Tuple[str, str]], store=None, persist: bool = True,
+                 keep: Optional[set] = None) -> set:
+    """
+    Monta o seen a partir das colunas lidas da planilha (+ chaves do store e de keep, ex.: o
+    seen.json atual) e grava seen.json uma vez, já com tudo junto.
+    """
+    t0 = time.perf_counter()
+    seen = {k for k, _ in pairs if k}
+    if store is not None:
+        seen |= store.bet_keys()
+    if keep:
+        seen |= keep
+    dates = [d for _, d in pairs if d]
+    if persist:
+        save_seen(seen)
+    logger.info(f"seen reconstruído: {len(seen)} chaves de {len(pairs)} linhas da planilha"
+                + (f" ({min(dates)} → {max(dates)})" if dates else "")
+                + f" em {time.perf_counter() - t0:.2f}s")
+    return seen
+
+def sync_seen(sheet, store, persist: bool = True) -> set:
+    """
+    Startup: carrega seen.json e confere o store (linhas espelhadas) contra o número de linhas
+    da planilha; reconstrói o seen se o arquivo estiver ausente/corrompido ou se divergirem.
+    persist=False reconstrói só em memória (seen.json intacto).
+    """
+    seen = read_seen()
+    t0 = time.perf_counter()
+    pairs = sheet_dedup_columns(sheet)
+    # mesmo critério dos dois lados: só linhas com bet_key e data_hora preenchidos
+    n_sheet = sum(1 for k, d in pairs if k and d)
+    n_store = store.count(mirrored=True, non_empty=DEDUP_COLUMNS)
+    logger.info(f"Dedup: {n_sheet} linhas na planilha, {n_store} espelhadas no store, "
+                f"{'sem' if seen is None else len(seen)} chaves em {SEEN_FILE} "
+                f"(leitura em {time.perf_counter() - t0:.2f}s)")
+    if seen is not None and n_sheet == n_store:
+        return seen | store.bet_keys()
+    if seen is None:
+        logger.warning(f"Dedup: {SEEN_FILE} ausente ou inválido; reconstruindo a partir da planilha")
+    else:
+        logger.warning(f"Dedup: store ({n_store}) e planilha ({n_sheet}) divergem; reconstruindo o seen")
+    return rebuild_seen(pairs, store, persist=persist, keep=seen)
+
 def generate_bet_key(home: str, away: str, mercado: str, odd) -> str:
     """
     Gera chave única baseada em campos da aposta, para deduplicação.
@@ -41,3 +109,24 @@ def generate_bet_key(home: str, away: str, mercado: str, odd) -> str:
     odd_str = str(odd) if odd is not None else ""
     s = f"{home}|{away}|{mercado}|{odd_str}"
     return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Reconstrói seen.json a partir das colunas bet_key/data_hora da planilha")
+    ap.add_argument("--rebuild", action="store_true", help="reconstrói mesmo se as contagens baterem")
+    args = ap.parse_args(argv)
+
+    from sheets_utils import open_spreadsheet
+    from sheet_rotation import TabRotator
+    from bet_store import BetStore
+    from telegram_bot import ensure_service_account_file
+
+    ensure_service_account_file()
+    sheet = TabRotator(open_spreadsheet())
+    store = BetStore()
+    t0 = time.perf_counter()
+    seen = rebuild_seen(sheet_dedup_columns(sheet), store) if args.rebuild else sync_seen(sheet, store)
+    print(f"seen: {len(seen)} chaves ({time.perf_counter() - t0:.2f}s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# edit_cache.py
+"""
+Estado por mensagem processada (legenda, texto OCR, mídia, linhas geradas e ids no BetStore),
+para tratar edições sem reprocessar nada: quando o tipster corrige odd/stake, só a legenda
+nova é parseada, o OCR em cache é reaproveitado (se a mídia não mudou) e apenas as linhas
+afetadas são regravadas no lugar (store + Sheets).
+
+Cache limitado (LRU, EDIT_CACHE_SIZE mensagens); edições de mensagens fora dele são ignoradas.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from config import EDIT_CACHE_SIZE
+from chat_registry import bare_chat_id
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class MessageState:
+    raw: str
+    ocr_text: str
+    media_id: Optional[int]
+    rows: List[list]
+    ids: List[int] = field(default_factory=list)
+    ocr_texts: Optional[List[str]] = None    # álbum: OCR de cada imagem
+    caption_pos: int = 0                     # álbum: posição da imagem da legenda em ocr_texts
+
+def media_id(message) -> Optional[int]:
+    """
+    Id da foto/documento da mensagem (muda quando a mídia é trocada numa edição).
+    """
+    if message is None:
+        return None
+    media = getattr(message, 'photo', None) or getattr(message, 'document', None)
+    return getattr(media, 'id', None)
+
+class EditCache:
+    """
+    LRU (chat, msg_id) → MessageState.
+    """
+
+    def __init__(self, max_size: int = EDIT_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[tuple, MessageState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, chat_id, msg_id: int, state: MessageState) -> None:
+        key = (bare_chat_id(chat_id), msg_id)
+        with self._lock:
+            self._items[key] = state
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, chat_id, msg_id: int) -> Optional[MessageState]:
+        key = (bare_chat_id(chat_id), msg_id)
+        with self._lock:
+            state = self._items.get(key)
+            if state is not None:
+                self._items.move_to_end(key)
+            return state
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
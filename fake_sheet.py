@@ -0,0 +1,251 @@
+# fake_sheet.py
+
+import re
+import time
+import random
+import logging
+import threading
+from collections import deque
+from typing import List, Optional
+
+from sheets_utils import col_to_index, index_to_col
+
+logger = logging.getLogger(__name__)
+
+class FakeAPIError(Exception):
+    """
+    Erro simulado da API do Sheets. Expõe `code` como gspread.exceptions.APIError
+    (429 = quota excedida, 5xx = falha do servidor).
+    """
+
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(f"[{code}] {message or 'erro simulado'}")
+        self.code = code
+
+class FakeWorksheet:
+    """
+    Worksheet em memória com o subconjunto da API do gspread usado pelo bot.
+    Serve para replay/benchmarks sem tocar planilhas reais.
+
+    latency: segundos de espera por chamada à "API"
+    row_latency: segundos extras por linha escrita/lida
+    quota_per_minute: limite de chamadas por janela de 60s (None = sem limite) → FakeAPIError(429)
+    fail_rate: probabilidade de FakeAPIError(503) por chamada
+    fail_next(..., committed=True): o append é gravado e só depois responde com erro (5xx
+    depois do commit no servidor), para exercitar a detecção de append duplicado
+    """
+
+    def __init__(self, title: str = "APOSTAS_BOT", rows: List[list] = None, latency: float = 0.0,
+                 row_latency: float = 0.0, quota_per_minute: Optional[int] = None, fail_rate: float = 0.0,
+                 seed: Optional[int] = None, row_count: int = 2000, col_count: int = 30):
+        self.title = title
+        self._rows: List[List[str]] = [list(map(cell_value, r)) for r in (rows or [])]
+        self.latency = latency
+        self.row_latency = row_latency
+        self.quota_per_minute = quota_per_minute
+        self.fail_rate = fail_rate
+        self.row_count = max(row_count, len(self._rows))
+        self.col_count = col_count
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._call_times = deque()
+        self._forced_failures = deque()
+        self._lock = threading.Lock()
+
+    # ─── Injeção de falhas ──────────────────────────────────
+    def fail_next(self, n: int = 1, code: int = 503, committed: bool = False) -> None:
+        """
+        Faz as próximas n chamadas falharem com FakeAPIError(code). committed=True: em append,
+        as linhas são gravadas antes do erro.
+        """
+        with self._lock:
+            self._forced_failures.extend([(code, committed)] * n)
+
+    def _api_call(self, n_rows: int = 0, append: bool = False) -> Optional[int]:
+        """
+        Conta a chamada, aplica latência e levanta a falha sorteada/forçada. Em append, uma
+        falha forçada com committed=True é devolvida (o chamador grava e depois levanta).
+        """
+        late = None
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            code = None
+            if self._forced_failures:
+                code, committed = self._forced_failures.popleft()
+                if committed and append:
+                    code, late = None, code
+            elif self.quota_per_minute is not None:
+                while self._call_times and now - self._call_times[0] > 60:
+                    self._call_times.popleft()
+                if len(self._call_times) >= self.quota_per_minute:
+                    code = 429
+                else:
+                    self._call_times.append(now)
+            if code is None and self.fail_rate and self._rng.random() < self.fail_rate:
+                code = 503
+            if code is not None or late is not None:
+                self.errors += 1
+        delay = self.latency + self.row_latency * n_rows
+        if delay:
+            time.sleep(delay)
+        if code is not None:
+            raise FakeAPIError(code, "Quota exceeded" if code == 429 else "Service unavailable")
+        return late
+
+    # ─── Leitura ────────────────────────────────────────────
+    def get_all_values(self) -> List[List[str]]:
+        self._api_call(len(self._rows))
+        return [list(r) for r in self._rows]
+
+    def row_values(self, index: int) -> List[str]:
+        self._api_call(1)
+        if 1 <= index <= len(self._rows):
+            return list(self._rows[index - 1])
+        return []
+
+    def col_values(self, col: int) -> List[str]:
+        self._api_call(len(self._rows))
+        out = [r[col - 1] if len(r) >= col else "" for r in self._rows]
+        while out and out[-1] == "":
+            out.pop()
+        return out
+
+    def _read_range(self, a1: str) -> List[List[str]]:
+        r1, c1, r2, c2 = parse_a1_range(a1, self.row_count, self.col_count)
+        out = []
+        for r in self._rows[r1 - 1:r2]:
+            cells = r[c1 - 1:c2]
+            while cells and cells[-1] == "":
+                cells = cells[:-1]
+            out.append(list(cells))
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def get(self, range_name: str, **kwargs) -> List[List[str]]:
+        values = self._read_range(range_name)
+        self._api_call(len(values))
+        return values
+
+    def batch_get(self, ranges: List[str], **kwargs) -> List[List[List[str]]]:
+        values = [self._read_range(r) for r in ranges]
+        self._api_call(sum(len(v) for v in values))
+        return values
+
+    # ─── Escrita ────────────────────────────────────────────
+    def _grow(self) -> None:
+        if len(self._rows) > self.row_count:
+            self.row_count = len(self._rows)
+
+    def _appended(self, first: int, n: int) -> dict:
+        """
+        Resposta no formato da API (só o que o bot lê): intervalo escrito pelo append.
+        """
+        last_col = max((len(r) for r in self._rows[first - 1:]), default=1)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:{index_to_col(last_col)}{first + n - 1}",
+                            "updatedRows": n}}
+
+    def append_row(self, values: list, value_input_option: str = 'RAW', **kwargs) -> dict:
+        return self.append_rows([values], value_input_option, **kwargs)
+
+    def append_rows(self, values: List[list], value_input_option: str = 'RAW', **kwargs) -> dict:
+        late = self._api_call(len(values), append=True)
+        first = len(self._rows) + 1
+        self._rows.extend([cell_value(v) for v in row] for row in values)
+        self._grow()
+        if late is not None:
+            raise FakeAPIError(late, "Service unavailable (após gravar)")
+        return self._appended(first, len(values))
+
+    def insert_row(self, values: list, index: int = 1, **kwargs) -> None:
+        self._api_call(1)
+        self._rows.insert(index - 1, [cell_value(v) for v in values])
+        self._grow()
+
+    def _write_range(self, a1: str, values: List[list]) -> None:
+        r1, c1, _, _ = parse_a1_range(a1, self.row_count, self.col_count)
+        for i, row in enumerate(values):
+            r = r1 - 1 + i
+            while len(self._rows) <= r:
+                self._rows.append([])
+            target = self._rows[r]
+            for j, v in enumerate(row):
+                if v is None:
+                    continue  # como na API: célula None não é gravada
+                c = c1 - 1 + j
+                while len(target) <= c:
+                    target.append("")
+                target[c] = cell_value(v)
+        self._grow()
+
+    def update(self, range_name: str, values: List[list], **kwargs) -> None:
+        self._api_call(len(values))
+        self._write_range(range_name, values)
+
+    def batch_update(self, data: List[dict], **kwargs) -> None:
+        self._api_call(sum(len(d["values"]) for d in data))
+        for d in data:
+            self._write_range(d["range"], d["values"])
+
+    def add_rows(self, rows: int) -> None:
+        self._api_call()
+        self.row_count += rows
+
+class FakeSpreadsheet:
+    """
+    Planilha em memória com worksheets()/worksheet()/add_worksheet()/del_worksheet(), para usar com init_sheet.
+    Parâmetros extras (latency, fail_rate, ...) são repassados às abas criadas.
+    """
+
+    def __init__(self, **worksheet_kwargs):
+        self._worksheets: List[FakeWorksheet] = []
+        self._kwargs = worksheet_kwargs
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        return list(self._worksheets)
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        for ws in self._worksheets:
+            if ws.title == title:
+                return ws
+        raise KeyError(title)
+
+    def del_worksheet(self, worksheet: FakeWorksheet) -> None:
+        self._worksheets.remove(worksheet)
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kwargs) -> FakeWorksheet:
+        ws = FakeWorksheet(title=title, row_count=rows, col_count=cols, **self._kwargs)
+        self._worksheets.append(ws)
+        return ws
+
+def cell_value(v) -> str:
+    """
+    Converte valor para string como o Sheets devolve em get_all_values.
+    """
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    return str(v)
+
+_A1_CELL = re.compile(r'^([A-Za-z]*)(\d*)$')
+
+def parse_a1_range(a1: str, max_rows: int, max_cols: int):
+    """
+    Converte notação A1 ('A2:X100', 'A:A', 'C5', "'Aba'!A1:B2") em (r1, c1, r2, c2), 1-based, inclusivo.
+    """
+    if '!' in a1:
+        a1 = a1.split('!', 1)[1]
+    start, _, end = a1.partition(':')
+    end = end or start
+    m1 = _A1_CELL.match(start)
+    m2 = _A1_CELL.match(end)
+    if not m1 or not m2:
+        raise ValueError(f"Range A1 inválido: {a1}")
+    c1 = col_to_index(m1.group(1)) if m1.group(1) else 1
+    r1 = int(m1.group(2)) if m1.group(2) else 1
+    c2 = col_to_index(m2.group(1)) if m2.group(1) else max_cols
+    r2 = int(m2.group(2)) if m2.group(2) else max_rows
+    return r1, c1, r2, c2
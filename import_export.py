@@ -0,0 +1,329 @@
+# import_export.py
+"""
+Importa um export do Telegram Desktop (JSON ou HTML, com a pasta de fotos) para o BetStore,
+passando legendas e imagens pelo mesmo pipeline de parsing/OCR do bot (com os jogos do dia
+e os templates de legenda do bot). O export não traz o grouped_id dos álbuns: fotos seguidas
+do mesmo remetente no mesmo segundo são reagrupadas e parseadas juntas, como ao vivo.
+
+OCR roda em paralelo em todos os núcleos (ProcessPoolExecutor); o parse é sequencial
+para manter dedup/histórico consistentes. As linhas entram no store (fonte de verdade, com
+dedup contra as bet_keys já gravadas) como pendentes de espelho e vão para a aba atual do
+Sheets pelo SheetMirror/TabRotator. Com o bot rodando, use --no-mirror: o SheetMirror do bot
+envia as pendentes na próxima rodada (dois espelhos ao mesmo tempo duplicariam linhas).
+
+Uso:
+    python import_export.py ~/Downloads/ChatExport_2026-10-01/result.json
+    python import_export.py ~/Downloads/ChatExport_2026-10-01/messages.html --chat-id 2625305937
+    python import_export.py result.json --dry-run --workers 8
+    python import_export.py result.json --no-mirror         # bot rodando: ele espelha
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import asyncio
+import logging
+import argparse
+from html import unescape
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+
+from dedup_utils import load_seen, save_seen
+from chat_registry import ChatRegistry
+from ocr_utils import ocr_image
+from pipeline import BetPipeline, album_caption
+from checkpoints import group_albums
+
+logger = logging.getLogger(__name__)
+
+# máximo de fotos num álbum do Telegram
+ALBUM_MAX = 10
+
+class ExportMessage:
+    __slots__ = ("id", "chat_id", "date", "text", "photo", "sender", "grouped_id")
+
+    def __init__(self, id: int, chat_id: int, date: datetime, text: str, photo: Optional[str],
+                 sender: Optional[str] = None):
+        self.id = id
+        self.chat_id = chat_id
+        self.date = date
+        self.text = text
+        self.photo = photo
+        self.sender = sender
+        self.grouped_id: Optional[int] = None
+
+    @property
+    def raw_text(self) -> str:
+        # mesmo nome do Telethon, para album_caption/group_albums
+        return self.text
+
+def assign_albums(messages: List[ExportMessage]) -> int:
+    """
+    Reconstrói os álbuns (grouped_id = id da primeira foto): fotos com ids consecutivos, do
+    mesmo remetente (quando o export informa) e no mesmo segundo, até ALBUM_MAX e com no
+    máximo uma legenda. Retorna quantos álbuns foram formados.
+    """
+    albums = 0
+    prev: Optional[ExportMessage] = None
+    size = 0
+    captioned = False
+    for m in sorted(messages, key=lambda m: m.id):
+        m.grouped_id = None
+        if (prev is not None and m.photo and prev.photo and m.id == prev.id + 1
+                and m.date == prev.date and m.sender == prev.sender
+                and size < ALBUM_MAX and not (captioned and m.text)):
+            if prev.grouped_id is None:
+                prev.grouped_id = prev.id
+                albums += 1
+            m.grouped_id = prev.grouped_id
+            size += 1
+            captioned = captioned or bool(m.text)
+        else:
+            size = 1
+            captioned = bool(m.text)
+        prev = m
+    return albums
+
+def _marked_id(raw_id: int, chat_type: str) -> int:
+    """
+    Converte o id puro do export no chat_id "marcado" que o Telethon entrega nos eventos.
+    """
+    if chat_type and ("supergroup" in chat_type or "channel" in chat_type):
+        return int(f"-100{raw_id}")
+    return int(raw_id)
+
+def _flatten_text(text) -> str:
+    """
+    Campo "text" do export JSON: string ou lista de strings/entidades {"type", "text"}.
+    """
+    if isinstance(text, str):
+        return text
+    if isinstance(text, list):
+        return "".join(t if isinstance(t, str) else t.get("text", "") for t in text)
+    return ""
+
+def read_json_export(path: str, chat_id: Optional[int] = None):
+    """
+    Lê result.json. Retorna (título do chat, lista de ExportMessage com legenda ou foto).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    if chat_id is None:
+        chat_id = _marked_id(data.get("id", 0), data.get("type", ""))
+    msgs = []
+    for m in data.get("messages", []):
+        if m.get("type") != "message":
+            continue
+        text = _flatten_text(m.get("text"))
+        photo = m.get("photo")
+        if not text and not photo:
+            continue
+        if m.get("date_unixtime"):
+            date = datetime.fromtimestamp(int(m["date_unixtime"]), tz=timezone.utc)
+        else:
+            date = datetime.fromisoformat(m["date"]).replace(tzinfo=timezone.utc)
+        photo_path = os.path.join(base, photo) if photo and not photo.startswith("(") else None
+        msgs.append(ExportMessage(int(m["id"]), chat_id, date, text, photo_path, m.get("from_id")))
+    return data.get("name"), msgs
+
+_HTML_DATE = re.compile(r'(\d{2})\.(\d{2})\.(\d{4}) (\d{2}):(\d{2}):(\d{2})(?: UTC([+-]\d{2}):(\d{2}))?')
+
+def _parse_html_date(title: str) -> Optional[datetime]:
+    m = _HTML_DATE.search(title or "")
+    if not m:
+        return None
+    d, mo, y, h, mi, s = map(int, m.groups()[:6])
+    tz = timezone.utc
+    if m.group(7):
+        sign = -1 if m.group(7).startswith('-') else 1
+        tz = timezone(sign * timedelta(hours=abs(int(m.group(7))), minutes=int(m.group(8))))
+    return datetime(y, mo, d, h, mi, s, tzinfo=tz)
+
+class _ExportHTMLParser(HTMLParser):
+    """
+    Extrai id, data, texto e foto de cada <div class="message default"> do export HTML.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.messages: List[dict] = []
+        self.title: Optional[str] = None
+        self._cur: Optional[dict] = None
+        self._text_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        cls = a.get("class", "") or ""
+        if tag == "div":
+            if self._text_depth:
+                self._text_depth += 1
+            if "message" in cls.split() and "default" in cls.split():
+                self._cur = {"id": (a.get("id") or "").replace("message", ""), "text": [], "photo": None,
+                             "date": None}
+                self.messages.append(self._cur)
+            elif self._cur is not None and "date" in cls.split() and "details" in cls.split():
+                self._cur["date"] = a.get("title")
+            elif self._cur is not None and cls == "text":
+                self._text_depth = 1
+            elif "text" in cls.split() and "bold" in cls.split() and self.title is None:
+                self._in_title = True
+        elif tag == "a" and self._cur is not None and "photo_wrap" in cls:
+            self._cur["photo"] = a.get("href")
+        elif tag == "br" and self._text_depth:
+            self._cur["text"].append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "div":
+            if self._text_depth:
+                self._text_depth -= 1
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._text_depth and self._cur is not None:
+            self._cur["text"].append(data)
+        elif self._in_title:
+            self.title = (self.title or "") + data.strip()
+
+    def handle_entityref(self, name):
+        self.handle_data(unescape(f"&{name};"))
+
+    def handle_charref(self, name):
+        self.handle_data(unescape(f"&#{name};"))
+
+def read_html_export(path: str, chat_id: int):
+    """
+    Lê messages.html, messages2.html, ... da pasta do export.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    files = sorted(glob.glob(os.path.join(base, "messages*.html")),
+                   key=lambda p: int(re.sub(r'\D', '', os.path.basename(p)) or 1))
+    title = None
+    msgs = []
+    for fp in files:
+        parser = _ExportHTMLParser()
+        with open(fp, 'r', encoding='utf-8') as f:
+            parser.feed(f.read())
+        title = title or parser.title
+        for m in parser.messages:
+            text = "".join(m["text"]).strip()
+            photo = os.path.join(base, m["photo"]) if m["photo"] else None
+            date = _parse_html_date(m["date"])
+            if (not text and not photo) or date is None or not m["id"].lstrip('-').isdigit():
+                continue
+            msgs.append(ExportMessage(int(m["id"]), chat_id, date, text, photo))
+    return title, msgs
+
+def ocr_all(paths: List[Optional[str]], workers: int) -> List[str]:
+    """
+    OCR de todas as fotos em paralelo (um processo por núcleo). Posições sem foto retornam "".
+    """
+    todo = [(i, p) for i, p in enumerate(paths) if p and os.path.exists(p)]
+    out = [""] * len(paths)
+    if not todo:
+        return out
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        chunksize = max(1, len(todo) // (workers * 8))
+        for (i, _), text in zip(todo, ex.map(ocr_image, [p for _, p in todo], chunksize=chunksize)):
+            out[i] = text or ""
+    return out
+
+def run_import(messages: List[ExportMessage], title: Optional[str], historical, workers: int,
+               keep_duplicates: bool = False, persist_seen: bool = True, seen: Optional[set] = None,
+               fixtures=None, templates=None) -> List[list]:
+    """
+    OCR paralelo + parse sequencial (álbuns num único parse, como no handler de Album).
+    fixtures/templates: os mesmos do bot (FixtureIndex e CaptionTemplates). Retorna as linhas
+    novas (já deduplicadas contra seen, por padrão seen.json).
+    """
+    if seen is None:
+        seen = load_seen()
+    registry = ChatRegistry(ttl=0)
+    pipeline = BetPipeline(historical, seen, registry, persist_seen=False, fixtures=fixtures, templates=templates)
+
+    t0 = time.perf_counter()
+    ocr_texts = ocr_all([m.photo for m in messages], workers)
+    t_ocr = time.perf_counter() - t0
+    logger.info(f"OCR de {sum(1 for m in messages if m.photo)} imagens em {t_ocr:.1f}s ({workers} processos)")
+
+    ocr_by_id = {m.id: t for m, t in zip(messages, ocr_texts)}
+    rows = []
+    t0 = time.perf_counter()
+    for group in group_albums(messages):
+        m = group[0]
+        info = registry.get(m.chat_id) or registry.set_title(m.chat_id, title)
+        try:
+            if len(group) == 1:
+                parsed = pipeline.parse_message(m.text, m.chat_id, m.date, ocr_text=ocr_by_id[m.id], chat_info=info)
+            else:
+                group, m, raw = album_caption(group)
+                parsed = pipeline.parse_message(raw, m.chat_id, m.date, chat_info=info,
+                                                ocr_texts=[ocr_by_id[g.id] for g in group])
+        except Exception:
+            logger.error(f"Erro ao processar mensagem {m.id}", exc_info=True)
+            continue
+        for row in parsed:
+            # row[1] = duplicate
+            if row[1] and not keep_duplicates:
+                continue
+            rows.append(row)
+    logger.info(f"Parse de {len(messages)} mensagens em {time.perf_counter() - t0:.1f}s → {len(rows)} linhas")
+    if persist_seen:
+        save_seen(seen)
+    return rows
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Importa export do Telegram Desktop para o store/planilha")
+    ap.add_argument("path", help="result.json ou messages.html do export")
+    ap.add_argument("--chat-id", type=int, help="chat_id do grupo (obrigatório para HTML)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos de OCR")
+    ap.add_argument("--keep-duplicates", action="store_true", help="grava também apostas já vistas (duplicate=TRUE)")
+    ap.add_argument("--dry-run", action="store_true", help="não grava no store, na planilha nem em seen.json")
+    ap.add_argument("--no-mirror", action="store_true",
+                    help="só grava no store; o SheetMirror do bot em execução envia ao Sheets")
+    args = ap.parse_args(argv)
+
+    if args.path.lower().endswith(".json"):
+        title, messages = read_json_export(args.path, args.chat_id)
+    else:
+        if args.chat_id is None:
+            ap.error("--chat-id é obrigatório para export HTML")
+        title, messages = read_html_export(args.path, args.chat_id)
+    messages.sort(key=lambda m: (m.date, m.id))
+    albums = assign_albums(messages)
+    logger.info(f"Export '{title}': {len(messages)} mensagens com texto ou foto ({albums} álbuns)")
+
+    from bet_store import SheetMirror
+    from teams_cache import FixtureIndex
+    from telegram_bot import ensure_service_account_file, load_backends
+
+    ensure_service_account_file()
+    # mesmo startup do bot: TabRotator, store, histórico do store e seen conferido com o store
+    # (no dry-run sem importar a planilha no store nem regravar seen.json)
+    backends = load_backends(read_only=args.dry_run)
+    seen = backends.seen | backends.store.bet_keys()
+
+    rows = run_import(messages, title, backends.historical, args.workers, args.keep_duplicates,
+                      persist_seen=False, seen=seen, fixtures=FixtureIndex(), templates=backends.templates)
+    if args.dry_run:
+        print(f"[dry-run] {len(rows)} linhas seriam gravadas")
+        return 0
+    if rows:
+        # dedup=True: a coluna duplicate é recalculada contra o store (autoritativo)
+        backends.store.insert_rows(rows, mirrored=False, dedup=True)
+        save_seen(seen)
+        if not args.no_mirror:
+            n = asyncio.run(SheetMirror(backends.store, backends.sheet).flush())
+            logger.info(f"{n} linha(s) pendentes espelhadas na aba '{backends.sheet.title}'")
+    print(f"✅ {len(rows)} linhas importadas de {len(messages)} mensagens"
+          + (" (pendentes de espelho no Sheets)" if args.no_mirror and rows else ""))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# log_setup.py
+"""
+Logging fora do caminho quente: os handlers só enfileiram o LogRecord (QueueHandler) e uma
+thread de fundo (QueueListener) formata e escreve. Com mensagens de log no estilo
+logger.debug("... %s", valor), a interpolação só roda para records que passam do nível
+(no enfileiramento, para que argumentos mutáveis sejam registrados com o valor do momento).
+
+- LOG_FORMAT=json: um objeto JSON por linha (ts, level, logger, msg, corr, extras, exc)
+- correlation id por mensagem do Telegram ("chat:msg_id"), propagado por contextvars para
+  tarefas asyncio e asyncio.to_thread; vai no campo "corr" (JSON) ou entre colchetes (texto)
+- LOG_SAMPLE="pipeline=0.1,ocr_utils=0.25": fração das mensagens do Telegram cujos logs
+  DEBUG desses loggers são mantidos (decidido por correlation id, então uma mensagem amostrada
+  aparece inteira); INFO e acima nunca são amostrados
+"""
+
+import sys
+import copy
+import json
+import atexit
+import queue
+import logging
+import zlib
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s%(corr_tag)s: %(message)s"
+
+_correlation: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# atributos padrão do LogRecord; o resto veio de extra= e vai para o JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "corr", "corr_tag"}
+
+def correlation_id() -> Optional[str]:
+    return _correlation.get()
+
+@contextmanager
+def correlation(chat_id, msg_id=None):
+    """
+    Marca os logs emitidos dentro do bloco (inclusive em to_thread) com "chat:msg_id".
+    """
+    from chat_registry import bare_chat_id
+    try:
+        chat = bare_chat_id(chat_id)
+    except (TypeError, ValueError):
+        chat = chat_id
+    token = _correlation.set(f"{chat}:{msg_id}" if msg_id is not None else str(chat))
+    try:
+        yield
+    finally:
+        _correlation.reset(token)
+
+class CorrelationFilter(logging.Filter):
+    """
+    Copia o correlation id do contexto para o record (tem que rodar na thread de origem).
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        corr = _correlation.get()
+        record.corr = corr
+        record.corr_tag = f" [{corr}]" if corr else ""
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Mantém só uma fração (por logger) dos logs DEBUG, escolhida por correlation id.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name: str) -> Optional[float]:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate(record.name)
+        if rate is None:
+            return True
+        corr = getattr(record, "corr", None) or _correlation.get()
+        if corr is None:
+            return rate >= 1
+        return zlib.crc32(corr.encode()) % 10000 < rate * 10000
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        corr = getattr(record, "corr", None)
+        if corr:
+            event["corr"] = corr
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                event[key] = value
+        if record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que só interpola a mensagem na thread de origem: msg % args vira texto
+    antes de entrar na fila (listas/dicts passados como argumento podem mudar depois da
+    chamada de log), e o formatter, inclusive o traceback de exc_info, roda no listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def parse_sample(spec: str) -> Dict[str, float]:
+    """
+    "pipeline=0.1,ocr_utils=0.25" → {"pipeline": 0.1, "ocr_utils": 0.25}; entradas inválidas são ignoradas.
+    """
+    rates = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        try:
+            rates[name.strip()] = min(max(float(value), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+def setup_logging(level: str = "INFO", fmt: str = "text", use_queue: bool = True, sample: str = "") -> None:
+    """
+    Configura o logger raiz (substitui o basicConfig). Pode ser chamada de novo para trocar a
+    configuração; o listener anterior é esvaziado e parado.
+    """
+    global _listener
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    out = logging.StreamHandler(sys.stderr)
+    out.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    filters = [CorrelationFilter()]
+    rates = parse_sample(sample)
+    if rates:
+        filters.append(SamplingFilter(rates))
+
+    if use_queue:
+        q: "queue.SimpleQueue" = queue.SimpleQueue()
+        front = _DeferredQueueHandler(q)
+        _listener = logging.handlers.QueueListener(q, out, respect_handler_level=True)
+        _listener.start()
+    else:
+        front = out
+    for f in filters:
+        front.addFilter(f)
+    root.addHandler(front)
+    root.setLevel(level)
+
+def stop_logging() -> None:
+    """
+    Esvazia a fila e para a thread de escrita (chamado no atexit).
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
@@ -2,7 +2,7 @@ import re
 import unicodedata
 import logging
 from typing import Optional
-from config import BOOKMAKER_MAP
+import rules
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +17,10 @@ def get_canonical(raw_name: str) -> str:
     """
     Converte raw_name em forma canônica:
     - Strip de espaços e quebras
-    - Remove emojis/caracteres não ASCII
+    - Acentos viram a letra base ("Grêmio" → "Gremio"); emojis/demais não ASCII saem
     - Mapeamentos manuais
     """
-    s = raw_name.strip()
+    s = normalize_text(raw_name.strip())
     s = re.sub(r'[^\x00-\x7F]+', '', s)  # remove não ASCII
     s = ' '.join(s.split())
     mapping = {
@@ -29,28 +29,26 @@ def get_canonical(raw_name: str) -> str:
         "Real Madrid": "Real Madrid",
         # Adicione conforme necessário...
     }
-    if s in mapping:
-        return mapping[s]
-    s_norm = normalize_text(s)
-    return s_norm
+    return mapping.get(s, s)
 
 def normalize_bookmaker_from_url_or_text(text: str) -> Optional[str]:
     """
-    Detecta bookmaker a partir de URL ou texto livre, usando BOOKMAKER_MAP.
+    Detecta bookmaker a partir de URL ou texto livre, usando o mapa de casas das regras.
     """
     if not text:
         return None
+    bookmakers = rules.current().bookmaker_map
     # Extrai host de URLs
     urls = re.findall(r'https?://([^/\s]+)', text)
     for host in urls:
         host_lower = host.lower().replace('www.', '')
-        for key, name in BOOKMAKER_MAP.items():
+        for key, name in bookmakers:
             if key in host_lower:
                 logger.debug(f"normalize_bookmaker: encontrou '{key}' em host '{host_lower}' → '{name}'")
                 return name
     # Procura palavra-chave no texto
     text_lower = text.lower()
-    for key, name in BOOKMAKER_MAP.items():
+    for key, name in bookmakers:
         if key in text_lower:
             logger.debug(f"normalize_bookmaker: encontrou '{key}' em texto → '{name}'")
             return name
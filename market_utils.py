@@ -0,0 +1,233 @@
+# market_utils.py
+"""
+Canonicalização de mercados: converte o texto do mercado (legenda/OCR) na forma estruturada
+Market(bet_type, line, side) com uma única passada de uma gramática compilada.
+
+    "Mais de 2,5 gols"        → Market("total", 2.5, "over")
+    "Over 8.5 escanteios"     → Market("corners", 8.5, "over")
+    "Ambas marcam - Não"      → Market("btts", None, "no")
+    "Handicap Flamengo -1.5"  → Market("handicap", -1.5, "home")   (com home="Flamengo")
+    "Lakers - 5.5"            → Market("handicap", -5.5, "home")   (com home="Lakers")
+    "Palmeiras ou empate"     → Market("double_chance", None, "X2") (com away="Palmeiras")
+    "Over 0.5 gols 1T"        → Market("total", 0.5, "over", "1h")
+
+period marca mercados de um só tempo ("1h"/"2h": 1T/HT, 2T, "1º tempo"...); None é o jogo
+inteiro. Ele entra na selection, no resumo e na chave, para que o mercado do 1º tempo não se
+confunda com o do jogo todo.
+
+O parse do texto fica num cache LRU (MARKET_CACHE_SIZE textos distintos); só a resolução do
+lado pelo nome dos times (casa/fora) roda a cada chamada. market_key() dá a chave normalizada
+usada pelo índice de resumos do HistoricalAnalyzer, para que variantes de OCR do mesmo mercado
+("Ambas Marcam: SIM", "ambas marcam - sim") caiam no mesmo resumo; nos mercados de time sem
+os nomes do jogo, o time citado entra no lugar do lado ("Vitória Flamengo 1.70x" e
+"Flamengo vence" → "1x2||flamengo").
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+from config import MARKET_CACHE_SIZE
+
+class Market(NamedTuple):
+    bet_type: str             # total, corners, cards, handicap, btts, 1x2, double_chance, dnb
+    line: Optional[float]     # linha do total/handicap (com sinal no handicap)
+    side: Optional[str]       # over/under, home/draw/away, yes/no, 1X/X2/12
+    period: Optional[str] = None  # 1h/2h para mercados de um tempo; None = jogo inteiro
+
+    @property
+    def selection(self) -> str:
+        """
+        Valor da coluna selection: lado + linha (+ tempo) ("over 2.5", "home -1.5", "yes", "over 0.5 1h").
+        """
+        line = None if self.line is None else (f"{self.line:+g}" if self.bet_type == "handicap" else f"{self.line:g}")
+        return " ".join(p for p in (self.side, line, self.period) if p)
+
+    @property
+    def key(self) -> str:
+        key = f"{self.bet_type}|{'' if self.line is None else f'{self.line:g}'}|{self.side or ''}"
+        return f"{key}|{self.period}" if self.period else key
+
+    @property
+    def summary(self) -> str:
+        """
+        Resumo canônico em português (usado quando o histórico não conhece o mercado).
+        """
+        suffix = {"1h": " (1º tempo)", "2h": " (2º tempo)"}.get(self.period or "", "")
+        return self._summary() + suffix
+
+    def _summary(self) -> str:
+        side_pt = {"home": "casa", "away": "fora"}.get(self.side or "")
+        if self.bet_type in ("total", "corners", "cards"):
+            s = f"{'Mais' if self.side == 'over' else 'Menos'} de {self.line:g}"
+            return s + {"corners": " escanteios", "cards": " cartões"}.get(self.bet_type, "")
+        if self.bet_type == "handicap":
+            return " ".join(p for p in ("Handicap", side_pt, f"{self.line:+g}") if p)
+        if self.bet_type == "btts":
+            return f"Ambas marcam - {'Não' if self.side == 'no' else 'Sim'}"
+        if self.bet_type == "double_chance":
+            return f"Dupla chance {self.side}" if self.side else "Dupla chance"
+        if self.bet_type == "dnb":
+            return f"Empate anula - {side_pt}" if side_pt else "Empate anula"
+        if self.side == "draw":
+            return "Empate"
+        return f"Vitória {side_pt}" if side_pt else "Resultado final"
+
+# ─── Normalização ──────────────────────────────────────────
+_DASHES = str.maketrans({"–": "-", "—": "-", "−": "-"})
+_DECIMAL_COMMA = re.compile(r'(?<=\d),(?=\d)')
+# odd ("@1.90", "1.90x") não é parte do mercado: sai antes da gramática (não vira linha de handicap)
+_ODD = re.compile(r'@\s*\d+(?:[.,]\d+)?|\b\d+[.,]\d+x\b', re.I)
+_NON_WORD = re.compile(r"[^a-z0-9.+\- ]+")
+
+def normalize_market(text: str) -> str:
+    """
+    Minúsculas, sem acentos/emojis/pontuação e sem a odd (@1.90, 1.90x), vírgula decimal → ponto,
+    espaços colapsados.
+    """
+    if not text:
+        return ""
+    s = unicodedata.normalize('NFKD', _ODD.sub(' ', text))
+    s = ''.join(c for c in s if not unicodedata.combining(c)).lower().translate(_DASHES)
+    s = _DECIMAL_COMMA.sub('.', s)
+    s = _NON_WORD.sub(' ', s)
+    return ' '.join(s.split())
+
+# ─── Gramática ─────────────────────────────────────────────
+_NUM = r'\d+(?:\.\d+)?'
+# Alternativas na ordem de prioridade (vale o primeiro match mais à esquerda no texto)
+_GRAMMAR = re.compile(rf"""
+    (?P<btts>\b(?:ambas|ambos)(?:\s+(?:as\s+|os\s+)?(?:equipes|times))?\s+marcam\b|\bbtts\b)
+        (?:\s*-?\s*(?P<btts_side>sim|nao|yes|no)\b)?
+  | (?P<over>\b(?:over|mais\s+de|acima\s+de)\s*|\bo(?=\d)|\+\s*(?={_NUM}\s*(?:gols?|escanteios?|cantos?|pontos?)\b))
+        (?P<over_line>{_NUM})
+  | (?P<under>\b(?:under|menos\s+de|abaixo\s+de)\s*|\bu(?=\d))
+        (?P<under_line>{_NUM})
+  | (?P<handicap>\b(?:handicap|hcp|ah)\b)(?:\s+(?:asiatico|europeu))?.*?(?P<hcp_line>[+-]?\s?{_NUM})
+  | (?P<dnb>\b(?:empate\s+anula(?:\s+a)?(?:\s+aposta)?|draw\s+no\s+bet|dnb)\b)
+  | (?P<dc>\b(?:dupla\s+chance|chance\s+dupla|double\s+chance|ou\s+empate|empate\s+ou|1x|x2)\b)
+  | (?P<ml>\b(?:vitoria|vence(?:r|dor)?|resultado\s+final|moneyline|ml|1x2|empate|draw)\b)
+  | (?P<team_hcp>\b(?!(?:total|gols?|linha|odd|stake)\b)[a-z]+(?:\s[a-z]+){{0,3}})
+        \s(?P<team_line>[+-]\s?{_NUM})(?![\d.])(?!\s*(?:gols?|escanteios?|cantos?|pontos?)\b)
+""", re.X)
+# 1º/2º tempo ("º" vira "o" na normalização): 1T, HT, "1o tempo", "primeiro tempo", 1st half...
+_PERIODS = (
+    ("1h", re.compile(r'\b(?:1\s?o?\s?t|ht|1h|(?:1o?|primeiro)\s+tempo|(?:1st|first)\s+half|(?:1a|primeira)\s+etapa)\b')),
+    ("2h", re.compile(r'\b(?:2\s?o?\s?t|2h|(?:2o?|segundo)\s+tempo|(?:2nd|second)\s+half|(?:2a|segunda)\s+etapa)\b')),
+)
+_DC_CODE = re.compile(r'\b(1x|x2|12)\b')
+_CORNERS = re.compile(r'\b(?:escanteios?|cantos?|corners?)\b')
+_CARDS = re.compile(r'\b(?:cartoes|cartao|cards?)\b')
+_HOME_WORDS = re.compile(r'\b(?:casa|mandante|home)\b')
+_AWAY_WORDS = re.compile(r'\b(?:fora|visitante|away)\b')
+
+_KINDS = ("btts", "over", "under", "handicap", "dnb", "dc", "ml", "team_hcp")
+# vocabulário de mercado e números: o que sobra num mercado de time é o nome do time
+_MARKET_WORDS = re.compile(r"""
+    \b(?:handicap|hcp|ah|asiatico|europeu|empate\s+anula(?:\s+a)?(?:\s+aposta)?|draw\s+no\s+bet|dnb
+       |dupla\s+chance|chance\s+dupla|double\s+chance|ou|vitoria|vence(?:r|dor)?|resultado\s+final
+       |moneyline|ml|1x2|1x|x2|12|empate|draw|de|do|da|para|pra)\b
+  | [+-]?\s?\d+(?:\.\d+)?|[+-]
+""", re.X)
+# lados que dependem de saber qual time é o mandante
+_TEAM_SIDED = {"handicap", "dnb", "double_chance", "1x2"}
+
+def _period(norm: str) -> Optional[str]:
+    for period, pat in _PERIODS:
+        if pat.search(norm):
+            return period
+    return None
+
+@lru_cache(maxsize=MARKET_CACHE_SIZE)
+def _parse(text: str) -> Tuple[str, Optional[Market]]:
+    """
+    (texto normalizado, Market com o lado ainda sem resolver por time). Em cache por texto bruto.
+    """
+    norm = normalize_market(text)
+    market = _parse_market(norm)
+    if market is not None:
+        market = market._replace(period=_period(norm))
+    return norm, market
+
+def _parse_market(norm: str) -> Optional[Market]:
+    m = _GRAMMAR.search(norm)
+    if m is None:
+        return None
+    kind = next(k for k in _KINDS if m.group(k) is not None)
+    if kind in ("over", "under"):
+        bet_type = "corners" if _CORNERS.search(norm) else "cards" if _CARDS.search(norm) else "total"
+        return Market(bet_type, float(m.group(f"{kind}_line")), kind)
+    if kind == "btts":
+        return Market("btts", None, "no" if m.group("btts_side") in ("nao", "no") else "yes")
+    if kind in ("handicap", "team_hcp"):
+        line = float(m.group("hcp_line" if kind == "handicap" else "team_line").replace(" ", ""))
+        # linhas de handicap andam de 0.25 em 0.25; outro número (ex.: odd sem @) não é linha
+        return Market("handicap", line, None) if (line * 4).is_integer() else None
+    if kind == "dnb":
+        return Market("dnb", None, None)
+    if kind == "dc":
+        code = _DC_CODE.search(norm)
+        return Market("double_chance", None, code.group(1).upper() if code else None)
+    return Market("1x2", None, "draw" if m.group("ml") in ("empate", "draw") else None)
+
+def _team_side(norm: str, home: Optional[str], away: Optional[str]) -> Optional[str]:
+    """
+    "home"/"away" se só um dos times (ou palavras como casa/fora) aparece no texto.
+    """
+    h = normalize_market(home or "")
+    a = normalize_market(away or "")
+    in_home = bool(h) and h in norm
+    in_away = bool(a) and a in norm
+    if in_home != in_away:
+        return "home" if in_home else "away"
+    if not (in_home or in_away):
+        in_home, in_away = bool(_HOME_WORDS.search(norm)), bool(_AWAY_WORDS.search(norm))
+        if in_home != in_away:
+            return "home" if in_home else "away"
+    return None
+
+def canonical_market(text: str, home: Optional[str] = None, away: Optional[str] = None) -> Optional[Market]:
+    """
+    Market(bet_type, line, side) do texto, ou None se nenhum mercado conhecido casar.
+    home/away (nomes dos times) resolvem o lado de handicap, empate anula, dupla chance e 1X2.
+    """
+    if not text:
+        return None
+    norm, market = _parse(text)
+    if market is None or market.side is not None or market.bet_type not in _TEAM_SIDED:
+        return market
+    side = _team_side(norm, home, away)
+    if side is None:
+        return market
+    if market.bet_type == "double_chance":
+        side = "1X" if side == "home" else "X2"
+    return market._replace(side=side)
+
+def _team_text(norm: str) -> str:
+    """
+    Time citado num mercado de time: o texto sem o vocabulário de mercado, números e tempo.
+    """
+    for _, pat in _PERIODS:
+        norm = pat.sub(' ', norm)
+    return ' '.join(_MARKET_WORDS.sub(' ', norm).split())
+
+@lru_cache(maxsize=MARKET_CACHE_SIZE)
+def market_key(text: str) -> str:
+    """
+    Chave normalizada para índices: a chave canônica quando o mercado não depende dos times
+    (total, btts, 1X/X2 explícitos...); nos de time, tipo|linha|time citado; sem mercado
+    reconhecido, o texto normalizado.
+    """
+    norm, market = _parse(text or "")
+    if market is None:
+        return norm
+    if market.side is None and market.bet_type in _TEAM_SIDED:
+        return market._replace(side=_team_text(norm)).key
+    return market.key
+
+def cache_info():
+    """
+    Estatísticas do cache LRU (hits, misses, maxsize, currsize).
+    """
+    return _parse.cache_info()
@@ -2,30 +2,35 @@
 
 import re
 import os
+import asyncio
 import logging
-from PIL import Image, UnidentifiedImageError
-import pytesseract
-from config import RUIDO_LINES, logger
+from config import TESSERACT_CMD, TESSDATA_PREFIX, logger
+import rules
 from parse_utils import detect_sport
 
+_pytesseract = None
+
+def _tesseract():
+    """
+    Importa e configura pytesseract no primeiro uso (fora do caminho de startup).
+    """
+    global _pytesseract
+    if _pytesseract is None:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        if TESSDATA_PREFIX:
+            os.environ.setdefault('TESSDATA_PREFIX', TESSDATA_PREFIX)
+        logger.debug(f"Tesseract configurado: cmd={TESSERACT_CMD}, tessdata_prefix={TESSDATA_PREFIX}")
+        _pytesseract = pytesseract
+    return _pytesseract
+
 def limpa_linhas_ocr(ocr_text: str):
     """
-    Filtra linhas de OCR removendo vazias e linhas de ruído conforme RUIDO_LINES.
+    Filtra linhas de OCR removendo vazias e linhas de ruído das regras.
     """
+    ruido = rules.current().ruido_ocr
     lines = [l.strip() for l in ocr_text.splitlines()]
-    filtered = []
-    for l in lines:
-        if not l:
-            continue
-        ignora = False
-        for p in RUIDO_LINES:
-            if re.match(p, l, flags=re.IGNORECASE):
-                ignora = True
-                break
-        if ignora:
-            continue
-        filtered.append(l)
-    return filtered
+    return [l for l in lines if l and not ruido.match(l)]
 
 def extrai_times_de_linhas(lines):
     """
@@ -51,7 +56,7 @@ def extrai_times_de_linhas(lines):
                     parts = s.split()
                     return len(parts) >= 2 and all(re.match(r'^[A-ZÀ-Ÿ]', p) for p in parts)
                 if parece_nome(left) and parece_nome(right):
-                    logger.debug(f"extrai_times_de_linhas (Tênis linha única): '{left}' x '{right}'")
+                    logger.debug("extrai_times_de_linhas (Tênis linha única): '%s' x '%s'", left, right)
                     return left, right
         if len(lines) >= 2:
             l0 = lines[0].strip()
@@ -60,7 +65,7 @@ def extrai_times_de_linhas(lines):
                 parts = s.split()
                 return len(parts) >= 2 and all(re.match(r'^[A-ZÀ-Ÿ]', p) for p in parts)
             if parece_nome(l0) and parece_nome(l1):
-                logger.debug(f"extrai_times_de_linhas (Tênis 2 linhas): '{l0}' x '{l1}'")
+                logger.debug("extrai_times_de_linhas (Tênis 2 linhas): '%s' x '%s'", l0, l1)
                 return l0, l1
         return None, None
 
@@ -78,7 +83,7 @@ def extrai_times_de_linhas(lines):
             left2 = re.sub(r'^(OOS\s+|fe\)\s*)', '', left2, flags=re.IGNORECASE).strip()
             right2 = re.sub(r'^(OOS\s+|fe\)\s*)', '', right2, flags=re.IGNORECASE).strip()
             if re.search(r'[A-Za-zÀ-ÿ]', left2) and re.search(r'[A-Za-zÀ-ÿ]', right2):
-                logger.debug(f"extrai_times_de_linhas (Geral): '{left2}' x '{right2}'")
+                logger.debug("extrai_times_de_linhas (Geral): '%s' x '%s'", left2, right2)
                 return left2, right2
     return None, None
 
@@ -111,21 +116,17 @@ def extrai_todas_opcoes_mercado(lines, start_index=0):
             resultados.append((l, odd_val))
     return resultados
 
-async def perform_ocr_on_media(message, download_folder='downloads'):
+def ocr_image(path: str) -> str:
     """
-    Faz download da mídia e tenta OCR via pytesseract.
+    Abre a imagem em path e tenta OCR via pytesseract.
     Retorna string de texto ou "" se falhar.
     """
-    os.makedirs(download_folder, exist_ok=True)
     try:
-        path = await message.download_media(file=download_folder)
-    except Exception as e:
-        logger.debug("download_media levantou exceção:", exc_info=e)
+        from PIL import Image, UnidentifiedImageError
+        pytesseract = _tesseract()
+    except ImportError as e:
+        logger.warning("pytesseract/Pillow não instalados; OCR desativado", exc_info=e)
         return ""
-    if not path or not os.path.exists(path):
-        logger.debug(f"download_media retornou None ou não existe: {path}")
-        return ""
-    logger.debug(f"Mídia salva em {path}, tentando OCR…")
     try:
         img = Image.open(path)
     except UnidentifiedImageError as e:
@@ -145,3 +146,21 @@ async def perform_ocr_on_media(message, download_folder='downloads'):
         except Exception as e:
             logger.debug(f"OCR falhou genérico ({lang}):", exc_info=e)
     return ""
+
+async def perform_ocr_on_media(message, download_folder='downloads'):
+    """
+    Faz download da mídia e tenta OCR via pytesseract.
+    Retorna string de texto ou "" se falhar.
+    """
+    os.makedirs(download_folder, exist_ok=True)
+    try:
+        path = await message.download_media(file=download_folder)
+    except Exception as e:
+        logger.debug("download_media levantou exceção:", exc_info=e)
+        return ""
+    if not path or not os.path.exists(path):
+        logger.debug(f"download_media retornou None ou não existe: {path}")
+        return ""
+    logger.debug(f"Mídia salva em {path}, tentando OCR…")
+    # tesseract roda em subprocesso; em thread não bloqueia o event loop
+    return await asyncio.to_thread(ocr_image, path)
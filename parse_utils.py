@@ -3,7 +3,7 @@
 import re
 import logging
 from typing import Optional, Tuple, List
-from config import PATTERN_STAKE, PATTERN_LIMIT, PATTERN_ODD, RUIDO_LINES, COMPETITIONS, SPORTS_KEYWORDS
+import rules
 
 logger = logging.getLogger(__name__)
 
@@ -13,17 +13,8 @@ def clean_caption(raw: str) -> str:
     """
     if not raw:
         return ""
-    s = raw.strip()
-    linhas = s.splitlines()
-    novas = []
-    for l in linhas:
-        ignora = False
-        for pat in RUIDO_LINES:
-            if re.search(pat, l):
-                ignora = True
-                break
-        if not ignora:
-            novas.append(l)
+    ruido = rules.current().ruido_caption
+    novas = [l for l in raw.strip().splitlines() if not ruido.search(l)]
     s2 = "\n".join(novas)
     s2 = re.sub(r'\s+', ' ', s2)
     return s2.strip()
@@ -34,7 +25,7 @@ def extract_stake_list(text: str) -> List[float]:
     """
     if not text:
         return []
-    matches = PATTERN_STAKE.findall(text)
+    matches = rules.current().pattern_stake.findall(text)
     stakes: List[float] = []
     for m in matches:
         num = m.replace(',', '.')
@@ -60,7 +51,7 @@ def extract_odd_list(text: str) -> List[float]:
     """
     if not text:
         return []
-    matches = PATTERN_ODD.findall(text)
+    matches = rules.current().pattern_odd.findall(text)
     odds: List[float] = []
     for m in matches:
         num = m.replace(',', '.')
@@ -86,7 +77,7 @@ def extract_limit(text: str) -> Optional[float]:
     """
     if not text:
         return None
-    m = PATTERN_LIMIT.search(text)
+    m = rules.current().pattern_limit.search(text)
     if m:
         num = m.group(1).replace('.', '').replace(',', '.')
         try:
@@ -95,49 +86,42 @@ def extract_limit(text: str) -> Optional[float]:
             return None
     return None
 
-def parse_market(mercado_raw: str) -> Tuple[Optional[str], Optional[str]]:
+def parse_market(mercado_raw: str, home: Optional[str] = None,
+                 away: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
     """
-    Parse simplificado de mercado_raw.
-    Retorna (bet_type, selection).
+    Parse de mercado_raw via canonicalizador (market_utils): totais (gols/escanteios/cartões),
+    handicap, ambas marcam, 1X2, dupla chance e empate anula.
+    Retorna (bet_type, selection), ex.: ("total", "over 2.5"), ("handicap", "home -1.5").
     """
-    if not mercado_raw:
+    from market_utils import canonical_market
+    market = canonical_market(mercado_raw, home, away)
+    if market is None:
         return None, None
-    s = mercado_raw.lower()
-    # Over / Mais de
-    if "over" in s or "mais de" in s:
-        nums = re.findall(r'(\d+[.,]?\d*)', s)
-        if nums:
-            return "over", nums[0].replace(',', '.')
-    # Under / Menos de
-    if "under" in s or "menos de" in s:
-        nums = re.findall(r'(\d+[.,]?\d*)', s)
-        if nums:
-            return "under", nums[0].replace(',', '.')
-    # Outros padrões podem ser incluídos
-    return None, None
+    return market.bet_type, market.selection or None
 
 def detect_competition(text: str) -> Optional[str]:
     """
-    Detecta competição a partir de lista COMPETITIONS.
+    Detecta competição a partir da lista de competições das regras.
     """
     if not text:
         return None
-    for comp in COMPETITIONS:
-        if comp.lower() in text.lower():
+    tlower = text.lower()
+    for comp, comp_lower in rules.current().competitions:
+        if comp_lower in tlower:
             return comp
     return None
 
 def detect_sport(text: str) -> Optional[str]:
     """
-    Detecta esporte a partir de palavras-chave em SPORTS_KEYWORDS.
+    Detecta esporte a partir das palavras-chave de esporte das regras.
     Retorna em title case ou None.
     """
     if not text:
         return None
     tlower = text.lower()
-    for kw in SPORTS_KEYWORDS:
-        if kw.lower() in tlower:
-            return kw.title()
+    for kw_lower, sport in rules.current().sports_keywords:
+        if kw_lower in tlower:
+            return sport
     return None
 
 def summarize_market(mercado_raw: str) -> str:
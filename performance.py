@@ -0,0 +1,240 @@
+# performance.py
+"""
+Métricas de desempenho por grupo, casa, esporte e bet_type: número de apostas, total
+apostado, odd média, distribuição de stake e — para apostas liquidadas — acerto e ROI.
+
+A carga inicial é vetorizada (NumPy group-by sobre o BetStore); depois cada aposta nova
+atualiza os agregados em O(1) via PerformanceAggregates.add_rows.
+
+Uso:
+    python performance.py                 # todas as dimensões
+    python performance.py --by bookmaker
+"""
+
+import sys
+import logging
+import argparse
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from sheets_utils import HEADER
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = {
+    "group": "group_name",
+    "bookmaker": "bookmaker",
+    "sport": "sport",
+    "bet_type": "bet_type",
+}
+# Colunas de liquidação (preenchidas por settlement.py; ver SETTLEMENT_COLUMNS em sheets_utils)
+RESULT_COLUMN = "result"
+PROFIT_COLUMN = "profit"
+
+@dataclass
+class Agg:
+    bets: int = 0
+    staked: float = 0.0
+    odd_sum: float = 0.0
+    odd_n: int = 0
+    settled: int = 0
+    wins: int = 0
+    settled_staked: float = 0.0
+    profit: float = 0.0
+    stakes: Counter = field(default_factory=Counter)
+
+    @property
+    def avg_odd(self) -> Optional[float]:
+        return self.odd_sum / self.odd_n if self.odd_n else None
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        return self.wins / self.settled if self.settled else None
+
+    @property
+    def roi(self) -> Optional[float]:
+        return self.profit / self.settled_staked if self.settled_staked else None
+
+def _num(v) -> float:
+    if v is None or v == "":
+        return np.nan
+    try:
+        return float(str(v).replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+def _group_sum(inverse: np.ndarray, n: int, weights: np.ndarray) -> np.ndarray:
+    return np.bincount(inverse, weights=np.nan_to_num(weights), minlength=n)
+
+class PerformanceAggregates:
+    """
+    Agregados em memória por dimensão → chave → Agg. Construídos de uma vez a partir das
+    colunas do histórico e mantidos incrementalmente a cada linha nova.
+    """
+
+    def __init__(self):
+        self._aggs: Dict[str, Dict[str, Agg]] = {d: {} for d in DIMENSIONS}
+        self._lock = threading.Lock()
+
+    # ─── Carga vetorizada ───────────────────────────────────
+    def build(self, columns: Dict[str, Sequence]) -> None:
+        """
+        columns: nome da coluna (HEADER + result/profit opcionais) → valores, todas do mesmo tamanho.
+        """
+        n = len(columns["bet_key"])
+        dup = np.array([str(v).upper() in ("TRUE", "1") for v in columns["duplicate"]], dtype=bool)
+        keep = ~dup
+        odd = np.array([_num(v) for v in columns["odd"]])[keep]
+        stake = np.array([_num(v) for v in columns["stake_pct"]])[keep]
+        amount = np.array([_num(v) for v in columns["amount_real"]])[keep]
+        results = np.array([str(v or "").lower() for v in columns.get(RESULT_COLUMN, [""] * n)])[keep]
+        profit = np.array([_num(v) for v in columns.get(PROFIT_COLUMN, [""] * n)])[keep]
+        settled = np.isin(results, ["win", "loss", "push", "half_win", "half_loss"])
+        wins = np.isin(results, ["win", "half_win"])
+
+        aggs: Dict[str, Dict[str, Agg]] = {}
+        for dim, col in DIMENSIONS.items():
+            keys = np.array([str(v or "—") for v in columns[col]])[keep]
+            uniq, inv = np.unique(keys, return_inverse=True)
+            k = len(uniq)
+            counts = np.bincount(inv, minlength=k)
+            staked = _group_sum(inv, k, amount)
+            odd_ok = np.isfinite(odd)
+            odd_sum = _group_sum(inv[odd_ok], k, odd[odd_ok])
+            odd_n = np.bincount(inv[odd_ok], minlength=k)
+            n_settled = np.bincount(inv[settled], minlength=k)
+            n_wins = np.bincount(inv[wins], minlength=k)
+            s_staked = _group_sum(inv[settled], k, amount[settled])
+            s_profit = _group_sum(inv[settled], k, profit[settled])
+            # distribuição de stake: contagem por (chave, stake)
+            stake_ok = np.isfinite(stake)
+            pairs, pair_counts = np.unique(
+                np.stack([inv[stake_ok], np.round(stake[stake_ok], 2)]), axis=1, return_counts=True
+            ) if stake_ok.any() else (np.empty((2, 0)), np.empty(0, dtype=int))
+            dim_aggs = {}
+            for i, key in enumerate(uniq):
+                dim_aggs[str(key)] = Agg(
+                    bets=int(counts[i]), staked=float(staked[i]), odd_sum=float(odd_sum[i]),
+                    odd_n=int(odd_n[i]), settled=int(n_settled[i]), wins=int(n_wins[i]),
+                    settled_staked=float(s_staked[i]), profit=float(s_profit[i]),
+                )
+            for (i, st), c in zip(pairs.T, pair_counts):
+                dim_aggs[str(uniq[int(i)])].stakes[float(st)] += int(c)
+            aggs[dim] = dim_aggs
+        with self._lock:
+            self._aggs = aggs
+        logger.info(f"PerformanceAggregates: {int(keep.sum())} apostas agregadas")
+
+    def build_from_store(self, store) -> None:
+        cols = [c for c in HEADER]
+        extra = [c for c in (RESULT_COLUMN, PROFIT_COLUMN) if c in store.columns()]
+        rows = store.query("SELECT " + ", ".join(f'"{c}"' for c in cols + extra) + " FROM bets")
+        names = cols + extra
+        if rows:
+            data = {name: col for name, col in zip(names, zip(*rows))}
+        else:
+            data = {name: () for name in names}
+        self.build(data)
+
+    # ─── Atualização incremental ────────────────────────────
+    def add_rows(self, rows: List[list], sign: int = 1) -> None:
+        """
+        Soma linhas novas (formato HEADER) aos agregados, O(1) por linha e dimensão.
+        sign=-1 desconta linhas já somadas (ex.: versão antiga de uma mensagem editada).
+        """
+        idx = {c: i for i, c in enumerate(HEADER)}
+        with self._lock:
+            for row in rows:
+                if row[idx["duplicate"]] is True:
+                    continue
+                odd = _num(row[idx["odd"]])
+                stake = _num(row[idx["stake_pct"]])
+                amount = _num(row[idx["amount_real"]])
+                for dim, col in DIMENSIONS.items():
+                    key = str(row[idx[col]] or "—")
+                    agg = self._aggs[dim].setdefault(key, Agg())
+                    agg.bets += sign
+                    if np.isfinite(amount):
+                        agg.staked += sign * amount
+                    if np.isfinite(odd):
+                        agg.odd_sum += sign * odd
+                        agg.odd_n += sign
+                    if np.isfinite(stake):
+                        agg.stakes[round(stake, 2)] += sign
+                        if agg.stakes[round(stake, 2)] <= 0:
+                            del agg.stakes[round(stake, 2)]
+
+    def add_settlement(self, row_keys: Dict[str, str], result: str, amount: float, profit: float,
+                       sign: int = 1) -> None:
+        """
+        Registra a liquidação de uma aposta já contada. row_keys: dimensão → chave da aposta.
+        sign=-1 desconta uma liquidação já somada (ex.: aposta editada volta a ficar pendente).
+        """
+        with self._lock:
+            for dim, key in row_keys.items():
+                agg = self._aggs[dim].setdefault(key or "—", Agg())
+                agg.settled += sign
+                agg.settled_staked += sign * amount
+                agg.profit += sign * profit
+                if result in ("win", "half_win"):
+                    agg.wins += sign
+
+    def add_settlement_row(self, row: list, result: str, profit, sign: int = 1) -> None:
+        """
+        add_settlement a partir de uma linha no formato HEADER (duplicadas não entram nos agregados).
+        """
+        idx = {c: i for i, c in enumerate(HEADER)}
+        result = str(result or "").lower()
+        if row[idx["duplicate"]] is True or result not in ("win", "loss", "push", "half_win", "half_loss"):
+            return
+        amount = _num(row[idx["amount_real"]])
+        profit = _num(profit)
+        keys = {dim: str(row[idx[col]] or "—") for dim, col in DIMENSIONS.items()}
+        self.add_settlement(keys, result, float(np.nan_to_num(amount)), float(np.nan_to_num(profit)), sign=sign)
+
+    def snapshot(self, dim: str) -> Dict[str, Agg]:
+        with self._lock:
+            return dict(self._aggs.get(dim, {}))
+
+def format_report(aggs: PerformanceAggregates, dims: Optional[List[str]] = None, top: int = 20) -> str:
+    """
+    Relatório em texto (cabe numa mensagem do Telegram com top≈20 por dimensão).
+    """
+    def pct(v):
+        return "—" if v is None else f"{100 * v:.1f}%"
+
+    lines = []
+    for dim in dims or list(DIMENSIONS):
+        data = aggs.snapshot(dim)
+        if not data:
+            continue
+        lines.append(f"📊 Por {dim}:")
+        ordered = sorted(data.items(), key=lambda kv: kv[1].bets, reverse=True)[:top]
+        for key, a in ordered:
+            avg = "—" if a.avg_odd is None else f"{a.avg_odd:.2f}"
+            dist = " ".join(f"{s:g}u×{c}" for s, c in sorted(a.stakes.items())[:5])
+            lines.append(
+                f"• {key}: {a.bets} apostas | R$ {a.staked:.2f} | odd méd. {avg} | "
+                f"acerto {pct(a.hit_rate)} | ROI {pct(a.roi)} | {dist}"
+            )
+        lines.append("")
+    return "\n".join(lines).strip() or "Sem apostas no histórico."
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Relatório de desempenho por grupo/casa/esporte/bet_type")
+    ap.add_argument("--by", choices=list(DIMENSIONS), action="append", help="dimensão (pode repetir)")
+    ap.add_argument("--top", type=int, default=50, help="máximo de linhas por dimensão")
+    args = ap.parse_args(argv)
+
+    from bet_store import BetStore
+    aggs = PerformanceAggregates()
+    aggs.build_from_store(BetStore())
+    print(format_report(aggs, args.by, args.top))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,553 @@
+# pipeline.py
+
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from collections import defaultdict
+from datetime import timezone
+from typing import Optional, List, Dict
+
+from config import BANK_TOTAL
+from ocr_utils import limpa_linhas_ocr, extrai_times_de_linhas, extrai_todas_opcoes_mercado, perform_ocr_on_media
+from parse_utils import (
+    clean_caption,
+    extract_stake_list,
+    extract_odd,
+    extract_odd_list,
+    extract_limit,
+    detect_competition,
+    detect_sport,
+    summarize_market as summarize_fallback
+)
+from mapping_utils import get_canonical, normalize_bookmaker_from_url_or_text
+from market_utils import canonical_market
+from dedup_utils import save_seen, generate_bet_key
+from sheets_utils import append_rows
+from edit_cache import MessageState, media_id
+
+logger = logging.getLogger(__name__)
+
+class StageTimer:
+    """
+    Acumula tempo gasto por etapa do pipeline (ocr, parse, write, ...).
+    """
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - t0
+            self.counts[name] += 1
+
+    def report(self) -> Dict[str, dict]:
+        return {
+            name: {
+                "total_s": round(total, 4),
+                "count": self.counts[name],
+                "avg_ms": round(1000 * total / self.counts[name], 3) if self.counts[name] else 0.0,
+            }
+            for name, total in self.totals.items()
+        }
+
+class WriteError(Exception):
+    """
+    O sink não gravou as linhas da mensagem (as chaves novas já saíram do seen).
+    """
+
+class SheetSink:
+    """
+    Destino padrão das linhas: append_rows na aba do Google Sheets (uma chamada por mensagem),
+    fora do event loop.
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    async def write(self, rows: List[list]) -> Optional[List[int]]:
+        """
+        None em caso de sucesso (o Sheets não tem ids de linha); [] em caso de falha.
+        """
+        try:
+            await asyncio.to_thread(append_rows, self.sheet, rows)
+        except Exception as e:
+            logger.error("Erro ao append_rows", exc_info=e)
+            return []
+        return None
+
+def extract_bets(clean: str, lines: List[str], fixtures=None) -> List[dict]:
+    """
+    Extrai possíveis apostas (times + mercado + odd da imagem) das linhas de OCR
+    ou, na falta delas, da legenda limpa.
+    fixtures: FixtureIndex opcional (teams_cache) para conferir/corrigir os times lidos
+    e completar o adversário quando só um time aparece. A correção vale só para
+    time_casa/time_fora; raw_casa/raw_fora guardam o par como foi lido (base da bet_key).
+    """
+    bets_to_record = []
+    if lines:
+        try:
+            home, away = extrai_times_de_linhas(lines)
+        except Exception as e:
+            home = away = None
+            logger.debug("Erro em extrai_times_de_linhas via OCR", exc_info=e)
+        raw = (home, away)
+        idx0 = None
+        if home and away:
+            for i, l in enumerate(lines):
+                if home in l and away in l:
+                    idx0 = i
+                    break
+            if fixtures is not None:
+                home, away, _ = fixtures.match_pair(home, away)
+        elif fixtures is not None:
+            found = fixtures.find_in_lines(lines)
+            if found:
+                idx0, fx = found
+                home, away = fx.home, fx.away
+                # nenhum par foi lido: o jogo do dia é o próprio texto de referência
+                raw = (home, away)
+                logger.debug("Time do dia reconhecido na linha %s; jogo completo: %s x %s", idx0, home, away)
+        if home and away:
+            logger.debug("Times extraídos via OCR: %s x %s", home, away)
+            after = lines[idx0+1:] if idx0 is not None else lines
+            try:
+                ops = extrai_todas_opcoes_mercado(after, start_index=0)
+            except Exception as e:
+                ops = None
+                logger.debug("Erro em extrai_todas_opcoes_mercado via OCR", exc_info=e)
+            if ops:
+                for mkt_raw, odd_img in ops:
+                    bets_to_record.append({
+                        'time_casa': home,
+                        'time_fora': away,
+                        'raw_casa': raw[0] or home,
+                        'raw_fora': raw[1] or away,
+                        'mercado': mkt_raw.strip() if mkt_raw else None,
+                        'odd_img': odd_img
+                    })
+                logger.debug("Encontradas %s opções via OCR", len(ops))
+            else:
+                bets_to_record.append({
+                    'time_casa': home,
+                    'time_fora': away,
+                    'raw_casa': raw[0] or home,
+                    'raw_fora': raw[1] or away,
+                    'mercado': None,
+                    'odd_img': None
+                })
+        else:
+            logger.debug("OCR não extraiu times confiáveis.")
+    if not bets_to_record:
+        try:
+            home2, away2 = extrai_times_de_linhas([clean])
+        except Exception as e:
+            home2 = away2 = None
+            logger.debug("Erro em extrai_times_de_linhas na legenda", exc_info=e)
+        raw2 = (home2, away2)
+        if home2 and away2 and fixtures is not None:
+            home2, away2, _ = fixtures.match_pair(home2, away2)
+        if home2 and away2:
+            logger.debug("Times extraídos da legenda: %s x %s", home2, away2)
+            try:
+                ops2 = extrai_todas_opcoes_mercado([clean], start_index=0)
+            except Exception as e:
+                ops2 = None
+                logger.debug("Erro em extrai_todas_opcoes_mercado na legenda", exc_info=e)
+            if ops2:
+                for mkt_raw, odd_img in ops2:
+                    bets_to_record.append({
+                        'time_casa': home2,
+                        'time_fora': away2,
+                        'raw_casa': raw2[0] or home2,
+                        'raw_fora': raw2[1] or away2,
+                        'mercado': mkt_raw.strip() if mkt_raw else None,
+                        'odd_img': odd_img
+                    })
+                logger.debug("Encontradas %s opções via legenda", len(ops2))
+            else:
+                bets_to_record.append({
+                    'time_casa': home2,
+                    'time_fora': away2,
+                    'raw_casa': raw2[0] or home2,
+                    'raw_fora': raw2[1] or away2,
+                    'mercado': None,
+                    'odd_img': None
+                })
+        else:
+            logger.debug("Não extraiu times da legenda; ignora.")
+    return bets_to_record
+
+def album_caption(messages: list):
+    """
+    (mensagens em ordem, mensagem da legenda, legenda) de um álbum: a legenda é o texto das
+    mensagens que têm texto (normalmente só uma), e a primeira delas representa o álbum.
+    """
+    messages = sorted(messages, key=lambda m: m.id)
+    caption_msg = next((m for m in messages if m.raw_text), messages[0])
+    return messages, caption_msg, "\n".join(m.raw_text for m in messages if m.raw_text)
+
+class BetPipeline:
+    """
+    Lógica do handler de mensagens, independente do Telethon:
+    OCR → limpeza → extração de apostas → dedup → unidades → canonicalização → linhas p/ Sheets.
+    Usado pelo bot ao vivo e pelo modo replay (replay.py).
+    """
+
+    def __init__(self, historical, seen: set, registry, sink=None, timer: Optional[StageTimer] = None,
+                 persist_seen: bool = True, fixtures=None, templates=None, edits=None):
+        self.historical = historical
+        self.seen = seen
+        self.registry = registry
+        self.sink = sink
+        self.timer = timer or StageTimer()
+        self.persist_seen = persist_seen
+        self.fixtures = fixtures
+        self.templates = templates
+        self.edits = edits
+
+    def parse_message(self, raw: str, chat_id, date, ocr_text: str = "", chat_info=None,
+                      update_history: bool = True, ocr_texts: Optional[List[str]] = None) -> List[list]:
+        """
+        Converte uma mensagem (legenda + texto OCR) nas linhas a gravar. Não faz I/O de rede;
+        atualiza apenas o conjunto seen e (com update_history) o histórico em memória.
+        ocr_texts: OCR de cada imagem de um álbum (substitui ocr_text); as apostas de todas as
+        imagens são casadas juntas com a lista de stakes da legenda única.
+        """
+        if ocr_texts is not None:
+            ocr_texts = [t for t in ocr_texts if t]
+            ocr_text = "\n".join(ocr_texts)
+        lines_per_image = [limpa_linhas_ocr(t) for t in (ocr_texts if ocr_texts is not None else [ocr_text]) if t]
+        lines = [l for img in lines_per_image for l in img]
+        if lines:
+            logger.debug("[OCR] Linhas limpas: %s", lines)
+
+        # 2) Limpa legenda/texto
+        clean = clean_caption(raw)
+        logger.debug("[Caption limpa] %s", clean)
+
+        # RAW_MENSAGEM_IDENTIFICADA
+        if ocr_text:
+            raw_msg_identified = f"{clean} || OCR: {ocr_text}"
+        else:
+            raw_msg_identified = clean
+
+        # 3) Extrai bookmaker
+        bookmaker = normalize_bookmaker_from_url_or_text(clean)
+        logger.debug("Bookmaker detectado: %s", bookmaker)
+
+        # 4) Extrai stake(s) e odd(s): template do grupo (um match) ou heurísticas genéricas
+        tpl = self.templates.match(chat_id, clean) if self.templates is not None else None
+        if tpl is not None:
+            logger.debug("Template do grupo casou: %s", tpl.template)
+            stake_list = [tpl.stake]
+            odd_single = tpl.odd
+            odd_caption_list = [tpl.odd] if tpl.odd is not None else []
+            limit = tpl.limit
+        else:
+            stake_list = extract_stake_list(clean)
+            if not stake_list:
+                logger.debug("Sem stake_pct na legenda; ignora mensagem.")
+                return []
+            odd_caption_list = extract_odd_list(clean)
+            odd_single = extract_odd(clean)
+            limit = extract_limit(clean)
+        logger.debug("Stake_list=%s, odd_caption_list=%s, limit=%s", stake_list, odd_caption_list, limit)
+
+        # 5) Extrai possíveis apostas via template, OCR ou legenda
+        if tpl is not None and tpl.home and tpl.away and not lines:
+            home, away = tpl.home, tpl.away
+            if self.fixtures is not None:
+                home, away, _ = self.fixtures.match_pair(home, away)
+            bets_to_record = [{'time_casa': home, 'time_fora': away, 'raw_casa': tpl.home, 'raw_fora': tpl.away,
+                               'mercado': tpl.market, 'odd_img': None}]
+        elif len(lines_per_image) > 1:
+            # álbum: cada imagem tem seus times/mercados; a legenda só entra se nenhuma render
+            bets_to_record = [b for img in lines_per_image for b in extract_bets("", img, self.fixtures)]
+            if not bets_to_record:
+                bets_to_record = extract_bets(clean, [], self.fixtures)
+            logger.debug("Álbum: %s apostas em %s imagens", len(bets_to_record), len(lines_per_image))
+        else:
+            bets_to_record = extract_bets(clean, lines, self.fixtures)
+        if not bets_to_record:
+            return []
+
+        # 6) Lógica de casamento múltiplos mercados <-> múltiplos stakes (escada)
+        num_markets = len(bets_to_record)
+        num_stakes = len(stake_list)
+        num_odds_caption = len(odd_caption_list)
+        logger.debug("num_markets=%s, num_stakes=%s, num_odds_caption=%s",
+                     num_markets, num_stakes, num_odds_caption)
+
+        # 7) Detecta esporte
+        sport = detect_sport(raw_msg_identified)
+        logger.debug("Esporte detectado: %s", sport)
+
+        # Metadados do grupo
+        if chat_info is None:
+            chat_info = self.registry.set_title(chat_id, None)
+        group_name = chat_info.title
+        scale = chat_info.scale
+        unit_value = round(BANK_TOTAL / scale, 2)
+
+        ts = date.astimezone(timezone.utc).isoformat()
+
+        # 8) Processa cada sub-aposta
+        rows = []
+        for idx, entry in enumerate(bets_to_record):
+            # raw_*: como foi lido (bet_key e colunas raw_*); time_*: corrigido pelos jogos do dia
+            raw_home = entry.get('raw_casa') or entry['time_casa']
+            raw_away = entry.get('raw_fora') or entry['time_fora']
+            home, away = entry['time_casa'], entry['time_fora']
+            mercado_raw = entry.get('mercado')
+            odd_img = entry.get('odd_img')
+
+            # stake_pct por índice (escada)
+            if num_stakes >= num_markets:
+                stake_pct = stake_list[idx]
+            else:
+                stake_pct = stake_list[0]
+            # odd final
+            if odd_img is not None:
+                odd_val = odd_img
+            else:
+                if num_odds_caption >= num_markets:
+                    odd_val = odd_caption_list[idx]
+                else:
+                    odd_val = odd_single
+            logger.debug("[Índice %s] stake_pct=%s, odd_val=%s", idx, stake_pct, odd_val)
+
+            # Dedup
+            bkey = generate_bet_key(raw_home, raw_away, mercado_raw, odd_val)
+            is_dup = bkey in self.seen
+            if not is_dup:
+                self.seen.add(bkey)
+                if self.persist_seen:
+                    save_seen(self.seen)
+                logger.debug("Novo bet_key salvo: %s", bkey)
+            logger.debug("bet_key=%s, duplicate=%s", bkey, is_dup)
+
+            # Unidades
+            rec_amount = unit_value * stake_pct
+            if limit is not None and rec_amount > limit:
+                actual_amount = limit
+                actual_units = round(limit / unit_value, 4)
+            else:
+                actual_amount = rec_amount
+                actual_units = stake_pct
+            logger.debug("unit_value=%s, rec_amount=%s, actual_units=%s, actual_amount=%s",
+                         unit_value, rec_amount, actual_units, actual_amount)
+
+            # Canonicalização com histórico
+            suggest_home = self.historical.suggest_canonical(home)
+            suggest_away = self.historical.suggest_canonical(away)
+            canon_home = suggest_home if suggest_home else get_canonical(home)
+            canon_away = suggest_away if suggest_away else get_canonical(away)
+            logger.debug("Canonical: '%s' -> '%s', '%s' -> '%s'", raw_home, canon_home, raw_away, canon_away)
+
+            # Parse mercado (lado pelo par corrigido, que tem a ordem mandante/visitante do jogo)
+            market = canonical_market(mercado_raw or "", home, away)
+            bet_type, selection = (market.bet_type, market.selection) if market else (None, None)
+            competition = detect_competition(clean + " " + (mercado_raw or ""))
+            summary_hist = self.historical.suggest_summary(mercado_raw or "")
+            if summary_hist:
+                market_summary = summary_hist
+            elif market:
+                market_summary = market.summary
+            else:
+                market_summary = "" if not mercado_raw else summarize_fallback(mercado_raw)
+            logger.debug("market_summary escolhido: %s", market_summary)
+
+            row = [
+                bkey,
+                is_dup,
+                ts,
+                chat_id,
+                group_name,
+                raw_msg_identified,
+                raw_home,
+                raw_away,
+                canon_home,
+                canon_away,
+                mercado_raw or '',
+                market_summary or '',
+                odd_val or '',
+                stake_pct,
+                actual_units,
+                scale,
+                unit_value,
+                round(actual_amount, 2),
+                '',
+                selection or '',
+                bet_type or '',
+                competition or '',
+                bookmaker or '',
+                sport or ''
+            ]
+            logger.debug("[Índice %s] Row p/ Sheets: %s", idx, row)
+            rows.append(row)
+
+            # Atualiza histórico
+            if update_history:
+                self.historical.update(raw_home, raw_away, mercado_raw or "", market_summary or "")
+        return rows
+
+    async def ocr(self, message) -> str:
+        """
+        OCR da mídia da mensagem (ou "" se não houver mídia / falhar).
+        """
+        if message is None or not message.media:
+            return ""
+        with self.timer.stage("ocr"):
+            try:
+                return await perform_ocr_on_media(message)
+            except Exception as e:
+                logger.debug("perform_ocr_on_media falhou", exc_info=e)
+                return ""
+
+    async def handle(self, raw: str, chat_id, date, message=None, ocr_text: Optional[str] = None,
+                     fetch_chat=None, write: bool = True) -> List[list]:
+        """
+        Processa uma mensagem completa: OCR (se message tiver mídia e ocr_text não for dado),
+        parse e gravação das linhas no sink. Retorna as linhas geradas.
+        write=False devolve as linhas sem gravar (para escrita em lote pelo chamador).
+        """
+        # 1) OCR se houver mídia
+        if ocr_text is None:
+            ocr_text = await self.ocr(message)
+
+        # Metadados do grupo (cache em memória; get_chat só em miss/TTL expirado)
+        chat_info = await self.registry.resolve(chat_id, fetch_chat)
+
+        with self.timer.stage("parse"):
+            rows = self.parse_message(raw, chat_id, date, ocr_text=ocr_text, chat_info=chat_info)
+
+        if write and rows and self.sink is not None:
+            ids = await self.write(rows)
+            self.remember(message, raw, ocr_text, rows, ids)
+        return rows
+
+    async def handle_album(self, messages: list, fetch_chat=None, ocr_texts: Optional[List[str]] = None,
+                           write: bool = True) -> List[list]:
+        """
+        Álbum (mensagens com o mesmo grouped_id): OCR concorrente de todas as imagens e um único
+        parse contra a legenda do álbum (normalmente só uma das mensagens tem texto).
+        ocr_texts: OCR já feito, na ordem de messages. Retorna as linhas geradas.
+        """
+        messages, caption_msg, raw = album_caption(messages)
+        if ocr_texts is None:
+            ocr_texts = await asyncio.gather(*[self.ocr(m) for m in messages])
+        ocr_texts = list(ocr_texts)
+
+        chat_info = await self.registry.resolve(caption_msg.chat_id, fetch_chat)
+        with self.timer.stage("parse"):
+            rows = self.parse_message(raw, caption_msg.chat_id, caption_msg.date, chat_info=chat_info,
+                                      ocr_texts=ocr_texts)
+        logger.debug("Álbum %s: %s imagens → %s linhas", caption_msg.grouped_id, len(messages), len(rows))
+
+        if write and rows and self.sink is not None:
+            ids = await self.write(rows)
+            self.remember(caption_msg, raw, "", rows, ids, ocr_texts=ocr_texts,
+                          caption_pos=messages.index(caption_msg))
+        return rows
+
+    async def write(self, rows: List[list]) -> Optional[List[int]]:
+        """
+        Grava as linhas no sink. Em falha, tira as chaves novas do seen (persistindo) e
+        levanta WriteError, para o chamador não avançar o checkpoint da mensagem.
+        """
+        with self.timer.stage("write"):
+            ids = await self.sink.write(rows)
+        if ids is not None and len(ids) != len(rows):
+            self.forget(rows, save=True)
+            raise WriteError(f"{len(rows)} linha(s) não gravadas")
+        return ids
+
+    def forget(self, rows: List[list], save: bool = False) -> None:
+        """
+        Tira do seen as chaves que estas linhas registraram como novas (ex.: gravação falhou).
+        """
+        for row in rows:
+            if row[1] is False:
+                self.seen.discard(row[0])
+        if save and self.persist_seen:
+            save_seen(self.seen)
+
+    def remember(self, message, raw: str, ocr_text: str, rows: List[list], ids=None,
+                 ocr_texts: Optional[List[str]] = None, caption_pos: int = 0) -> None:
+        """
+        Guarda o estado da mensagem gravada para tratar edições (sem efeito sem edits/ids).
+        Álbuns ficam sob a mensagem da legenda, com o OCR de cada imagem e a posição da
+        imagem da legenda em ocr_texts.
+        """
+        if self.edits is None or message is None or not rows or not ids:
+            return
+        self.edits.remember(message.chat_id, message.id,
+                            MessageState(raw, ocr_text or "", media_id(message), list(rows), list(ids),
+                                         ocr_texts=list(ocr_texts) if ocr_texts is not None else None,
+                                         caption_pos=caption_pos))
+
+    async def handle_edit(self, raw: str, chat_id, date, message, fetch_chat=None) -> int:
+        """
+        Mensagem editada: parseia só a legenda nova, reaproveita o OCR em cache se a mídia não
+        mudou e regrava no lugar apenas as linhas que mudaram (nunca faz append).
+        Retorna quantas linhas foram atualizadas.
+        """
+        state = self.edits.get(chat_id, message.id) if self.edits is not None else None
+        if state is None:
+            logger.debug("Edição da mensagem %s do grupo %s fora do cache; ignorada", message.id, chat_id)
+            return 0
+        new_media = media_id(message)
+        if raw == state.raw and new_media == state.media_id:
+            return 0
+        if new_media == state.media_id:
+            ocr_text, ocr_texts = state.ocr_text, state.ocr_texts
+        elif state.ocr_texts is not None:
+            # álbum: só a imagem da mensagem editada mudou; as demais mantêm o OCR em cache
+            ocr_text, ocr_texts = "", list(state.ocr_texts)
+            ocr_texts[state.caption_pos] = await self.ocr(message)
+        else:
+            ocr_text, ocr_texts = await self.ocr(message), None
+        chat_info = await self.registry.resolve(chat_id, fetch_chat)
+
+        # as chaves antigas saem do seen só durante o parse, para a versão corrigida não virar
+        # "duplicada" de si mesma; o seen final depende do que for de fato regravado
+        hidden = {r[0] for r in state.rows if r[1] is False} & self.seen
+        self.seen -= hidden
+        try:
+            with self.timer.stage("parse"):
+                rows = self.parse_message(raw, chat_id, date, ocr_text=ocr_text, chat_info=chat_info,
+                                          update_history=False, ocr_texts=ocr_texts)
+        finally:
+            self.seen |= hidden
+        # chaves que o parse acabou de registrar: só ficam as das linhas regravadas
+        self.seen -= {r[0] for r in rows if r[1] is False} - hidden
+        if len(rows) != len(state.rows):
+            logger.warning(f"Edição da mensagem {message.id} do grupo {chat_id} mudou o número de apostas "
+                           f"({len(state.rows)} → {len(rows)}); só as {min(len(rows), len(state.rows))} "
+                           f"primeiras são atualizadas")
+        changed = [i for i in range(min(len(rows), len(state.rows))) if rows[i] != state.rows[i]]
+        if changed and self.sink is not None and hasattr(self.sink, "update"):
+            try:
+                with self.timer.stage("write"):
+                    await self.sink.update([state.ids[i] for i in changed], [state.rows[i] for i in changed],
+                                           [rows[i] for i in changed])
+            except Exception as e:
+                logger.error(f"Falha ao regravar a edição da mensagem {message.id} do grupo {chat_id}", exc_info=e)
+                return 0
+            self.forget([state.rows[i] for i in changed])
+            self.seen.update(rows[i][0] for i in changed if rows[i][1] is False)
+            if self.persist_seen:
+                save_seen(self.seen)
+            for i in changed:
+                state.rows[i] = rows[i]
+        else:
+            changed = []
+        state.raw, state.ocr_text, state.ocr_texts, state.media_id = raw, ocr_text, ocr_texts, new_media
+        logger.info(f"Mensagem {message.id} do grupo {chat_id} editada: {len(changed)} linha(s) atualizadas")
+        return len(changed)
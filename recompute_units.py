@@ -0,0 +1,238 @@
+# recompute_units.py
+"""
+Recalcula scale / unit_value / actual_units / amount_real de todo o histórico após mudança
+de BANK_TOTAL ou UNIT_SCALES, de forma vetorizada (NumPy), e grava só as células alteradas:
+no BetStore via executemany e nas abas do Sheets com poucas chamadas batch_update. O profit
+das apostas já liquidadas (result preenchido) é recalculado com o amount_real novo e vai no
+mesmo update.
+
+O limite da aposta não é gravado; ele é inferido das linhas em que o valor foi limitado
+(actual_units < stake_pct → limite = amount_real antigo).
+
+Uso:
+    python recompute_units.py --bank 5000             # store + abas do Sheets
+    python recompute_units.py --bank 5000 --dry-run   # só mostra quantas linhas mudariam
+    python recompute_units.py --bank 5000 --store-only
+"""
+
+import sys
+import time
+import logging
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import BANK_TOTAL
+import rules
+from sheets_utils import with_retry, index_to_col
+from chat_registry import bare_chat_id
+
+logger = logging.getLogger(__name__)
+
+# Colunas recalculadas (contíguas no HEADER: O..R)
+UNIT_COLUMNS = ["actual_units", "scale", "unit_value", "amount_real"]
+# Colunas do lucro das apostas liquidadas (result/profit ficam após o HEADER)
+PROFIT_COLUMNS = ["odd", "result", "profit"]
+UPDATE_RANGES_PER_CALL = 1000
+
+def to_float_array(values: Sequence) -> np.ndarray:
+    """
+    Converte strings do Sheets/SQLite ("1,5", "", None, 2.0) em float64 (NaN para vazio/inválido).
+    """
+    out = np.full(len(values), np.nan)
+    for i, v in enumerate(values):
+        if v is None or v == "":
+            continue
+        try:
+            out[i] = float(str(v).replace(',', '.'))
+        except ValueError:
+            pass
+    return out
+
+def scales_for_groups(group_ids: Sequence, scales: Optional[Dict[int, int]] = None,
+                      default: Optional[int] = None) -> np.ndarray:
+    """
+    Escala atual de cada linha (padrão: escalas das regras); o lookup roda uma vez por grupo distinto.
+    """
+    r = rules.current()
+    scales = r.unit_scales if scales is None else scales
+    default = r.default_scale if default is None else default
+    uniq, inverse = np.unique(np.asarray([str(g) for g in group_ids]), return_inverse=True)
+    per_group = np.empty(len(uniq))
+    for i, g in enumerate(uniq):
+        try:
+            per_group[i] = scales.get(bare_chat_id(g), default)
+        except ValueError:
+            per_group[i] = default
+    return per_group[inverse]
+
+def recompute(stake: np.ndarray, old_units: np.ndarray, old_amount: np.ndarray, scale: np.ndarray,
+              bank: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mesma regra do pipeline, vetorizada. Retorna (actual_units, unit_value, amount_real).
+    """
+    unit_value = np.round(bank / scale, 2)
+    limited = np.isfinite(old_units) & np.isfinite(stake) & (old_units < stake - 1e-9)
+    limit = np.where(limited, old_amount, np.nan)
+    rec_amount = unit_value * stake
+    capped = limited & (rec_amount > limit)
+    amount = np.where(capped, limit, rec_amount)
+    units = np.where(capped, np.round(limit / unit_value, 4), stake)
+    return units, unit_value, np.round(amount, 2)
+
+def _changed(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    both_nan = np.isnan(old) & np.isnan(new)
+    return ~both_nan & ~np.isclose(old, new, rtol=0, atol=1e-6, equal_nan=False)
+
+def recompute_table(group_ids: Sequence, stake: Sequence, units: Sequence, scale: Sequence,
+                    unit_value: Sequence, amount: Sequence, bank: float):
+    """
+    Recalcula colunas de uma tabela. Retorna (máscara de linhas alteradas, matriz nova N x 4
+    na ordem UNIT_COLUMNS).
+    """
+    stake_a = to_float_array(stake)
+    units_a = to_float_array(units)
+    amount_a = to_float_array(amount)
+    scale_old = to_float_array(scale)
+    uv_old = to_float_array(unit_value)
+
+    scale_new = scales_for_groups(group_ids)
+    units_new, uv_new, amount_new = recompute(stake_a, units_a, amount_a, scale_new, bank)
+
+    valid = np.isfinite(stake_a)
+    mask = valid & (_changed(units_a, units_new) | _changed(scale_old, scale_new)
+                    | _changed(uv_old, uv_new) | _changed(amount_a, amount_new))
+    new = np.column_stack([units_new, scale_new, uv_new, amount_new])
+    return mask, new
+
+def recompute_profit(result: Sequence, odd: Sequence, amount: np.ndarray,
+                     profit: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lucro das apostas liquidadas com o amount_real novo (mesma regra do settlement). Retorna
+    (máscara de lucros alterados, lucros novos; NaN nas não liquidadas).
+    """
+    # settlement importa este módulo: import aqui para não criar ciclo
+    from settlement import OUTCOMES, profits
+
+    score = {label: value for value, label in OUTCOMES.items()}
+    outcome = np.array([score.get(r or "", np.nan) for r in result], dtype=float)
+    new = profits(outcome, to_float_array(odd), amount)
+    return np.isfinite(new) & _changed(to_float_array(profit), new), new
+
+# ─── BetStore ──────────────────────────────────────────────
+def recompute_store(store, bank: float, dry_run: bool = False) -> int:
+    cols = ", ".join(f'"{c}"' for c in ["group_id", "stake_pct"] + UNIT_COLUMNS + PROFIT_COLUMNS)
+    rows = store.query(f"SELECT id, {cols} FROM bets ORDER BY id")
+    if not rows:
+        return 0
+    ids, groups, stake, units, scale, uv, amount, odd, result, profit = zip(*rows)
+    mask, new = recompute_table(groups, stake, units, scale, uv, amount, bank)
+    profit_mask, new_profit = recompute_profit(result, odd, new[:, 3], profit)
+    mask |= profit_mask
+    n = int(mask.sum())
+    if n and not dry_run:
+        idx = np.nonzero(mask)[0]
+        params = [(float(new[i, 0]), int(new[i, 1]), float(new[i, 2]), float(new[i, 3]),
+                   float(new_profit[i]) if profit_mask[i] else profit[i], ids[i]) for i in idx]
+        store.update_columns(UNIT_COLUMNS + ["profit"], params)
+    return n
+
+# ─── Sheets ────────────────────────────────────────────────
+def _runs(rows: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Agrupa índices ordenados em intervalos contíguos [início, fim].
+    """
+    if len(rows) == 0:
+        return []
+    breaks = np.nonzero(np.diff(rows) != 1)[0]
+    starts = np.concatenate([[rows[0]], rows[breaks + 1]])
+    ends = np.concatenate([rows[breaks], [rows[-1]]])
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def _fmt(v: float):
+    return "" if np.isnan(v) else (int(v) if float(v).is_integer() else float(v))
+
+def recompute_worksheet(ws, bank: float, dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Recalcula uma aba. Lê só as colunas necessárias e grava intervalos contíguos de linhas
+    alteradas (colunas O..R e, em abas já liquidadas, profit) em lotes de batch_update.
+    Retorna (linhas alteradas, chamadas de escrita).
+    """
+    header = ws.row_values(1)
+    if not header:
+        return 0, 0
+    try:
+        idx = {c: header.index(c) + 1 for c in ["group_id", "stake_pct"] + UNIT_COLUMNS}
+    except ValueError:
+        logger.warning(f"Aba '{ws.title}': cabeçalho sem colunas de unidades; ignorada")
+        return 0, 0
+    # result/profit só existem nas abas que já passaram pelo settlement
+    settled = all(c in header for c in PROFIT_COLUMNS)
+    read = ["group_id", "stake_pct"] + UNIT_COLUMNS + (PROFIT_COLUMNS if settled else [])
+    idx.update({c: header.index(c) + 1 for c in read if c not in idx})
+    letters = {c: index_to_col(i) for c, i in idx.items()}
+    ranges = [f"{letters[c]}2:{letters[c]}" for c in read]
+    cols = with_retry(ws.batch_get, ranges)
+    n_rows = max((len(c) for c in cols), default=0)
+    flat = [[(r[0] if r else "") for r in c] + [""] * (n_rows - len(c)) for c in cols]
+    mask, new = recompute_table(*flat[:6], bank=bank)
+    profit_changed = np.zeros(0, dtype=np.int64)
+    if settled:
+        odd, result, profit = flat[6:]
+        profit_mask, new_profit = recompute_profit(result, odd, new[:, 3], profit)
+        mask |= profit_mask
+        profit_changed = np.nonzero(profit_mask)[0]
+    changed = np.nonzero(mask)[0]
+    if dry_run or len(changed) == 0:
+        return len(changed), 0
+
+    contiguous = [idx[c] for c in UNIT_COLUMNS] == list(range(idx[UNIT_COLUMNS[0]], idx[UNIT_COLUMNS[0]] + 4))
+    data = []
+    for start, end in _runs(changed):
+        block = [[_fmt(v) for v in new[i]] for i in range(start, end + 1)]
+        if contiguous:
+            data.append({"range": f"{letters[UNIT_COLUMNS[0]]}{start + 2}:{letters[UNIT_COLUMNS[-1]]}{end + 2}",
+                         "values": block})
+        else:
+            for j, c in enumerate(UNIT_COLUMNS):
+                data.append({"range": f"{letters[c]}{start + 2}:{letters[c]}{end + 2}",
+                             "values": [[row[j]] for row in block]})
+    p = letters.get("profit")
+    for start, end in _runs(profit_changed):
+        data.append({"range": f"{p}{start + 2}:{p}{end + 2}",
+                     "values": [[_fmt(new_profit[i])] for i in range(start, end + 1)]})
+    calls = 0
+    for i in range(0, len(data), UPDATE_RANGES_PER_CALL):
+        with_retry(ws.batch_update, data[i:i + UPDATE_RANGES_PER_CALL], value_input_option='USER_ENTERED')
+        calls += 1
+    return len(changed), calls
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Recalcula unidades/valores de todo o histórico")
+    ap.add_argument("--bank", type=float, default=BANK_TOTAL, help="banca total (padrão: BANK_TOTAL)")
+    ap.add_argument("--dry-run", action="store_true", help="não grava nada")
+    ap.add_argument("--store-only", action="store_true", help="não mexe nas abas do Sheets")
+    args = ap.parse_args(argv)
+
+    from bet_store import BetStore
+    t0 = time.perf_counter()
+    n = recompute_store(BetStore(), args.bank, args.dry_run)
+    print(f"BetStore: {n} linhas {'mudariam' if args.dry_run else 'atualizadas'} ({time.perf_counter() - t0:.2f}s)")
+
+    if not args.store_only:
+        from sheets_utils import open_spreadsheet
+        from sheet_rotation import TabRotator
+        from telegram_bot import ensure_service_account_file
+
+        ensure_service_account_file()
+        rotator = TabRotator(open_spreadsheet())
+        for ws in rotator.tabs():
+            t0 = time.perf_counter()
+            n, calls = recompute_worksheet(ws, args.bank, args.dry_run)
+            print(f"Aba '{ws.title}': {n} linhas {'mudariam' if args.dry_run else 'atualizadas'} "
+                  f"em {calls} chamada(s) ({time.perf_counter() - t0:.2f}s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
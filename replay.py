@@ -0,0 +1,186 @@
+# replay.py
+"""
+Modo replay: passa mensagens gravadas (JSONL) pelo mesmo pipeline do handler,
+gravando numa planilha fake em memória, e reporta throughput, tempo por etapa
+e diferenças de parse contra um arquivo golden.
+
+Formato do corpus (uma mensagem por linha):
+    {"caption": "...", "media": "fotos/123.jpg", "chat_id": -1002625305937,
+     "date": "2026-10-01T18:30:00+00:00", "chat_title": "Arrudex"}
+"media", "chat_title" e "ocr_text" (OCR pré-computado) são opcionais; sem "date" vale uma data
+fixa (REPLAY_EPOCH), para que data_hora seja a mesma a cada execução.
+
+Uso:
+    python replay.py corpus.jsonl --golden golden.jsonl
+    python replay.py corpus.jsonl --golden golden.jsonl --write-golden
+    python replay.py corpus.jsonl --no-fixtures --no-templates   # só o parse genérico
+
+Como no bot ao vivo, o pipeline usa os jogos do dia (teams_cache.json, FixtureIndex) e os
+templates de legenda declarados em GROUP_SETTINGS (CaptionTemplates); os jogos só valem se
+o arquivo for do dia, então um golden gravado com eles pode mudar de um dia para o outro.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import List
+
+from sheets_utils import HEADER
+from fake_sheet import FakeWorksheet, cell_value
+from analysis_utils import HistoricalAnalyzer
+from chat_registry import ChatRegistry
+from ocr_utils import ocr_image
+from pipeline import BetPipeline, StageTimer
+
+logger = logging.getLogger(__name__)
+
+# Data usada quando o registro do corpus não traz "date" (determinística, para o diff do golden)
+REPLAY_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+class FakeSheetSink:
+    """
+    Sink que grava as linhas direto na FakeWorksheet (sem thread, sem rede).
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    async def write(self, rows: List[list]) -> None:
+        for row in rows:
+            self.sheet.append_row(row, value_input_option='USER_ENTERED')
+
+def load_corpus(path: str) -> List[dict]:
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                logger.warning(f"Linha {n} do corpus inválida; ignorada ({e})")
+    return records
+
+def _parse_date(value) -> datetime:
+    if not value:
+        return REPLAY_EPOCH
+    dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+async def replay(records: List[dict], base_dir: str = ".", use_ocr: bool = True,
+                 use_fixtures: bool = True, use_templates: bool = True):
+    """
+    Executa o corpus pelo pipeline. Retorna (resultados por mensagem, timer, segundos totais).
+    """
+    sheet = FakeWorksheet()
+    sheet.append_row(HEADER)
+    historical = HistoricalAnalyzer(sheet)
+    registry = ChatRegistry(ttl=0)
+    timer = StageTimer()
+    fixtures = templates = None
+    if use_fixtures:
+        from teams_cache import FixtureIndex
+        fixtures = FixtureIndex()
+    if use_templates:
+        from caption_templates import CaptionTemplates
+        templates = CaptionTemplates()
+        templates.load_declared()
+    pipeline = BetPipeline(historical, set(), registry, sink=FakeSheetSink(sheet), timer=timer,
+                           persist_seen=False, fixtures=fixtures, templates=templates)
+
+    results = []
+    t0 = time.perf_counter()
+    for i, rec in enumerate(records):
+        chat_id = int(rec.get("chat_id") or 0)
+        if rec.get("chat_title"):
+            registry.set_title(chat_id, rec["chat_title"])
+        ocr_text = rec.get("ocr_text")
+        media = rec.get("media")
+        if ocr_text is None:
+            ocr_text = ""
+            if use_ocr and media:
+                with timer.stage("ocr"):
+                    ocr_text = await asyncio.to_thread(ocr_image, os.path.join(base_dir, media))
+        with timer.stage("total"):
+            rows = await pipeline.handle(rec.get("caption") or "", chat_id, _parse_date(rec.get("date")),
+                                         ocr_text=ocr_text)
+        results.append({"index": i, "rows": [[cell_value(v) for v in r] for r in rows]})
+    elapsed = time.perf_counter() - t0
+    return results, timer, elapsed
+
+def diff_golden(results: List[dict], golden_path: str) -> List[str]:
+    """
+    Compara os resultados com o golden e retorna lista de diferenças legíveis.
+    """
+    golden = {g["index"]: g["rows"] for g in load_corpus(golden_path)}
+    diffs = []
+    for res in results:
+        i = res["index"]
+        expected = golden.get(i)
+        if expected is None:
+            diffs.append(f"#{i}: ausente no golden")
+            continue
+        if len(expected) != len(res["rows"]):
+            diffs.append(f"#{i}: {len(res['rows'])} linhas (golden: {len(expected)})")
+            continue
+        for j, (got, exp) in enumerate(zip(res["rows"], expected)):
+            if len(got) != len(exp):
+                diffs.append(f"#{i}.{j}: {len(got)} colunas (golden: {len(exp)})")
+            for col, (a, b) in enumerate(zip(got, exp)):
+                if a != b:
+                    name = HEADER[col] if col < len(HEADER) else str(col)
+                    diffs.append(f"#{i}.{j} {name}: {b!r} → {a!r}")
+    extra = set(golden) - {r["index"] for r in results}
+    for i in sorted(extra):
+        diffs.append(f"#{i}: presente só no golden")
+    return diffs
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Replay offline do handler de apostas")
+    ap.add_argument("corpus", help="arquivo JSONL com mensagens gravadas")
+    ap.add_argument("--golden", help="arquivo JSONL com linhas esperadas por mensagem")
+    ap.add_argument("--write-golden", action="store_true", help="sobrescreve o golden com a saída atual")
+    ap.add_argument("--no-ocr", action="store_true", help="ignora mídia (usa só ocr_text pré-computado)")
+    ap.add_argument("--no-fixtures", action="store_true", help="não confere os times com os jogos do dia")
+    ap.add_argument("--no-templates", action="store_true", help="não usa os templates de legenda por grupo")
+    args = ap.parse_args(argv)
+
+    records = load_corpus(args.corpus)
+    base_dir = os.path.dirname(os.path.abspath(args.corpus))
+    results, timer, elapsed = asyncio.run(replay(records, base_dir=base_dir, use_ocr=not args.no_ocr,
+                                                 use_fixtures=not args.no_fixtures,
+                                                 use_templates=not args.no_templates))
+
+    n = len(records)
+    n_rows = sum(len(r["rows"]) for r in results)
+    rate = n / elapsed if elapsed > 0 else 0.0
+    print(f"Mensagens: {n} | Linhas: {n_rows} | Tempo: {elapsed:.3f}s | {rate:.1f} msg/s")
+    for stage, info in sorted(timer.report().items()):
+        print(f"  {stage:<8} total={info['total_s']:.4f}s  n={info['count']}  média={info['avg_ms']:.3f}ms")
+
+    if args.golden and args.write_golden:
+        with open(args.golden, 'w', encoding='utf-8') as f:
+            for res in results:
+                f.write(json.dumps(res, ensure_ascii=False) + "\n")
+        print(f"Golden escrito em {args.golden}")
+        return 0
+    if args.golden:
+        diffs = diff_golden(results, args.golden)
+        if diffs:
+            print(f"❌ {len(diffs)} diferença(s) contra o golden:")
+            for d in diffs:
+                print(f"  {d}")
+            return 1
+        print("✅ Saída idêntica ao golden")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
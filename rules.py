@@ -0,0 +1,238 @@
+# rules.py
+"""
+Regras de parsing e de grupos recarregáveis a quente a partir de um arquivo JSON externo
+(RULES_FILE, padrão rules.json): escalas por grupo (UNIT_SCALES, que também definem os grupos
+monitorados), GROUP_SETTINGS, competições, esportes, linhas de ruído, casas de aposta e as
+regex de stake/odd/limite.
+
+Chaves ausentes no arquivo (ou o arquivo inteiro) usam os valores padrão de config.py.
+Mudanças no arquivo são detectadas pelo mtime (no máximo a cada RULES_RECHECK segundos):
+tudo é recompilado uma vez num novo objeto Rules imutável, que substitui o anterior numa
+única atribuição. Se o arquivo novo for inválido (JSON ou regex), as regras atuais continuam.
+
+Uso:
+    python rules.py --dump > rules.json    # gera o arquivo a partir dos padrões atuais
+    python rules.py --check                # valida o arquivo e mostra o resumo
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import config
+from config import RULES_FILE, RULES_RECHECK
+
+logger = logging.getLogger(__name__)
+
+def defaults() -> dict:
+    """
+    Regras padrão (config.py), no mesmo formato do arquivo.
+    """
+    return {
+        "unit_scales": {str(k): v for k, v in config.UNIT_SCALES.items()},
+        "default_scale": config.DEFAULT_SCALE,
+        "group_settings": {str(k): v for k, v in config.GROUP_SETTINGS.items()},
+        "competitions": list(config.COMPETITIONS),
+        "sports_keywords": list(config.SPORTS_KEYWORDS),
+        "ruido_lines": list(config.RUIDO_LINES),
+        "bookmaker_map": dict(config.BOOKMAKER_MAP),
+        "patterns": {
+            "stake": config.PATTERN_STAKE.pattern,
+            "limit": config.PATTERN_LIMIT.pattern,
+            "odd": config.PATTERN_ODD.pattern,
+        },
+    }
+
+def _any_of(patterns: List[str], flags: int = 0) -> re.Pattern:
+    """
+    Uma única regex equivalente a testar cada padrão da lista (nunca casa se a lista for vazia).
+    """
+    for p in patterns:
+        re.compile(p, flags)  # erro aponta o padrão inválido, não a alternância
+    if not patterns:
+        return re.compile(r'(?!)')
+    return re.compile("|".join(f"(?:{p})" for p in patterns), flags)
+
+@dataclass(frozen=True)
+class Rules:
+    unit_scales: Dict[int, int]
+    default_scale: int
+    group_settings: Dict[int, dict]
+    competitions: Tuple[Tuple[str, str], ...]        # (nome, nome em minúsculas)
+    sports_keywords: Tuple[Tuple[str, str], ...]     # (palavra em minúsculas, esporte em title case)
+    bookmaker_map: Tuple[Tuple[str, str], ...]       # (palavra-chave, casa)
+    ruido_caption: re.Pattern                        # search, como em clean_caption
+    ruido_ocr: re.Pattern                            # match + IGNORECASE, como em limpa_linhas_ocr
+    pattern_stake: re.Pattern
+    pattern_limit: re.Pattern
+    pattern_odd: re.Pattern
+    monitored: FrozenSet[int] = field(default=frozenset())
+
+def build(data: dict) -> Rules:
+    """
+    Compila as regras (padrões + chaves de data). Levanta ValueError/re.error se inválidas.
+    """
+    d = defaults()
+    for key, value in data.items():
+        if key not in d:
+            logger.warning(f"Regras: chave desconhecida '{key}' ignorada")
+            continue
+        d[key] = {**d[key], **value} if key == "patterns" else value
+    unit_scales = {int(k): int(v) for k, v in d["unit_scales"].items()}
+    ruido = [str(p) for p in d["ruido_lines"]]
+    return Rules(
+        unit_scales=unit_scales,
+        default_scale=int(d["default_scale"]),
+        group_settings={int(k): dict(v) for k, v in d["group_settings"].items()},
+        competitions=tuple((c, c.lower()) for c in d["competitions"]),
+        sports_keywords=tuple((k.lower(), k.title()) for k in d["sports_keywords"]),
+        bookmaker_map=tuple((k.lower(), v) for k, v in d["bookmaker_map"].items()),
+        ruido_caption=_any_of(ruido),
+        ruido_ocr=_any_of(ruido, re.IGNORECASE),
+        pattern_stake=re.compile(d["patterns"]["stake"], re.IGNORECASE),
+        pattern_limit=re.compile(d["patterns"]["limit"], re.IGNORECASE),
+        pattern_odd=re.compile(d["patterns"]["odd"], re.IGNORECASE),
+        monitored=frozenset(unit_scales),
+    )
+
+def read_file(path: str) -> Tuple[dict, Optional[float]]:
+    """
+    (conteúdo, mtime) do arquivo de regras; ({}, None) se não existir.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}, None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: esperado um objeto JSON")
+    return data, mtime
+
+class RulesSource:
+    """
+    Regras ativas + recarga pelo mtime do arquivo. current() é barato (checa o relógio e,
+    no máximo a cada `recheck` segundos, o mtime); a troca é uma atribuição de referência,
+    então leitores nunca veem regras pela metade.
+    """
+
+    def __init__(self, path: str = RULES_FILE, recheck: float = RULES_RECHECK):
+        self.path = path
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Rules, Rules], None]] = []
+        self._checked_at = 0.0
+        self._mtime: Optional[float] = None
+        self._rules = build({})
+        self.reload()
+
+    def current(self) -> Rules:
+        if self.recheck >= 0 and time.monotonic() - self._checked_at >= self.recheck:
+            self.reload()
+        return self._rules
+
+    def on_change(self, fn: Callable[[Rules, Rules], None]) -> None:
+        """
+        fn(antigas, novas) é chamada após cada troca, na thread que detectou a mudança.
+        """
+        self._listeners.append(fn)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Recarrega se o mtime mudou (ou sempre, com force). Retorna True se as regras trocaram.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False  # outra thread já está recarregando; segue com as regras atuais
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if not force and mtime == self._mtime:
+                return False
+            # não tenta de novo até o arquivo mudar outra vez, mesmo se for inválido
+            self._mtime = mtime
+            old = self._rules
+            try:
+                data, _ = read_file(self.path)
+                new = build(data)
+            except Exception as e:
+                logger.error(f"Regras: {self.path} inválido; mantendo as regras atuais ({e})")
+                return False
+            self._rules = new
+        finally:
+            self._lock.release()
+        added = new.monitored - old.monitored
+        removed = old.monitored - new.monitored
+        logger.info(f"Regras carregadas de {self.path if mtime else 'config.py'}: "
+                    f"{len(new.monitored)} grupos (+{len(added)}/-{len(removed)}), "
+                    f"{len(new.bookmaker_map)} casas, {len(new.competitions)} competições")
+        for fn in list(self._listeners):
+            try:
+                fn(old, new)
+            except Exception as e:
+                logger.error("Regras: erro em listener de mudança", exc_info=e)
+        return True
+
+_source: Optional[RulesSource] = None
+_source_lock = threading.Lock()
+
+def source() -> RulesSource:
+    global _source
+    if _source is None:
+        with _source_lock:
+            if _source is None:
+                _source = RulesSource()
+    return _source
+
+def current() -> Rules:
+    """
+    Regras ativas do processo (cada worker tem a sua cópia e recarrega sozinho).
+    """
+    return source().current()
+
+async def watch(interval: float = RULES_RECHECK) -> None:
+    """
+    Tarefa do bot: checa o arquivo mesmo sem mensagens chegando, para que listeners
+    (ex.: grupos monitorados) sejam aplicados sem esperar o próximo current().
+    """
+    while True:
+        await asyncio.sleep(max(interval, 0.5))
+        try:
+            await asyncio.to_thread(source().reload)
+        except Exception as e:
+            logger.error("Regras: falha ao checar o arquivo", exc_info=e)
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Arquivo de regras recarregável (rules.json)")
+    ap.add_argument("--dump", action="store_true", help="imprime as regras padrão de config.py em JSON")
+    ap.add_argument("--check", action="store_true", help="valida o arquivo de regras")
+    ap.add_argument("--path", default=RULES_FILE)
+    args = ap.parse_args(argv)
+
+    if args.dump:
+        json.dump(defaults(), sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return 0
+    try:
+        data, mtime = read_file(args.path)
+        r = build(data)
+    except Exception as e:
+        print(f"❌ {args.path}: {e}")
+        return 1
+    print(f"✅ {args.path if mtime else 'config.py (arquivo ausente)'}: {len(r.monitored)} grupos, "
+          f"{len(r.bookmaker_map)} casas, {len(r.competitions)} competições, "
+          f"{len(r.sports_keywords)} esportes")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,427 @@
+# settlement.py
+"""
+Liquidação em lote das apostas contra um arquivo local de resultados (RESULTS_FILE, padrão
+results.json, no mesmo espírito do teams_cache.json):
+
+    {"results": [
+        {"date": "2026-10-18", "home": "Flamengo", "away": "Palmeiras",
+         "home_score": 2, "away_score": 1, "corners": 9, "cards": 4},
+        ["2026-10-18", "Santos", "Vasco", 0, 0]
+    ]}
+
+Cada aposta é ligada ao jogo por um índice (data, mandante, visitante) com os nomes
+normalizados por teams_cache.team_key: vale a data do post ou ±1 dia (tips saem na véspera;
+data_hora é UTC) e o par invertido. A avaliação é vetorizada (NumPy) a partir do mercado
+canônico (market_utils): totais de gols/pontos (escanteios/cartões se o resultado trouxer),
+handicap (inclusive linhas asiáticas .25/.75), 1X2, dupla chance, empate anula e ambas
+marcam. O arquivo só traz o placar do jogo inteiro, então mercados de 1º/2º tempo ficam sem
+liquidação.
+
+result (win/half_win/push/half_loss/loss) e profit vão para o BetStore via executemany e para
+as colunas logo após o HEADER de cada aba com poucas chamadas batch_update. Por padrão só as
+linhas ainda não liquidadas são lidas (incremental); --full reavalia todo o histórico e grava
+apenas o que mudou.
+
+Uso:
+    python settlement.py                      # incremental: store + abas do Sheets
+    python settlement.py --full --dry-run     # só mostra quantas linhas mudariam
+    python settlement.py --store-only --results resultados.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import RESULTS_FILE
+from sheets_utils import HEADER, SETTLEMENT_COLUMNS, with_retry, index_to_col
+from teams_cache import team_key
+from market_utils import canonical_market
+from recompute_units import to_float_array, UPDATE_RANGES_PER_CALL
+
+logger = logging.getLogger(__name__)
+
+# Dias (relativos à data do post) em que o jogo é procurado, em ordem de preferência
+DAY_OFFSETS = (0, 1, -1)
+# Tempos marcados na selection (market_utils.Market.period); não liquidados contra o placar final
+PERIODS = ("1h", "2h")
+OUTCOMES = {1.0: "win", 0.5: "half_win", 0.0: "push", -0.5: "half_loss", -1.0: "loss"}
+# Linhas intactas toleradas dentro de um bloco de escrita no Sheets
+BLOCK_MAX_GAP = 500
+BET_COLUMNS = ["bet_key", "data_hora", "time_casa", "time_fora", "raw_time_casa", "raw_time_fora",
+               "mercado_raw", "bet_type", "selection", "odd", "amount_real"]
+
+# ─── Resultados ────────────────────────────────────────────
+def _parse_result(r) -> Optional[tuple]:
+    """
+    (data, casa, fora, gols casa, gols fora, escanteios, cartões) de um item do arquivo,
+    ou None se faltar algo (jogo sem placar ainda não terminou).
+    """
+    try:
+        if isinstance(r, dict):
+            item = (r["date"], r["home"], r["away"], r["home_score"], r["away_score"],
+                    r.get("corners"), r.get("cards"))
+        else:
+            item = tuple(r[:5]) + tuple((list(r[5:7]) + [None, None])[:2])
+        day = date.fromisoformat(str(item[0])[:10]).isoformat()
+        scores = [float(v) if v is not None else np.nan for v in item[3:]]
+    except (KeyError, IndexError, TypeError, ValueError):
+        logger.debug(f"results: jogo inválido ignorado: {r}")
+        return None
+    if not item[1] or not item[2] or np.isnan(scores[0]) or np.isnan(scores[1]):
+        return None
+    return (day, item[1], item[2], *scores)
+
+class ResultsIndex:
+    """
+    Resultados em arrays (placar, escanteios, cartões) + índice (data, casa, fora) → posição.
+    """
+
+    def __init__(self, results: List[tuple]):
+        self.home_score = np.array([r[3] for r in results], dtype=float)
+        self.away_score = np.array([r[4] for r in results], dtype=float)
+        self.corners = np.array([r[5] for r in results], dtype=float)
+        self.cards = np.array([r[6] for r in results], dtype=float)
+        self._index: Dict[Tuple[str, str, str], int] = {}
+        for i, r in enumerate(results):
+            self._index.setdefault((r[0], team_key(r[1]), team_key(r[2])), i)
+
+    @classmethod
+    def load(cls, path: str = RESULTS_FILE) -> "ResultsIndex":
+        data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.warning(f"Falha ao ler {path}", exc_info=e)
+        items = data.get("results", []) if isinstance(data, dict) else data
+        results = [r for r in (_parse_result(x) for x in items or []) if r is not None]
+        logger.info(f"ResultsIndex: {len(results)} resultados carregados de {path}")
+        return cls(results)
+
+    def __len__(self) -> int:
+        return len(self.home_score)
+
+    def join(self, days: List[str], homes: List[str], aways: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posição do jogo de cada aposta (-1 sem resultado) e máscara de par invertido.
+        team_key e as datas vizinhas são calculadas uma vez por valor distinto.
+        """
+        keys: Dict[str, str] = {}
+        near: Dict[str, List[str]] = {}
+        pos = np.full(len(days), -1, dtype=np.int64)
+        swapped = np.zeros(len(days), dtype=bool)
+        for i, (d, h, a) in enumerate(zip(days, homes, aways)):
+            if not d or not h or not a:
+                continue
+            for name in (h, a):
+                if name not in keys:
+                    keys[name] = team_key(name)
+            hk, ak = keys[h], keys[a]
+            day = d[:10]
+            if day not in near:
+                try:
+                    base = date.fromisoformat(day)
+                    near[day] = [(base + timedelta(days=o)).isoformat() for o in DAY_OFFSETS]
+                except ValueError:
+                    near[day] = []
+            for dd in near[day]:
+                j = self._index.get((dd, hk, ak))
+                if j is not None:
+                    pos[i] = j
+                    break
+                j = self._index.get((dd, ak, hk))
+                if j is not None:
+                    pos[i], swapped[i] = j, True
+                    break
+        return pos, swapped
+
+# ─── Mercados ──────────────────────────────────────────────
+def _split_selection(selection: str) -> Tuple[str, float, Optional[str]]:
+    """
+    "over 2.5" → ("over", 2.5, None); "home -1.5" → ("home", -1.5, None); "1X" → ("1X", nan, None);
+    "over 0.5 1h" → ("over", 0.5, "1h").
+    """
+    side, line, period = "", np.nan, None
+    for part in (selection or "").split():
+        if part in PERIODS:
+            period = part
+            continue
+        try:
+            line = float(part)
+        except ValueError:
+            side = side or part
+    return side, line, period
+
+def market_arrays(bet_types, selections, markets, homes, aways) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (bet_type, lado, linha) por aposta. O texto do mercado (mercado_raw) é reinterpretado pelo
+    canonicalizador atual, então linhas gravadas por versões antigas (bet_type over/under sem
+    separar gols de escanteios, tempo do jogo descartado, odd lida como linha de handicap) não
+    são liquidadas com o mercado errado; o lado gravado só completa o que o texto não resolve.
+    Mercados de um só tempo (1T/2T) e textos que o canonicalizador não reconhece ficam com
+    bet_type "" (NaN na avaliação): results.json só traz o placar do jogo inteiro.
+    homes/aways: nomes na ordem mandante/visitante usada no join com os resultados.
+    Cada combinação distinta é resolvida uma vez.
+    """
+    memo: Dict[tuple, Tuple[str, str, float]] = {}
+    out_type, out_side, out_line = [], [], []
+    for bt, sel, mkt, h, a in zip(bet_types, selections, markets, homes, aways):
+        key = (bt, sel, mkt, h, a)
+        parsed = memo.get(key)
+        if parsed is None:
+            stored_side, stored_line, period = _split_selection(sel)
+            if mkt:
+                m = canonical_market(mkt, h, a)
+                if m is None:
+                    parsed = ("", "", np.nan)
+                else:
+                    side = m.side or (stored_side if bt == m.bet_type else "")
+                    parsed = (m.bet_type, side or "", np.nan if m.line is None else m.line)
+                    period = m.period
+            elif bt in ("over", "under"):
+                parsed = ("total", bt, stored_line)
+            else:
+                parsed = (bt or "", stored_side, stored_line)
+            if period is not None:
+                parsed = ("", "", np.nan)
+            memo[key] = parsed
+        out_type.append(parsed[0])
+        out_side.append(parsed[1])
+        out_line.append(parsed[2])
+    return np.array(out_type, dtype=object), np.array(out_side, dtype=object), np.array(out_line, dtype=float)
+
+# ─── Avaliação vetorizada ──────────────────────────────────
+def _asian(margin: np.ndarray, line: np.ndarray) -> np.ndarray:
+    """
+    Resultado de uma margem contra a linha: linhas .25/.75 dividem a aposta nas duas linhas
+    vizinhas (meio ganho/meio perdido); as demais dão win/push/loss.
+    """
+    q = np.where(np.isclose(np.abs(line * 4) % 2, 1), 0.25, 0.0)
+    return 0.5 * (np.sign(margin - q) + np.sign(margin + q))
+
+def evaluate(bet_type: np.ndarray, side: np.ndarray, line: np.ndarray, home: np.ndarray,
+             away: np.ndarray, corners: np.ndarray, cards: np.ndarray) -> np.ndarray:
+    """
+    Resultado por aposta: 1 win, .5 half_win, 0 push, -.5 half_loss, -1 loss; NaN se o
+    mercado não for avaliável (lado desconhecido, sem escanteios no resultado etc.).
+    """
+    out = np.full(len(bet_type), np.nan)
+    win_loss = lambda cond: np.where(cond, 1.0, -1.0)
+    diff = home - away
+    for bt, value in (("total", home + away), ("corners", corners), ("cards", cards)):
+        for sd, sign in (("over", 1.0), ("under", -1.0)):
+            m = (bet_type == bt) & (side == sd)
+            out[m] = _asian(sign * (value[m] - line[m]), line[m])
+    for sd, sign in (("home", 1.0), ("away", -1.0)):
+        m = (bet_type == "handicap") & (side == sd)
+        out[m] = _asian(sign * diff[m] + line[m], line[m])
+        m = (bet_type == "dnb") & (side == sd)
+        out[m] = np.sign(sign * diff[m])
+        m = (bet_type == "1x2") & (side == sd)
+        out[m] = win_loss(sign * diff[m] > 0)
+    m = (bet_type == "1x2") & (side == "draw")
+    out[m] = win_loss(diff[m] == 0)
+    for sd, cond in (("1X", diff >= 0), ("X2", diff <= 0), ("12", diff != 0)):
+        m = (bet_type == "double_chance") & (side == sd)
+        out[m] = win_loss(cond[m])
+    both = (home > 0) & (away > 0)
+    for sd, cond in (("yes", both), ("no", ~both)):
+        m = (bet_type == "btts") & (side == sd)
+        out[m] = win_loss(cond[m])
+    out[np.isnan(home) | np.isnan(away)] = np.nan
+    return out
+
+def profits(outcome: np.ndarray, odd: np.ndarray, amount: np.ndarray) -> np.ndarray:
+    """
+    Lucro em R$: ganho proporcional (odd - 1) no win/half_win, perda proporcional do valor.
+    """
+    return np.round(np.where(outcome > 0, amount * (odd - 1) * outcome, amount * outcome), 2)
+
+# ─── BetStore ──────────────────────────────────────────────
+@dataclass
+class Settlement:
+    ids: List[int] = field(default_factory=list)
+    keys: List[str] = field(default_factory=list)
+    positions: List[Optional[Tuple[str, int]]] = field(default_factory=list)
+    values: List[list] = field(default_factory=list)    # [result, profit] por linha
+    scanned: int = 0
+
+def settle_store(store, results: ResultsIndex, full: bool = False, dry_run: bool = False) -> Settlement:
+    """
+    Liquida as apostas do store (só as sem result, salvo full=True) e grava result/profit das
+    que mudaram. Retorna as linhas alteradas, com a posição no Sheets quando conhecida.
+    """
+    cols = ", ".join(f'"{c}"' for c in BET_COLUMNS + SETTLEMENT_COLUMNS)
+    where = "" if full else "WHERE result IS NULL"
+    rows = store.query(f"SELECT id, sheet_tab, sheet_row, {cols} FROM bets {where} ORDER BY id")
+    if not rows or not len(results):
+        return Settlement(scanned=len(rows))
+    (ids, tabs, sheet_rows, keys, days, homes, aways, raw_homes, raw_aways, markets, bet_types, selections,
+     odd, amount, old_result, old_profit) = zip(*rows)
+
+    # join pelos nomes como foram lidos (raw_*); sem raw ou sem resultado, pelos time_* gravados
+    pos, swapped = results.join(days, raw_homes, raw_aways)
+    miss = np.nonzero(pos < 0)[0]
+    if len(miss):
+        pos[miss], swapped[miss] = results.join([days[i] for i in miss], [homes[i] for i in miss],
+                                                [aways[i] for i in miss])
+    matched = pos >= 0
+    take = np.where(matched, pos, 0)
+    hs = np.where(matched, results.home_score[take], np.nan)
+    aws = np.where(matched, results.away_score[take], np.nan)
+    hs, aws = np.where(swapped, aws, hs), np.where(swapped, hs, aws)
+    corners = np.where(matched, results.corners[take], np.nan)
+    cards = np.where(matched, results.cards[take], np.nan)
+
+    bt, side, line = market_arrays(bet_types, selections, markets, homes, aways)
+    outcome = evaluate(bt, side, line, hs, aws, corners, cards)
+    profit = profits(outcome, to_float_array(odd), to_float_array(amount))
+
+    labels = np.array([OUTCOMES.get(float(o), "") if np.isfinite(o) else "" for o in outcome], dtype=object)
+    old_p = to_float_array(old_profit)
+    same_profit = (np.isnan(old_p) & np.isnan(profit)) | np.isclose(old_p, profit, rtol=0, atol=0.005)
+    old_labels = np.array([r or "" for r in old_result], dtype=object)
+    changed = np.isfinite(outcome) & ((labels != old_labels) | ~same_profit)
+    # mercado que não é mais liquidável (ex.: 1º tempo, antes tratado como jogo inteiro): limpa
+    changed |= (bt == "") & (old_labels != "")
+    idx = np.nonzero(changed)[0]
+    logger.info(f"Settlement: {len(rows)} apostas lidas, {int(matched.sum())} com resultado, "
+                f"{len(idx)} liquidadas/alteradas")
+
+    out = Settlement(scanned=len(rows))
+    for i in idx:
+        p = None if np.isnan(profit[i]) else float(profit[i])
+        out.ids.append(ids[i])
+        out.keys.append(keys[i])
+        out.positions.append((tabs[i], sheet_rows[i]) if sheet_rows[i] else None)
+        out.values.append([labels[i], "" if p is None else p])
+    if out.ids and not dry_run:
+        store.update_columns(SETTLEMENT_COLUMNS,
+                             [(v[0] or None, None if v[1] == "" else v[1], i) for i, v in zip(out.ids, out.values)])
+    return out
+
+# ─── Sheets ────────────────────────────────────────────────
+def locate_rows(sheet, store, settled: Settlement) -> int:
+    """
+    Posição no Sheets das linhas sem sheet_tab/sheet_row (ex.: importadas da planilha antes
+    do store guardar posições): lê só a coluna bet_key de cada aba e guarda o que achar no
+    store, para as próximas execuções. Retorna quantas foram localizadas.
+    """
+    missing = [k for k, p in enumerate(settled.positions) if p is None]
+    if not missing:
+        return 0
+    col = index_to_col(HEADER.index("bet_key") + 1)
+    where: Dict[str, List[Tuple[str, int]]] = {}
+    for ws in sheet.tabs():
+        values = with_retry(ws.get, f"{col}2:{col}")
+        for r, v in enumerate(values, start=2):
+            if v and v[0]:
+                where.setdefault(v[0], []).append((ws.title, r))
+    found = []
+    for k in missing:
+        spots = where.get(settled.keys[k])
+        if spots:
+            settled.positions[k] = spots.pop(0)
+            found.append(k)
+    if found:
+        store.update_columns(["sheet_tab", "sheet_row"],
+                             [(*settled.positions[k], settled.ids[k]) for k in found])
+    return len(found)
+
+def _blocks(rows: List[int], max_gap: int = BLOCK_MAX_GAP) -> List[Tuple[int, int]]:
+    """
+    Intervalos [início, fim] cobrindo as linhas ordenadas; buracos de até max_gap linhas
+    ficam dentro do bloco (células None não são gravadas pela API).
+    """
+    blocks: List[Tuple[int, int]] = []
+    for r in rows:
+        if blocks and r - blocks[-1][1] <= max_gap:
+            blocks[-1] = (blocks[-1][0], r)
+        else:
+            blocks.append((r, r))
+    return blocks
+
+def write_sheet(sheet, settled: Settlement) -> Tuple[int, int]:
+    """
+    Grava result/profit nas colunas após o HEADER: poucos blocos grandes por aba, com None
+    nas linhas que não mudaram (a API ignora células None), e uma chamada batch_update por
+    lote de blocos; o cabeçalho das colunas vai junto. Retorna (linhas, chamadas).
+    """
+    first = index_to_col(len(HEADER) + 1)
+    last = index_to_col(len(HEADER) + len(SETTLEMENT_COLUMNS))
+    skip = [None] * len(SETTLEMENT_COLUMNS)
+    by_tab: Dict[str, Dict[int, list]] = {}
+    for p, values in zip(settled.positions, settled.values):
+        if p is not None:
+            by_tab.setdefault(p[0], {})[p[1]] = values
+    n = calls = 0
+    for tab, rows in by_tab.items():
+        try:
+            ws = sheet.worksheet(tab)
+        except Exception:
+            logger.warning(f"Settlement: aba '{tab}' não existe mais (arquivada?); só o store foi atualizado")
+            continue
+        data = [{"range": f"{first}1:{last}1", "values": [list(SETTLEMENT_COLUMNS)]}]
+        for start, end in _blocks(sorted(rows)):
+            data.append({"range": f"{first}{start}:{last}{end}",
+                         "values": [rows.get(r, skip) for r in range(start, end + 1)]})
+        for i in range(0, len(data), UPDATE_RANGES_PER_CALL):
+            with_retry(ws.batch_update, data[i:i + UPDATE_RANGES_PER_CALL], value_input_option='USER_ENTERED')
+            calls += 1
+        n += len(rows)
+    return n, calls
+
+def run(store, sheet=None, results_path: str = RESULTS_FILE, full: bool = False,
+        dry_run: bool = False) -> Settlement:
+    """
+    Liquidação completa: store e, com sheet (TabRotator), as abas do Sheets.
+    """
+    t0 = time.perf_counter()
+    settled = settle_store(store, ResultsIndex.load(results_path), full=full, dry_run=dry_run)
+    if sheet is not None and settled.ids and not dry_run:
+        located = locate_rows(sheet, store, settled)
+        n, calls = write_sheet(sheet, settled)
+        logger.info(f"Settlement: {n} linhas gravadas no Sheets em {calls} chamada(s)"
+                    + (f" ({located} localizadas pela coluna bet_key)" if located else ""))
+    logger.info(f"Settlement: concluído em {time.perf_counter() - t0:.2f}s")
+    return settled
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Liquida as apostas contra o arquivo local de resultados")
+    ap.add_argument("--results", default=RESULTS_FILE, help="arquivo de resultados (padrão: RESULTS_FILE)")
+    ap.add_argument("--full", action="store_true", help="reavalia também as apostas já liquidadas")
+    ap.add_argument("--dry-run", action="store_true", help="não grava nada")
+    ap.add_argument("--store-only", action="store_true", help="não mexe nas abas do Sheets")
+    args = ap.parse_args(argv)
+
+    from bet_store import BetStore
+    sheet = None
+    if not args.store_only and not args.dry_run:
+        from sheets_utils import open_spreadsheet
+        from sheet_rotation import TabRotator
+        from telegram_bot import ensure_service_account_file
+
+        ensure_service_account_file()
+        sheet = TabRotator(open_spreadsheet())
+    t0 = time.perf_counter()
+    settled = run(BetStore(), sheet, args.results, full=args.full, dry_run=args.dry_run)
+    counts: Dict[str, int] = {}
+    for result, _ in settled.values:
+        counts[result] = counts.get(result, 0) + 1
+    print(f"{settled.scanned} apostas lidas, {len(settled.ids)} "
+          f"{'mudariam' if args.dry_run else 'liquidadas/alteradas'} "
+          f"({', '.join(f'{k}: {v}' for k, v in sorted(counts.items())) or '—'}) "
+          f"em {time.perf_counter() - t0:.2f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
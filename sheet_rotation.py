@@ -0,0 +1,322 @@
+# sheet_rotation.py
+"""
+Rotação automática da aba de apostas (por mês ou por número de linhas) e arquivo local
+das abas antigas em CSV comprimido (gzip), legível pelo HistoricalAnalyzer.
+
+Uso (arquivar manualmente as abas antigas):
+    python sheet_rotation.py --archive            # exporta abas antigas para ARCHIVE_DIR
+    python sheet_rotation.py --archive --delete   # exporta e remove as abas da planilha
+"""
+
+import os
+import re
+import csv
+import sys
+import gzip
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional, Iterator
+
+from config import NEW_TAB, TAB_ROTATION, TAB_MAX_ROWS, ARCHIVE_DIR
+from sheets_utils import HEADER, init_sheet, index_to_col, with_retry
+
+logger = logging.getLogger(__name__)
+
+def month_tab(now: Optional[datetime] = None, base: str = NEW_TAB) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"{base}_{now.year:04d}_{now.month:02d}"
+
+def _tab_re(base: str):
+    return re.compile(rf'^{re.escape(base)}_(\d{{4}}_\d{{2}}|\d{{3,}})$')
+
+# ─── Arquivo local ─────────────────────────────────────────
+def archive_path(title: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, f"{title}.csv.gz")
+
+def archive_values(title: str, values: List[List[str]], archive_dir: str = ARCHIVE_DIR) -> str:
+    """
+    Grava as linhas (com cabeçalho) de uma aba em ARCHIVE_DIR/<aba>.csv.gz. Escrita atômica.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(title, archive_dir)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, 'wt', encoding='utf-8', newline='', compresslevel=6) as f:
+        w = csv.writer(f)
+        w.writerows(values)
+    os.replace(tmp, path)
+    logger.info(f"Aba '{title}' arquivada em {path} ({max(len(values) - 1, 0)} linhas)")
+    return path
+
+def archived_titles(archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(f[:-len(".csv.gz")] for f in os.listdir(archive_dir) if f.endswith(".csv.gz"))
+
+def iter_archive(title: str, archive_dir: str = ARCHIVE_DIR) -> Iterator[List[str]]:
+    """
+    Itera as linhas (cabeçalho incluso) de uma aba arquivada, sem carregar o arquivo inteiro.
+    """
+    with gzip.open(archive_path(title, archive_dir), 'rt', encoding='utf-8', newline='') as f:
+        yield from csv.reader(f)
+
+class ArchiveReader:
+    """
+    Fonte somente-leitura com get_all_values() sobre todas as abas arquivadas
+    (cabeçalho único), para uso no HistoricalAnalyzer. iter_column_chunks lê em streaming.
+    """
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR, exclude: Optional[List[str]] = None):
+        self.archive_dir = archive_dir
+        self.exclude = set(exclude or [])
+
+    def titles(self) -> List[str]:
+        return [t for t in archived_titles(self.archive_dir) if t not in self.exclude]
+
+    def get_all_values(self) -> List[List[str]]:
+        out: List[List[str]] = [list(HEADER)]
+        for title in self.titles():
+            rows = iter_archive(title, self.archive_dir)
+            header = next(rows, None)
+            if not header:
+                continue
+            idx = [header.index(c) if c in header else None for c in HEADER]
+            for r in rows:
+                out.append([(r[i] if i is not None and i < len(r) else '') for i in idx])
+        return out
+
+    def iter_column_chunks(self, columns: List[str], chunk_size: int = 5000) -> Iterator[List[List[str]]]:
+        """
+        Itera só as colunas pedidas, em blocos de chunk_size linhas, lendo os CSVs em streaming.
+        """
+        chunk: List[List[str]] = []
+        for title in self.titles():
+            rows = iter_archive(title, self.archive_dir)
+            header = next(rows, None)
+            if not header:
+                continue
+            idx = [header.index(c) if c in header else None for c in columns]
+            for r in rows:
+                chunk.append([(r[i] if i is not None and i < len(r) else '') for i in idx])
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+# ─── Rotação ───────────────────────────────────────────────
+class TabRotator:
+    """
+    Proxy de Worksheet que grava sempre na aba "atual" e troca de aba quando o mês vira
+    (TAB_ROTATION=month) ou quando a aba atinge TAB_MAX_ROWS (TAB_ROTATION=rows).
+    Ao rotacionar, a aba anterior é exportada para o arquivo local.
+    Expõe append_row/append_rows/get_all_values, então pode ser usado no lugar da aba.
+    """
+
+    def __init__(self, ss, rotation: str = TAB_ROTATION, max_rows: int = TAB_MAX_ROWS,
+                 base: str = NEW_TAB, archive_dir: str = ARCHIVE_DIR):
+        self.ss = ss
+        self.rotation = rotation
+        self.max_rows = max_rows
+        self.base = base
+        self.archive_dir = archive_dir
+        self._lock = threading.RLock()
+        self._sheet = None
+        self._rows = 0
+        self._select(self._initial_title())
+
+    @property
+    def title(self) -> str:
+        return self._sheet.title
+
+    def _rotated_titles(self) -> List[str]:
+        pat = _tab_re(self.base)
+        return sorted(ws.title for ws in self.ss.worksheets() if pat.match(ws.title))
+
+    def tabs(self) -> list:
+        """
+        Worksheets de apostas presentes na planilha: aba base legada (se existir) + rotacionadas.
+        """
+        titles = set(self._rotated_titles())
+        if self.base in [ws.title for ws in self.ss.worksheets()]:
+            titles.add(self.base)
+        return [self.ss.worksheet(t) for t in sorted(titles)]
+
+    def _initial_title(self) -> str:
+        if self.rotation == "month":
+            return month_tab(base=self.base)
+        if self.rotation == "rows":
+            seq = [t for t in self._rotated_titles() if re.search(r'_\d{3,}$', t)]
+            return seq[-1] if seq else f"{self.base}_001"
+        return self.base
+
+    def _next_title(self) -> str:
+        if self.rotation == "month":
+            return month_tab(base=self.base)
+        if self.rotation == "rows":
+            n = int(self.title.rsplit('_', 1)[1]) + 1
+            return f"{self.base}_{n:03d}"
+        return self.base
+
+    def _select(self, title: str) -> None:
+        self._sheet = init_sheet(self.ss, tab=title)
+        try:
+            self._rows = len(self._sheet.col_values(1))
+        except Exception:
+            self._rows = 1
+        logger.info(f"TabRotator: aba atual '{title}' ({self._rows} linhas)")
+        if self.rotation == "rows" and self._rows >= self.max_rows:
+            self._rotate()
+
+    def _needs_rotation(self, incoming: int) -> bool:
+        if self.rotation == "month":
+            return month_tab(base=self.base) != self.title
+        if self.rotation == "rows":
+            return self._rows + incoming > self.max_rows
+        return False
+
+    def _rotate(self) -> None:
+        old = self._sheet
+        new_title = self._next_title()
+        if new_title == old.title:
+            return
+        try:
+            archive_values(old.title, old.get_all_values(), self.archive_dir)
+        except Exception as e:
+            logger.error(f"TabRotator: falha ao arquivar aba '{old.title}'", exc_info=e)
+        self._select(new_title)
+
+    def current(self):
+        with self._lock:
+            if self._needs_rotation(0):
+                self._rotate()
+            return self._sheet
+
+    # ─── API de Worksheet ───────────────────────────────────
+    def append_row(self, values: list, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values: List[list], **kwargs):
+        with self._lock:
+            # por linhas, uma aba só com o cabeçalho não rotaciona (lote maior que TAB_MAX_ROWS)
+            if self._needs_rotation(len(values)) and (self.rotation != "rows" or self._rows > 1):
+                self._rotate()
+            response = self._sheet.append_rows(values, **kwargs)
+            self._rows += len(values)
+            return response
+
+    def worksheet(self, title: str):
+        """
+        Aba pelo título (a atual sem chamada de API), ex.: para corrigir linhas já espelhadas.
+        """
+        with self._lock:
+            if self._sheet.title == title:
+                return self._sheet
+        return self.ss.worksheet(title)
+
+    def row_values(self, index: int) -> List[str]:
+        return self.current().row_values(index)
+
+    def col_values(self, col: int) -> List[str]:
+        """
+        Coluna da aba atual (sem rotacionar). A coluna A também ressincroniza a contagem de
+        linhas, ex.: depois de um append que respondeu 5xx mas foi gravado.
+        """
+        with self._lock:
+            values = self._sheet.col_values(col)
+            if col == 1:
+                self._rows = max(len(values), 1)
+            return values
+
+    def get_all_values(self) -> List[List[str]]:
+        """
+        Linhas da aba atual (cabeçalho incluso).
+        """
+        return self.current().get_all_values()
+
+    def history_values(self) -> List[List[str]]:
+        """
+        Histórico completo: abas arquivadas que já não existem na planilha + todas as abas
+        rotacionadas (e a aba base legada, se existir), com cabeçalho único.
+        """
+        tabs = self.tabs()
+        out = ArchiveReader(self.archive_dir, exclude=[ws.title for ws in tabs]).get_all_values()
+        for ws in tabs:
+            values = ws.get_all_values()
+            if not values:
+                continue
+            header = values[0]
+            idx = [header.index(c) if c in header else None for c in HEADER]
+            out.extend([(r[i] if i is not None and i < len(r) else '') for i in idx] for r in values[1:])
+        return out
+
+    def column_values(self, columns: List[str]) -> List[tuple]:
+        """
+        Só as colunas pedidas de todo o histórico (abas arquivadas + abas da planilha), uma
+        tupla por linha de dados. Cada aba custa um único batch_get (cabeçalho + colunas nas
+        posições do HEADER); se o cabeçalho da aba for outro, as colunas são lidas de novo
+        nas posições certas.
+        """
+        out: List[tuple] = []
+        tabs = self.tabs()
+        for chunk in ArchiveReader(self.archive_dir, exclude=[ws.title for ws in tabs]).iter_column_chunks(columns):
+            out.extend(tuple(r) for r in chunk)
+        expected = [HEADER.index(c) + 1 for c in columns]
+        for ws in tabs:
+            letters = [index_to_col(i) for i in expected]
+            header, *cols = with_retry(ws.batch_get, ["1:1"] + [f"{c}2:{c}" for c in letters])
+            header = header[0] if header else []
+            if not header:
+                continue
+            actual = [header.index(c) + 1 if c in header else None for c in columns]
+            if actual != expected:
+                present = [i for i in actual if i is not None]
+                fetched = iter(with_retry(ws.batch_get, [f"{index_to_col(i)}2:{index_to_col(i)}" for i in present])
+                               if present else [])
+                cols = [next(fetched) if i is not None else [] for i in actual]
+            n_rows = max((len(c) for c in cols), default=0)
+            flat = [[(r[0] if r else "") for r in c] + [""] * (n_rows - len(c)) for c in cols]
+            out.extend(zip(*flat))
+        return out
+
+    def archive_old_tabs(self, delete: bool = False) -> List[str]:
+        """
+        Exporta todas as abas rotacionadas (exceto a atual) para o arquivo local.
+        delete=True remove as abas exportadas da planilha.
+        """
+        done = []
+        current = self.current().title
+        for title in self._rotated_titles() + ([self.base] if self.base != current else []):
+            if title == current:
+                continue
+            try:
+                ws = self.ss.worksheet(title)
+            except Exception:
+                continue
+            archive_values(title, ws.get_all_values(), self.archive_dir)
+            if delete:
+                self.ss.del_worksheet(ws)
+                logger.info(f"Aba '{title}' removida da planilha")
+            done.append(title)
+        return done
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Rotação/arquivo das abas de apostas")
+    ap.add_argument("--archive", action="store_true", help="exporta abas antigas para ARCHIVE_DIR")
+    ap.add_argument("--delete", action="store_true", help="remove da planilha as abas exportadas")
+    args = ap.parse_args(argv)
+
+    from sheets_utils import open_spreadsheet
+    from telegram_bot import ensure_service_account_file
+
+    ensure_service_account_file()
+    rotator = TabRotator(open_spreadsheet())
+    print(f"Aba atual: {rotator.title}")
+    if args.archive:
+        done = rotator.archive_old_tabs(delete=args.delete)
+        print(f"✅ {len(done)} aba(s) arquivada(s): {done}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
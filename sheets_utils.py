@@ -1,8 +1,9 @@
 # sheets_utils.py
 
+import re
+import time
 import logging
-import gspread
-from google.oauth2.service_account import Credentials
+from typing import List, Optional, Tuple
 from config import SERVICE_ACCOUNT_FILE, SPREADSHEET_ID, NEW_TAB
 
 logger = logging.getLogger(__name__)
@@ -16,8 +17,23 @@ HEADER = [
     "actual_units", "scale", "unit_value", "amount_real", "placed",
     "selection", "bet_type", "competition", "bookmaker", "sport"
 ]
+# Colunas de liquidação (settlement.py), gravadas logo após as colunas do HEADER
+SETTLEMENT_COLUMNS = ["result", "profit"]
+
+# Códigos HTTP que valem nova tentativa (quota/servidor)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Append não é idempotente: um 5xx pode chegar depois de o Sheets já ter gravado as linhas.
+# Só 429 (rejeitado antes de gravar) é repetido direto; em 5xx o append_rows confere a aba.
+APPEND_RETRY_STATUS = {429}
+MAX_RETRIES = 5
+RETRY_BACKOFF = 1.0
+APPEND_CHUNK = 500
+
+def open_spreadsheet():
+    # gspread/google-auth só são importados aqui (import pesado, fora do caminho de startup)
+    import gspread
+    from google.oauth2.service_account import Credentials
 
-def init_sheet():
     # Carrega credenciais
     try:
         creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=['https://www.googleapis.com/auth/spreadsheets'])
@@ -35,16 +51,27 @@ def init_sheet():
     except Exception as e:
         logger.error(f"Falha ao abrir planilha com ID {SPREADSHEET_ID}", exc_info=e)
         raise
+    return ss
+
+def init_sheet(ss=None, tab: str = None):
+    """
+    Seleciona (ou cria) a aba tab (padrão NEW_TAB) e garante o cabeçalho.
+    ss: planilha já aberta (ex.: FakeSpreadsheet em benchmarks); se None, abre via open_spreadsheet().
+    """
+    if ss is None:
+        ss = open_spreadsheet()
+    if tab is None:
+        tab = NEW_TAB
 
     try:
         titles = [ws.title for ws in ss.worksheets()]
         logger.info(f"Aba(s) existentes: {titles}")
-        if NEW_TAB in titles:
-            sheet = ss.worksheet(NEW_TAB)
-            logger.info(f"Usando aba existente '{NEW_TAB}'")
+        if tab in titles:
+            sheet = ss.worksheet(tab)
+            logger.info(f"Usando aba existente '{tab}'")
         else:
-            sheet = ss.add_worksheet(title=NEW_TAB, rows=2000, cols=30)
-            logger.info(f"Aba '{NEW_TAB}' criada")
+            sheet = ss.add_worksheet(title=tab, rows=2000, cols=30)
+            logger.info(f"Aba '{tab}' criada")
     except Exception as e:
         logger.error("Falha ao selecionar/criar aba", exc_info=e)
         raise
@@ -54,7 +81,7 @@ def init_sheet():
         existing = sheet.row_values(1)
     except Exception:
         existing = []
-    if existing != HEADER:
+    if existing[:len(HEADER)] != HEADER:
         try:
             sheet.insert_row(HEADER, index=1)
             logger.info("Cabeçalho inserido na planilha")
@@ -68,10 +95,126 @@ def init_sheet():
         logger.info("Cabeçalho já presente")
     return sheet
 
+def col_to_index(col: str) -> int:
+    """
+    'A' → 1, 'X' → 24, 'AA' → 27.
+    """
+    n = 0
+    for ch in col.upper():
+        n = n * 26 + (ord(ch) - ord('A') + 1)
+    return n
+
+def index_to_col(n: int) -> str:
+    """
+    1 → 'A', 27 → 'AA'.
+    """
+    s = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        s = chr(ord('A') + rem) + s
+    return s
+
+def _error_status(e: Exception):
+    """
+    Extrai o código HTTP de um erro do gspread (APIError.code / response.status_code).
+    """
+    code = getattr(e, "code", None)
+    if code is None:
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    return code
+
+def with_retry(fn, *args, retries: int = MAX_RETRIES, backoff: float = None, statuses=RETRY_STATUS, **kwargs):
+    """
+    Executa fn(*args, **kwargs) repetindo com backoff exponencial em erros de quota/servidor
+    (códigos em statuses). backoff=None usa RETRY_BACKOFF (ajustável em runtime, ex.: benchmarks).
+    """
+    if backoff is None:
+        backoff = RETRY_BACKOFF
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            status = _error_status(e)
+            if status not in statuses or attempt >= retries:
+                raise
+            wait = backoff * (2 ** attempt)
+            attempt += 1
+            logger.warning(f"Sheets respondeu {status}; nova tentativa {attempt}/{retries} em {wait:.1f}s")
+            time.sleep(wait)
+
 def append_row(sheet, row: list):
     try:
-        sheet.append_row(row, value_input_option='USER_ENTERED')
+        _append_once(sheet, [row])
         logger.info("Linha enviada ao Google Sheets")
     except Exception as e:
         logger.error("Falha ao append_row no Google Sheets", exc_info=e)
         raise
+
+def appended_position(response) -> Optional[Tuple[str, int]]:
+    """
+    (aba, primeira linha) a partir da resposta do append (updates.updatedRange, ex.:
+    "'APOSTAS_BOT_2026_10'!A12:X14"), ou None se a resposta não trouxer o intervalo.
+    """
+    try:
+        rng = response["updates"]["updatedRange"]
+    except (TypeError, KeyError):
+        return None
+    m = re.match(r"^'?(.*?)'?!\$?[A-Z]+\$?(\d+)", rng)
+    if not m:
+        return None
+    return m.group(1).replace("''", "'"), int(m.group(2))
+
+def _landed(sheet, rows: list) -> Optional[dict]:
+    """
+    Confere se um append que respondeu 5xx foi gravado mesmo assim: as últimas linhas da
+    coluna A (bet_key) são as do bloco. Devolve uma resposta no formato do append, ou None.
+    """
+    keys = [str(r[0]) if r and r[0] is not None else "" for r in rows]
+    col = with_retry(sheet.col_values, 1)
+    if len(col) < len(keys) or col[-len(keys):] != keys:
+        return None
+    first = len(col) - len(keys) + 1
+    title = getattr(sheet, "title", "")
+    return {"updates": {"updatedRange": f"'{title}'!A{first}:A{len(col)}", "updatedRows": len(keys)}}
+
+def _append_once(sheet, rows: list, retries: int = MAX_RETRIES):
+    """
+    append_rows sem duplicar: 429 é repetido direto (with_retry); em 5xx a aba é conferida
+    antes de nova tentativa, já que o Sheets pode ter gravado o bloco antes de responder.
+    """
+    attempt = 0
+    while True:
+        try:
+            return with_retry(sheet.append_rows, rows, statuses=APPEND_RETRY_STATUS,
+                              value_input_option='USER_ENTERED')
+        except Exception as e:
+            status = _error_status(e)
+            if status not in RETRY_STATUS or attempt >= retries:
+                raise
+            response = _landed(sheet, rows)
+            if response is not None:
+                logger.warning(f"Sheets respondeu {status}, mas o bloco de {len(rows)} linha(s) já foi gravado")
+                return response
+            wait = RETRY_BACKOFF * (2 ** attempt)
+            attempt += 1
+            logger.warning(f"Sheets respondeu {status} no append; nova tentativa {attempt}/{retries} em {wait:.1f}s")
+            time.sleep(wait)
+
+def append_rows(sheet, rows: list, chunk_size: int = APPEND_CHUNK) -> List[Optional[Tuple[str, int]]]:
+    """
+    Envia várias linhas com append_rows em blocos de chunk_size (uma chamada de API por bloco).
+    Retorna a posição (aba, linha) de cada linha enviada, ou None onde a API não informar.
+    """
+    positions: List[Optional[Tuple[str, int]]] = []
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        try:
+            response = _append_once(sheet, chunk)
+            logger.info(f"{len(chunk)} linha(s) enviadas ao Google Sheets")
+        except Exception as e:
+            logger.error("Falha ao append_rows no Google Sheets", exc_info=e)
+            raise
+        pos = appended_position(response)
+        positions.extend((pos[0], pos[1] + j) if pos else None for j in range(len(chunk)))
+    return positions
@@ -1,38 +1,275 @@
 # teams_cache.py
 
+import re
 import json
 import os
+import time
 import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from config import FIXTURE_MATCH_SCORE
+from mapping_utils import normalize_text
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
 
 logger = logging.getLogger(__name__)
 CACHE_FILE = "teams_cache.json"
 
-def load_cache():
-    if os.path.exists(CACHE_FILE):
+# Sufixos/prefixos de clube ignorados na chave normalizada ("Flamengo FC" == "Flamengo")
+_CLUB_TOKENS = {"fc", "sc", "ec", "cf", "ac", "afc", "fk", "sv", "cd", "ca", "club", "clube"}
+# Mínimo para aceitar o adversário lido como o mesmo do jogo do dia (OCR com erros)
+OPPONENT_MATCH_SCORE = 60.0
+
+def load_cache(path: str = CACHE_FILE):
+    if os.path.exists(path):
         try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+            with open(path, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except Exception as e:
             logger.warning("Falha ao ler teams_cache.json", exc_info=e)
     return {}
 
-def save_cache(data):
+def save_cache(data, path: str = CACHE_FILE):
     try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
+        with open(path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         logger.debug("teams_cache.json salvo.")
     except Exception as e:
         logger.warning("Falha ao salvar teams_cache.json", exc_info=e)
 
+def team_key(name: str) -> str:
+    """
+    Chave de comparação: sem acentos, minúscula, só alfanuméricos, sem sufixos de clube.
+    """
+    s = normalize_text(name or "").lower()
+    tokens = re.sub(r'[^a-z0-9]+', ' ', s).split()
+    stripped = [t for t in tokens if t not in _CLUB_TOKENS]
+    return ' '.join(stripped or tokens)
+
+def _prefixes(key: str) -> set:
+    return {t[:3] for t in key.split()}
+
+@dataclass(frozen=True)
+class Fixture:
+    home: str
+    away: str
+    sport: Optional[str] = None
+    competition: Optional[str] = None
+
+    def team(self, side: int) -> str:
+        return self.home if side == 0 else self.away
+
+@dataclass(frozen=True)
+class FixtureMatch:
+    fixture: Fixture
+    side: int        # 0 = mandante, 1 = visitante
+    score: float
+
+    @property
+    def opponent(self) -> str:
+        return self.fixture.team(1 - self.side)
+
+def _parse_games(games) -> List[Fixture]:
+    """
+    Aceita [home, away] ou {"home", "away", "sport", "competition"} por jogo.
+    """
+    out = []
+    for g in games or []:
+        try:
+            if isinstance(g, dict):
+                fx = Fixture(g["home"], g["away"], g.get("sport"), g.get("competition"))
+            else:
+                fx = Fixture(g[0], g[1], *(list(g[2:4]) + [None, None])[:2])
+        except (KeyError, IndexError, TypeError):
+            logger.debug(f"teams_cache: jogo inválido ignorado: {g}")
+            continue
+        if fx.home and fx.away:
+            out.append(fx)
+    return out
+
+class FixtureIndex:
+    """
+    Índice em memória dos jogos do dia (teams_cache.json), recarregado uma vez por dia
+    (ou quando o arquivo muda). Lookup de nome de time: chave normalizada exata O(1) e,
+    em miss, fuzzy (rapidfuzz) sobre as chaves do dia, com memo LRU dos resultados.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, score_cutoff: float = FIXTURE_MATCH_SCORE,
+                 memo_size: int = 4096, recheck_seconds: float = 60.0):
+        self.path = path
+        self.score_cutoff = score_cutoff
+        self.memo_size = memo_size
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.RLock()
+        self._day: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._fixtures: List[Fixture] = []
+        self._by_key: Dict[str, Tuple[int, int]] = {}   # chave -> (índice do jogo, lado)
+        self._keys: List[str] = []
+        self._by_prefix: Dict[str, List[str]] = {}     # prefixo de 3 letras de cada palavra -> chaves
+        self._memo: "OrderedDict[str, Optional[FixtureMatch]]" = OrderedDict()
+        if process is None:
+            logger.warning("rapidfuzz não instalado: FixtureIndex fará apenas casamento exato")
+
+    # ─── Carga ──────────────────────────────────────────────
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _maybe_reload(self) -> None:
+        today = date.today().isoformat()
+        now = time.monotonic()
+        if self._day == today and now - self._checked_at < self.recheck_seconds:
+            return
+        self._checked_at = now
+        if self._day != today or self._file_mtime() != self._mtime:
+            self.reload()
+
+    def reload(self) -> None:
+        """
+        Relê teams_cache.json e reconstrói o índice (só vale se "date" for hoje).
+        """
+        today = date.today().isoformat()
+        mtime = self._file_mtime()
+        data = load_cache(self.path)
+        fixtures = _parse_games(data.get("games")) if data.get("date") == today else []
+        by_key: Dict[str, Tuple[int, int]] = {}
+        by_prefix: Dict[str, List[str]] = {}
+        for i, fx in enumerate(fixtures):
+            for side in (0, 1):
+                key = team_key(fx.team(side))
+                if key in by_key:
+                    continue
+                by_key[key] = (i, side)
+                for p in _prefixes(key):
+                    by_prefix.setdefault(p, []).append(key)
+        with self._lock:
+            self._fixtures = fixtures
+            self._by_key = by_key
+            self._keys = list(by_key)
+            self._by_prefix = by_prefix
+            self._memo.clear()
+            self._day = today
+            self._mtime = mtime
+        logger.info(f"FixtureIndex: {len(fixtures)} jogos do dia {today} carregados")
+
+    def fixtures(self) -> List[Fixture]:
+        with self._lock:
+            self._maybe_reload()
+            return list(self._fixtures)
+
+    # ─── Consultas ──────────────────────────────────────────
+    def lookup(self, raw_name: str, score_cutoff: Optional[float] = None) -> Optional[FixtureMatch]:
+        """
+        Jogo do dia em que raw_name joga (ou None se nenhum passar do score mínimo).
+        """
+        if not raw_name:
+            return None
+        cutoff = self.score_cutoff if score_cutoff is None else score_cutoff
+        key = team_key(raw_name)
+        if not key:
+            return None
+        with self._lock:
+            self._maybe_reload()
+            memo_key = f"{cutoff}|{key}"
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                return self._memo[memo_key]
+            hit = self._by_key.get(key)
+            score = 100.0
+            if hit is None and process is not None and self._keys:
+                best = self._fuzzy(key, cutoff)
+                if best is not None:
+                    hit = self._by_key[best[0]]
+                    score = best[1]
+            match = FixtureMatch(self._fixtures[hit[0]], hit[1], score) if hit is not None else None
+            self._memo[memo_key] = match
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+            return match
+
+    def _fuzzy(self, key: str, cutoff: float):
+        """
+        WRatio só sobre as chaves que compartilham um prefixo de palavra com a consulta;
+        sem candidatos (OCR trocou o início das palavras), QRatio sobre todas as chaves.
+        """
+        candidates = {k for p in _prefixes(key) for k in self._by_prefix.get(p, ())}
+        if candidates:
+            best = process.extractOne(key, candidates, scorer=fuzz.WRatio, score_cutoff=cutoff)
+            if best is not None:
+                return best
+        return process.extractOne(key, self._keys, scorer=fuzz.QRatio, score_cutoff=cutoff)
+
+    def match_pair(self, home: Optional[str], away: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[Fixture]]:
+        """
+        Confere o par lido (OCR/legenda) contra os jogos do dia:
+        - os dois times no mesmo jogo → nomes e ordem mandante/visitante do jogo
+        - um time reconhecido e o outro parecido com o adversário (ou ausente) → jogo completo
+        - caso contrário, devolve o par como veio (fixture None)
+        """
+        mh = self.lookup(home) if home else None
+        ma = self.lookup(away) if away else None
+        if mh and ma and mh.fixture == ma.fixture and mh.side != ma.side:
+            return mh.fixture.home, mh.fixture.away, mh.fixture
+        candidates = [m for m in (mh, ma) if m is not None]
+        if not candidates:
+            return home, away, None
+        anchor = max(candidates, key=lambda m: m.score)
+        other = away if anchor is mh else home
+        if other:
+            if fuzz is None:
+                return home, away, None
+            if fuzz.WRatio(team_key(other), team_key(anchor.opponent)) < OPPONENT_MATCH_SCORE:
+                return home, away, None
+        return anchor.fixture.home, anchor.fixture.away, anchor.fixture
+
+    def find_in_lines(self, lines: List[str]) -> Optional[Tuple[int, Fixture]]:
+        """
+        Procura, linha a linha, um time dos jogos do dia quando o par não foi lido
+        (ex.: só o nome do time aparece no print). Retorna (índice da linha, jogo).
+        """
+        if not lines:
+            return None
+        with self._lock:
+            self._maybe_reload()
+            by_key, keys, fixtures = self._by_key, self._keys, self._fixtures
+        if not keys:
+            return None
+        for i, line in enumerate(lines):
+            text = line.strip()
+            if not text or len(text) > 60 or not re.search(r'[A-Za-zÀ-ÿ]{3,}', text):
+                continue
+            key = team_key(text)
+            hit = by_key.get(key)
+            if hit is None and process is not None:
+                # linha inteira contra o nome inteiro (ratio simples): evita casar trechos de mercado
+                best = process.extractOne(key, keys, scorer=fuzz.ratio, score_cutoff=max(self.score_cutoff, 90.0))
+                hit = by_key[best[0]] if best is not None else None
+            if hit is not None:
+                return i, fixtures[hit[0]]
+        return None
+
+_default_index: Optional[FixtureIndex] = None
+
+def get_fixture_index() -> FixtureIndex:
+    global _default_index
+    if _default_index is None:
+        _default_index = FixtureIndex()
+    return _default_index
+
 def get_games_for_today():
     """
     Retorna lista de tuplas (home, away) para jogos do dia.
     Pode implementar chamada a API esportiva ou manter manualmente.
     """
-    data = load_cache()
-    today = date.today().isoformat()
-    if data.get("date") == today:
-        return data.get("games", [])
-    # Se quiser implementar: chamada a API e depois save_cache
-    return []
+    return [(fx.home, fx.away) for fx in get_fixture_index().fixtures()]
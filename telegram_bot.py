@@ -1,10 +1,14 @@
 # telegram_bot.py
 
 import os
+import time
 import asyncio
 import logging
 import base64
-from datetime import timezone
+from dataclasses import dataclass
+
+# Instante do launch, para medir o tempo até a primeira mensagem processada
+LAUNCH_T = time.perf_counter()
 
 # reduzir logs verbosos do telethon
 logging.getLogger("telethon").setLevel(logging.WARNING)
@@ -13,24 +17,18 @@ logging.getLogger("telethon.network").setLevel(logging.WARNING)
 from telethon import TelegramClient, events
 
 import config
-from config import API_ID, API_HASH, BANK_TOTAL, UNIT_SCALES, DEFAULT_SCALE, MONITORADOS, SERVICE_ACCOUNT_FILE
-from ocr_utils import limpa_linhas_ocr, extrai_times_de_linhas, extrai_todas_opcoes_mercado, perform_ocr_on_media
-from parse_utils import (
-    clean_caption,
-    extract_stake,
-    extract_stake_list,
-    extract_odd,
-    extract_odd_list,
-    extract_limit,
-    parse_market,
-    detect_competition,
-    detect_sport,
-    summarize_market as summarize_fallback
-)
-from mapping_utils import get_canonical, normalize_bookmaker_from_url_or_text
-from dedup_utils import load_seen, save_seen, generate_bet_key
-from sheets_utils import init_sheet, append_row
-from analysis_utils import HistoricalAnalyzer
+import rules
+from config import (API_ID, API_HASH, WORKERS, SESSION_NAME, TG_PHONE, TG_PASSWORD,
+                    HEADLESS, BET_STORE_FILE)
+from dedup_utils import load_seen, sync_seen
+from chat_registry import ChatRegistry, bare_chat_id
+from pipeline import BetPipeline, WriteError
+from bet_store import BetStore, SheetMirror, StoreSink, JobQueue
+from checkpoints import Checkpoints, catch_up
+from teams_cache import FixtureIndex
+from edit_cache import EditCache
+from log_setup import correlation
+from workers import enqueue_message, start_workers, stop_workers, requeue_loop
 
 logger = logging.getLogger(__name__)
 
@@ -61,269 +59,286 @@ def ensure_service_account_file():
         else:
             logger.info(f"Usando service account existente em '{sa_file}'")
 
+@dataclass
+class Backends:
+    sheet: object
+    store: BetStore
+    historical: object
+    seen: set
+    aggregates: object
+    templates: object
+
+def load_backends(ss=None, store_path: str = BET_STORE_FILE, read_only: bool = False) -> Backends:
+    """
+    Sheets, store local, histórico, agregados e templates. Bloqueante (rede, disco e imports
+    pesados como gspread/numpy): no bot roda numa thread em paralelo ao connect do Telegram.
+    ss: planilha já aberta (ex.: FakeSpreadsheet no bench_startup); se None, abre a real.
+    read_only: não importa a planilha num store vazio nem regrava seen.json (ex.: --dry-run).
+    """
+    from sheets_utils import open_spreadsheet
+    from sheet_rotation import TabRotator
+    from analysis_utils import HistoricalAnalyzer
+    from performance import PerformanceAggregates
+    from caption_templates import CaptionTemplates
+
+    # Aba atual (rotacionada por mês/linhas); abas antigas vão para o arquivo local
+    sheet = TabRotator(ss if ss is not None else open_spreadsheet())
+
+    # Store local é a fonte de verdade; na primeira execução é populado a partir da planilha
+    store = BetStore(store_path)
+    if store.count() == 0 and not read_only:
+        try:
+            store.import_sheet_values(sheet.history_values())
+        except Exception as e:
+            logger.error("Falha ao importar planilha para o BetStore", exc_info=e)
+    historical = HistoricalAnalyzer(store)
+    # seen.json conferido contra a planilha (só colunas bet_key/data_hora); reconstruído se divergir
+    try:
+        seen = sync_seen(sheet, store, persist=not read_only)
+    except Exception as e:
+        logger.error("Falha ao conferir o seen com a planilha", exc_info=e)
+        seen = load_seen() | store.bet_keys()
+    aggregates = PerformanceAggregates()
+    aggregates.build_from_store(store)
+
+    # Templates de legenda por grupo: declarados em GROUP_SETTINGS + aprendidos do histórico
+    templates = CaptionTemplates()
+    templates.load_declared()
+    try:
+        templates.learn_from_store(store)
+    except Exception as e:
+        logger.error("Falha ao aprender templates de legenda", exc_info=e)
+    return Backends(sheet, store, historical, seen, aggregates, templates)
+
+async def login(client) -> bool:
+    """
+    Conecta reaproveitando o arquivo de sessão. Sem sessão válida: com HEADLESS não há como
+    pedir o código do Telegram, então falha; senão faz o login com TG_PHONE/TG_PASSWORD
+    (ou input() para o que faltar).
+    """
+    await client.connect()
+    if await client.is_user_authorized():
+        return True
+    if HEADLESS:
+        logger.error(f"Sessão '{SESSION_NAME}' ausente ou expirada e HEADLESS ativo: "
+                     f"rode o bot uma vez num terminal para criar a sessão.")
+        return False
+    await client.start(
+        phone=lambda: TG_PHONE or input("📱 Número (+55...): ").strip(),
+        password=lambda: TG_PASSWORD or input("🔑 Senha 2FA (ou Enter pular): ").strip(),
+    )
+    return True
+
+def is_monitored(ev) -> bool:
+    """
+    Filtro dos handlers: grupos monitorados das regras atuais (mudam sem reiniciar).
+    """
+    try:
+        return bare_chat_id(ev.chat_id) in rules.current().monitored
+    except (TypeError, ValueError):
+        return False
+
+def monitored_chats() -> list:
+    return sorted(rules.current().monitored)
+
+def startup_mark(label: str) -> None:
+    logger.info(f"Startup: {label} em {time.perf_counter() - LAUNCH_T:.2f}s desde o launch")
+
 async def main():
     ensure_service_account_file()
 
-    phone = input("📱 Número (+55...): ").strip()
-    client = TelegramClient('session', API_ID, API_HASH)
-    await client.start(phone=phone)
-    if not await client.is_user_authorized():
-        pwd = input("🔑 Senha 2FA (ou Enter pular): ").strip()
-        if pwd:
-            await client.sign_in(password=pwd)
+    # Sheets/store/histórico carregam em paralelo ao connect do Telegram
+    backends_task = asyncio.create_task(asyncio.to_thread(load_backends))
+
+    client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+    if not await login(client):
+        return
 
     me = await client.get_me()
     logger.info(f"Conectado como @{me.username} (ID {me.id})")
-    logger.info(f"Monitorando grupos: {MONITORADOS}")
+    logger.info(f"Monitorando grupos: {monitored_chats()}")
+    startup_mark("Telegram conectado")
+
+    registry = ChatRegistry()
+    await registry.load_from_client(client)
 
-    seen = load_seen()
     try:
-        sheet = init_sheet()
-        historical = HistoricalAnalyzer(sheet)
+        backends = await backends_task
     except Exception:
-        logger.error("Erro ao inicializar Google Sheets. Saindo.")
+        logger.error("Erro ao inicializar Google Sheets. Saindo.", exc_info=True)
         return
+    startup_mark("Sheets, store e histórico prontos")
+    store = backends.store
+    historical = backends.historical
+    aggregates = backends.aggregates
+    mirror = SheetMirror(store, backends.sheet)
+    mirror.start()
+
+    @client.on(events.ChatAction(func=is_monitored))
+    async def chat_action(ev):
+        if ev.new_title:
+            registry.set_title(ev.chat_id, ev.new_title)
+            logger.info(f"Título do grupo {ev.chat_id} alterado para '{ev.new_title}'")
+
+    pipeline = BetPipeline(historical, backends.seen, registry, sink=StoreSink(store, mirror, aggregates),
+                           fixtures=FixtureIndex(), templates=backends.templates, edits=EditCache())
+    checkpoints = Checkpoints()
+
+    # WORKERS>0: OCR/parse em processos separados; este processo só baixa mídia e enfileira
+    queue = procs = stop = None
+    if WORKERS > 0:
+        queue = JobQueue(store)
+        procs, stop = start_workers(WORKERS)
+        asyncio.create_task(requeue_loop(queue))
+
+    async def dispatch(msgs):
+        await enqueue_message(queue, registry, msgs[0], fetch_chat=msgs[0].get_chat,
+                              album=msgs if len(msgs) > 1 else None)
+
+    # Recupera mensagens postadas enquanto o bot estava fora antes de ouvir eventos ao vivo
+    await catch_up(client, pipeline, checkpoints, monitored_chats(), dispatch=dispatch if queue else None)
+    startup_mark("catch-up concluído")
 
     @client.on(events.NewMessage(pattern=r'/reload_history'))
     async def reload_history(ev):
         try:
             historical.reload()
-            await ev.reply("✅ Histórico recarregado a partir da planilha.")
+            await ev.reply("✅ Histórico recarregado a partir do store local.")
         except Exception as e:
             logger.error("Erro ao recarregar histórico", exc_info=e)
             await ev.reply(f"❌ Falha ao recarregar histórico: {e}")
 
-    @client.on(events.NewMessage(chats=MONITORADOS))
+    # comandos só valem quando enviados pela própria conta (não por membros dos grupos monitorados)
+    @client.on(events.NewMessage(outgoing=True, pattern=r'/report(?:\s+(\w+))?'))
+    async def report(ev):
+        from performance import DIMENSIONS, format_report
+        dim = ev.pattern_match.group(1)
+        if dim and dim not in DIMENSIONS:
+            await ev.reply(f"Dimensões: {', '.join(DIMENSIONS)}")
+            return
+        if queue is not None:
+            # com workers, as linhas novas não passam pelos agregados deste processo
+            await asyncio.to_thread(aggregates.build_from_store, store)
+        text = format_report(aggregates, [dim] if dim else None, top=10)
+        await ev.reply(text[:4000])
+
+    @client.on(events.NewMessage(outgoing=True, pattern=r'/settle(?:\s+(full))?'))
+    async def settle(ev):
+        from settlement import run as run_settlement
+        full = bool(ev.pattern_match.group(1))
+        try:
+            settled = await asyncio.to_thread(run_settlement, store, backends.sheet, full=full)
+        except Exception as e:
+            logger.error("Erro na liquidação", exc_info=e)
+            await ev.reply(f"❌ Falha na liquidação: {e}")
+            return
+        if settled.ids:
+            await asyncio.to_thread(aggregates.build_from_store, store)
+        await ev.reply(f"✅ {len(settled.ids)} apostas liquidadas/alteradas ({settled.scanned} lidas).")
+
+    first_handled = False
+
+    @client.on(events.NewMessage(func=is_monitored))
     async def handler(ev):
+        if ev.message.grouped_id:
+            return  # fotos de álbum: tratadas juntas pelo handler de Album
+        with correlation(ev.chat_id, ev.message.id):
+            await process_message(ev)
+
+    async def process_message(ev):
+        nonlocal first_handled
         try:
-            raw = ev.raw_text or ""
-            chat_id = ev.chat_id
-
-            # 1) OCR se houver mídia
-            ocr_text = ""
-            if ev.message.media:
-                try:
-                    ocr_text = await perform_ocr_on_media(ev.message)
-                except Exception as e:
-                    logger.debug("perform_ocr_on_media falhou", exc_info=e)
-            lines = []
-            if ocr_text:
-                lines = limpa_linhas_ocr(ocr_text)
-                logger.debug(f"[OCR] Linhas limpas: {lines}")
-
-            # 2) Limpa legenda/texto
-            clean = clean_caption(raw)
-            logger.debug(f"[Caption limpa] {clean}")
-
-            # RAW_MENSAGEM_IDENTIFICADA
-            if ocr_text:
-                raw_msg_identified = f"{clean} || OCR: {ocr_text}"
+            if checkpoints.is_processed(ev.chat_id, ev.message.id) or not checkpoints.claim(ev.chat_id, ev.message.id):
+                return
+            if queue is not None:
+                await enqueue_message(queue, registry, ev.message, fetch_chat=ev.get_chat)
             else:
-                raw_msg_identified = clean
+                await pipeline.handle(
+                    ev.raw_text or "",
+                    ev.chat_id,
+                    ev.message.date,
+                    message=ev.message,
+                    fetch_chat=ev.get_chat,
+                )
+            checkpoints.update(ev.chat_id, ev.message.id)
+            if not first_handled:
+                first_handled = True
+                startup_mark("primeira mensagem ao vivo processada")
+        except WriteError as e:
+            # o checkpoint do grupo fica antes desta mensagem: o próximo catch-up a regrava
+            checkpoints.fail(ev.chat_id, ev.message.id)
+            logger.error(f"Mensagem {ev.message.id} do grupo {ev.chat_id} não gravada: {e}")
+        except Exception:
+            logger.error("Erro no handler de NewMessage", exc_info=True)
 
-            # 3) Extrai bookmaker
-            bookmaker = normalize_bookmaker_from_url_or_text(clean)
-            logger.debug(f"Bookmaker detectado: {bookmaker}")
+    @client.on(events.Album(func=is_monitored))
+    async def album(ev):
+        # uma mensagem por foto; OCR de todas em paralelo e um único parse contra a legenda
+        with correlation(ev.chat_id, min(m.id for m in ev.messages)):
+            await process_album(ev)
 
-            # 4) Extrai stake(s) e odd(s)
-            stake_list = extract_stake_list(clean)
-            if not stake_list:
-                logger.debug("Sem stake_pct na legenda; ignora mensagem.")
+    async def process_album(ev):
+        try:
+            msgs = [m for m in ev.messages
+                    if not checkpoints.is_processed(ev.chat_id, m.id) and checkpoints.claim(ev.chat_id, m.id)]
+            if not msgs:
                 return
-            odd_caption_list = extract_odd_list(clean)
-            odd_single = extract_odd(clean)
-            limit = extract_limit(clean)
-            logger.debug(f"Stake_list={stake_list}, odd_caption_list={odd_caption_list}, limit={limit}")
-
-            # 5) Extrai possíveis apostas via OCR ou legenda
-            bets_to_record = []
-            if lines:
-                try:
-                    home, away = extrai_times_de_linhas(lines)
-                except Exception as e:
-                    home = away = None
-                    logger.debug("Erro em extrai_times_de_linhas via OCR", exc_info=e)
-                if home and away:
-                    logger.debug(f"Times extraídos via OCR: {home} x {away}")
-                    idx0 = None
-                    for i, l in enumerate(lines):
-                        if home in l and away in l:
-                            idx0 = i
-                            break
-                    after = lines[idx0+1:] if idx0 is not None else lines
-                    try:
-                        ops = extrai_todas_opcoes_mercado(after, start_index=0)
-                    except Exception as e:
-                        ops = None
-                        logger.debug("Erro em extrai_todas_opcoes_mercado via OCR", exc_info=e)
-                    if ops:
-                        for mkt_raw, odd_img in ops:
-                            bets_to_record.append({
-                                'time_casa': home,
-                                'time_fora': away,
-                                'mercado': mkt_raw.strip() if mkt_raw else None,
-                                'odd_img': odd_img
-                            })
-                        logger.debug(f"Encontradas {len(ops)} opções via OCR")
-                    else:
-                        bets_to_record.append({
-                            'time_casa': home,
-                            'time_fora': away,
-                            'mercado': None,
-                            'odd_img': None
-                        })
-                else:
-                    logger.debug("OCR não extraiu times confiáveis.")
-            if not bets_to_record:
-                try:
-                    home2, away2 = extrai_times_de_linhas([clean])
-                except Exception as e:
-                    home2 = away2 = None
-                    logger.debug("Erro em extrai_times_de_linhas na legenda", exc_info=e)
-                if home2 and away2:
-                    logger.debug(f"Times extraídos da legenda: {home2} x {away2}")
-                    try:
-                        ops2 = extrai_todas_opcoes_mercado([clean], start_index=0)
-                    except Exception as e:
-                        ops2 = None
-                        logger.debug("Erro em extrai_todas_opcoes_mercado na legenda", exc_info=e)
-                    if ops2:
-                        for mkt_raw, odd_img in ops2:
-                            bets_to_record.append({
-                                'time_casa': home2,
-                                'time_fora': away2,
-                                'mercado': mkt_raw.strip() if mkt_raw else None,
-                                'odd_img': odd_img
-                            })
-                        logger.debug(f"Encontradas {len(ops2)} opções via legenda")
-                    else:
-                        bets_to_record.append({
-                            'time_casa': home2,
-                            'time_fora': away2,
-                            'mercado': None,
-                            'odd_img': None
-                        })
-                else:
-                    logger.debug("Não extraiu times da legenda; ignora.")
-                    return
-
-            # 6) Lógica de casamento múltiplos mercados <-> múltiplos stakes (escada)
-            num_markets = len(bets_to_record)
-            num_stakes = len(stake_list)
-            num_odds_caption = len(odd_caption_list)
-            logger.debug(f"num_markets={num_markets}, num_stakes={num_stakes}, num_odds_caption={num_odds_caption}")
-
-            # 7) Detecta esporte
-            sport = detect_sport(raw_msg_identified)
-            logger.debug(f"Esporte detectado: {sport}")
-
-            # 8) Processa cada sub-aposta
-            for idx, entry in enumerate(bets_to_record):
-                raw_home = entry['time_casa']
-                raw_away = entry['time_fora']
-                mercado_raw = entry.get('mercado')
-                odd_img = entry.get('odd_img')
-
-                # stake_pct por índice (escada)
-                if num_stakes >= num_markets:
-                    stake_pct = stake_list[idx]
-                else:
-                    stake_pct = stake_list[0]
-                # odd final
-                if odd_img is not None:
-                    odd_val = odd_img
-                else:
-                    if num_odds_caption >= num_markets:
-                        odd_val = odd_caption_list[idx]
-                    else:
-                        odd_val = odd_single
-                logger.debug(f"[Índice {idx}] stake_pct={stake_pct}, odd_val={odd_val}")
-
-                # Dedup
-                bkey = generate_bet_key(raw_home, raw_away, mercado_raw, odd_val)
-                is_dup = bkey in seen
-                if not is_dup:
-                    seen.add(bkey)
-                    save_seen(seen)
-                    logger.debug(f"Novo bet_key salvo: {bkey}")
-                logger.debug(f"bet_key={bkey}, duplicate={is_dup}")
-
-                # Unidades
-                scale = UNIT_SCALES.get(chat_id, DEFAULT_SCALE)
-                unit_value = round(BANK_TOTAL / scale, 2)
-                rec_amount = unit_value * stake_pct
-                if limit is not None and rec_amount > limit:
-                    actual_amount = limit
-                    actual_units = round(limit / unit_value, 4)
-                else:
-                    actual_amount = rec_amount
-                    actual_units = stake_pct
-                logger.debug(f"unit_value={unit_value}, rec_amount={rec_amount}, actual_units={actual_units}, actual_amount={actual_amount}")
-
-                # Canonicalização com histórico
-                suggest_home = historical.suggest_canonical(raw_home)
-                suggest_away = historical.suggest_canonical(raw_away)
-                canon_home = suggest_home if suggest_home else get_canonical(raw_home)
-                canon_away = suggest_away if suggest_away else get_canonical(raw_away)
-                logger.debug(f"Canonical: '{raw_home}' -> '{canon_home}', '{raw_away}' -> '{canon_away}'")
-
-                # Parse mercado
-                bet_type, selection = parse_market(mercado_raw or "")
-                competition = detect_competition(clean + " " + (mercado_raw or ""))
-                summary_parse = "" if not mercado_raw else summarize_fallback(mercado_raw)
-                summary_hist = historical.suggest_summary(mercado_raw or "")
-                market_summary = summary_hist if summary_hist else (summary_parse or "")
-                logger.debug(f"market_summary escolhido: {market_summary}")
-
-                # Nome do grupo
-                try:
-                    chat = await ev.get_chat()
-                    group_name = getattr(chat, 'title', str(chat_id))
-                except:
-                    group_name = str(chat_id)
-
-                ts = ev.message.date.astimezone(timezone.utc).isoformat()
-
-                row = [
-                    bkey,
-                    is_dup,
-                    ts,
-                    chat_id,
-                    group_name,
-                    raw_msg_identified,
-                    raw_home,
-                    raw_away,
-                    canon_home,
-                    canon_away,
-                    mercado_raw or '',
-                    market_summary or '',
-                    odd_val or '',
-                    stake_pct,
-                    actual_units,
-                    scale,
-                    unit_value,
-                    round(actual_amount, 2),
-                    '',
-                    selection or '',
-                    bet_type or '',
-                    competition or '',
-                    bookmaker or '',
-                    sport or ''
-                ]
-                logger.debug(f"[Índice {idx}] Row p/ Sheets: {row}")
-                try:
-                    await asyncio.to_thread(append_row, sheet, row)
-                except Exception as e:
-                    logger.error("Erro ao append_row", exc_info=e)
-
-                # Atualiza histórico
-                historical.update(raw_home, raw_away, mercado_raw or "", market_summary or "")
-
+            if queue is not None:
+                await enqueue_message(queue, registry, msgs[0], fetch_chat=ev.get_chat, album=msgs)
+            else:
+                await pipeline.handle_album(msgs, fetch_chat=ev.get_chat)
+            checkpoints.update(ev.chat_id, max(m.id for m in msgs))
+        except WriteError as e:
+            for m in msgs:
+                checkpoints.fail(ev.chat_id, m.id)
+            logger.error(f"Álbum {msgs[0].grouped_id} do grupo {ev.chat_id} não gravado: {e}")
         except Exception:
-            logger.error("Erro no handler de NewMessage", exc_info=True)
+            logger.error("Erro no handler de Album", exc_info=True)
+
+    @client.on(events.MessageEdited(func=is_monitored))
+    async def edited(ev):
+        # só mensagens processadas neste processo têm estado em cache (com WORKERS>0, nenhuma)
+        with correlation(ev.chat_id, ev.message.id):
+            try:
+                await pipeline.handle_edit(ev.raw_text or "", ev.chat_id, ev.message.date, ev.message,
+                                           fetch_chat=ev.get_chat)
+            except Exception:
+                logger.error("Erro no handler de MessageEdited", exc_info=True)
+
+    # Segunda passada curta: cobre o que chegou durante o primeiro catch-up
+    await catch_up(client, pipeline, checkpoints, monitored_chats(), dispatch=dispatch if queue else None)
+
+    # Mudanças em rules.json valem sem reiniciar: escalas/settings/templates são reaplicados e
+    # grupos novos ganham checkpoint (o filtro dos handlers já lê as regras atuais)
+    loop = asyncio.get_running_loop()
+
+    async def catch_up_added(chats):
+        logger.info(f"Regras: novos grupos monitorados {chats}")
+        await registry.load_from_client(client)
+        await catch_up(client, pipeline, checkpoints, chats, dispatch=dispatch if queue else None)
+
+    def on_rules_change(old, new):
+        registry.apply_rules(old, new)
+        backends.templates.reload_declared(old, new)
+        added = sorted(new.monitored - old.monitored)
+        if added:
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(catch_up_added(added)))
+        removed = sorted(old.monitored - new.monitored)
+        if removed:
+            logger.info(f"Regras: grupos deixaram de ser monitorados {removed}")
+
+    rules.source().on_change(on_rules_change)
+    asyncio.create_task(rules.watch())
 
     try:
         logger.info("▶️ Bot rodando. Monitorando mensagens dos grupos listados acima.")
         await client.run_until_disconnected()
     except KeyboardInterrupt:
         logger.info("Bot encerrado pelo usuário")
+    finally:
+        if procs:
+            await asyncio.to_thread(stop_workers, procs, stop)
+        try:
+            await mirror.flush()
+        except Exception as e:
+            logger.error("Falha ao espelhar pendências no Sheets ao encerrar", exc_info=e)
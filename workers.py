@@ -0,0 +1,208 @@
+# workers.py
+"""
+Processamento em vários processos: o bot (listener do Telegram) só baixa a mídia e enfileira
+cada mensagem na tabela `jobs` do BetStore; N workers pegam jobs, fazem OCR + parse e gravam
+as linhas no BetStore (dedup atômica no insert). O SheetMirror do bot espelha tudo no Sheets,
+então continua havendo um único escritor da planilha.
+
+Ativado com WORKERS=N (o bot sobe os workers). Também dá para rodar workers avulsos contra a
+mesma fila:
+    python workers.py --workers 4
+    python workers.py --workers 4 --drain    # processa o que houver na fila e mede jobs/s
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from config import WORKERS, JOB_TIMEOUT
+from log_setup import correlation
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5
+
+async def _download(message, download_folder: str) -> Optional[str]:
+    if not message.media:
+        return None
+    os.makedirs(download_folder, exist_ok=True)
+    try:
+        return await message.download_media(file=download_folder)
+    except Exception as e:
+        logger.debug("download_media levantou exceção:", exc_info=e)
+        return None
+
+async def enqueue_message(queue, registry, message, fetch_chat=None, download_folder: str = 'downloads',
+                          album: Optional[list] = None) -> bool:
+    """
+    Baixa a mídia (se houver) e enfileira a mensagem para os workers.
+    album: todas as mensagens do álbum; viram um único job (mídias baixadas em paralelo,
+    caminhos separados por quebra de linha em media_path) com a legenda do álbum.
+    """
+    if album:
+        from pipeline import album_caption
+        messages, message, raw = album_caption(album)
+    else:
+        messages, raw = [message], message.raw_text or ""
+    paths = await asyncio.gather(*[_download(m, download_folder) for m in messages])
+    media_path = "\n".join(p for p in paths if p) or None
+    chat_info = await registry.resolve(message.chat_id, fetch_chat)
+    return await asyncio.to_thread(
+        queue.enqueue, message.chat_id, message.id, raw,
+        message.date.isoformat(), chat_info.title, media_path,
+    )
+
+class Worker:
+    """
+    Um processo de OCR/parse: pipeline próprio (histórico, templates, jogos do dia) sobre o
+    BetStore compartilhado.
+    """
+
+    def __init__(self, name: str):
+        from bet_store import BetStore, JobQueue
+        from analysis_utils import HistoricalAnalyzer
+        from chat_registry import ChatRegistry
+        from caption_templates import CaptionTemplates
+        from teams_cache import FixtureIndex
+        from pipeline import BetPipeline
+
+        self.name = name
+        self.store = BetStore()
+        self.queue = JobQueue(self.store)
+        self.registry = ChatRegistry()
+        import rules
+        templates = CaptionTemplates()
+        templates.load_declared()
+        templates.learn_from_store(self.store)
+        # cada processo recarrega rules.json sozinho; escalas e templates declarados acompanham
+        rules.source().on_change(self.registry.apply_rules)
+        rules.source().on_change(templates.reload_declared)
+        # seen local só para logs; o flag duplicate final é decidido no insert (JobQueue.complete)
+        self.pipeline = BetPipeline(HistoricalAnalyzer(self.store), set(), self.registry,
+                                    persist_seen=False, fixtures=FixtureIndex(), templates=templates)
+        self.processed = 0
+
+    def process(self, job: dict) -> None:
+        with correlation(job["chat_id"], job["msg_id"]):
+            self._process(job)
+
+    def _process(self, job: dict) -> None:
+        from ocr_utils import ocr_image
+
+        paths = [p for p in (job["media_path"] or "").split("\n") if p and os.path.exists(p)]
+        ocr_texts = []
+        if paths:
+            # álbum: tesseract roda em subprocesso, então threads paralelizam o OCR das imagens
+            with self.pipeline.timer.stage("ocr"), ThreadPoolExecutor(max_workers=min(len(paths), 4)) as ex:
+                ocr_texts = list(ex.map(ocr_image, paths))
+        chat_info = self.registry.set_title(job["chat_id"], job["title"])
+        with self.pipeline.timer.stage("parse"):
+            rows = self.pipeline.parse_message(job["raw"], job["chat_id"], datetime.fromisoformat(job["date"]),
+                                               ocr_text=ocr_texts[0] if len(ocr_texts) == 1 else "",
+                                               chat_info=chat_info,
+                                               ocr_texts=ocr_texts if len(ocr_texts) > 1 else None)
+        with self.pipeline.timer.stage("write"):
+            if not self.queue.complete(job["id"], self.name, rows):
+                logger.warning(f"{self.name}: job {job['id']} reenfileirado por timeout; resultado descartado")
+                return
+        self.processed += 1
+
+    def run(self, stop=None, drain: bool = False) -> int:
+        """
+        Loop principal. stop: multiprocessing.Event; drain=True sai quando a fila esvazia.
+        """
+        logger.info(f"{self.name}: iniciado (pid {os.getpid()})")
+        while stop is None or not stop.is_set():
+            job = self.queue.claim(self.name)
+            if job is None:
+                if drain:
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+            try:
+                self.process(job)
+            except Exception as e:
+                logger.error(f"{self.name}: erro no job {job['id']} (msg {job['msg_id']} do grupo {job['chat_id']})",
+                             exc_info=True)
+                self.queue.fail(job["id"], self.name, repr(e))
+        logger.info(f"{self.name}: encerrado após {self.processed} jobs; etapas {self.pipeline.timer.report()}")
+        return self.processed
+
+def run_worker(index: int, stop=None, drain: bool = False, result=None) -> None:
+    """
+    Alvo do multiprocessing.Process.
+    """
+    try:
+        n = Worker(f"w{index}-{os.getpid()}").run(stop, drain)
+    except KeyboardInterrupt:
+        n = 0
+    if result is not None:
+        result.put(n)
+
+def start_workers(n: int = WORKERS, drain: bool = False, result=None) -> Tuple[List[multiprocessing.Process], object]:
+    """
+    Sobe n processos worker (spawn: nada do estado do Telethon/asyncio é herdado).
+    Retorna (processos, evento de parada).
+    """
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    procs = [ctx.Process(target=run_worker, args=(i, stop, drain, result), name=f"worker-{i}", daemon=True)
+             for i in range(n)]
+    for p in procs:
+        p.start()
+    logger.info(f"{n} worker(s) iniciados")
+    return procs, stop
+
+def stop_workers(procs: List[multiprocessing.Process], stop, timeout: float = 10.0) -> None:
+    stop.set()
+    for p in procs:
+        p.join(timeout)
+        if p.is_alive():
+            p.terminate()
+
+async def requeue_loop(queue, interval: float = 60.0, timeout: float = JOB_TIMEOUT) -> None:
+    """
+    Tarefa do bot: devolve à fila jobs de workers que morreram no meio do processamento.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(queue.requeue_stale, timeout)
+        except Exception as e:
+            logger.error("Falha ao reenfileirar jobs parados", exc_info=e)
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Workers de OCR/parse sobre a fila do BetStore")
+    ap.add_argument("--workers", type=int, default=max(WORKERS, 1), help="número de processos")
+    ap.add_argument("--drain", action="store_true", help="sai quando a fila esvaziar e mostra a vazão")
+    args = ap.parse_args(argv)
+
+    from bet_store import BetStore, JobQueue
+    queue = JobQueue(BetStore())
+    queue.requeue_stale(JOB_TIMEOUT)
+    print(f"Fila: {queue.counts()}")
+    ctx = multiprocessing.get_context("spawn")
+    result: Optional[object] = ctx.Queue() if args.drain else None
+    t0 = time.perf_counter()
+    procs, stop = start_workers(args.workers, drain=args.drain, result=result)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        stop_workers(procs, stop)
+    if args.drain:
+        total = sum(result.get() for _ in procs)
+        elapsed = time.perf_counter() - t0
+        print(f"{total} jobs em {elapsed:.1f}s com {args.workers} worker(s): {total / elapsed:.1f} jobs/s")
+    print(f"Fila: {queue.counts()}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())